@@ -3,11 +3,11 @@
 # server/app.py
 
 # Importing necessary libraries
-from flask import g
 from create_app import create_app
 from database.session import ScopedSession
-from datetime import datetime, timezone
+import time
 import os
+from helpers.log_helpers import get_logger
 
 # Import the register_routes function
 from routes.all_routes import register_routes
@@ -22,38 +22,36 @@ register_routes(app)
 # init_socketio(app)
 
 # Global session handling
-def log_with_timing(prev_time, message):
-    current_time = datetime.now(timezone.utc)
-    elapsed = (current_time - prev_time).total_seconds() if prev_time else 0
-    print(f"[{current_time.isoformat()}] {message} (Elapsed: {elapsed:.4f}s)")
-    return current_time
+logger = get_logger("request")
 
-@app.before_request
-def create_session():
-    """ Runs before every request to create a new session. """
-    t = log_with_timing(None, "[GLOBAL BEFORE_REQUEST] Creating session...")
-    g.session = ScopedSession()
-    t = log_with_timing(t, "[GLOBAL BEFORE_REQUEST] Session created and attached to g.")
+def log_with_timing(prev_time, event):
+    """Log a request lifecycle event with the time elapsed since `prev_time` (DEBUG only)."""
+    current_time = time.perf_counter()
+    elapsed = (current_time - prev_time) if prev_time else 0
+    logger.debug(event, elapsed_s=round(elapsed, 4))
+    return current_time
 
 @app.teardown_request
 def remove_session(exception=None):
     """
-    Runs after every request.
+    Runs after every request. Sessions are created on first use (ScopedSession()),
+    so requests that never touched the database have nothing to finish. Otherwise:
     - Rolls back if there's an exception,
     - Otherwise commits,
     - Then removes the session from the registry.
     """
-    t = log_with_timing(None, "[GLOBAL TEARDOWN_REQUEST] Starting teardown...")
-    session = getattr(g, 'session', None)
-    if session:
-        if exception:
-            t = log_with_timing(t, "[GLOBAL TEARDOWN_REQUEST] Exception detected. Rolling back session.")
-            session.rollback()
-        else:
-            t = log_with_timing(t, "[GLOBAL TEARDOWN_REQUEST] Committing session.")
-            session.commit()
-        t = log_with_timing(t, "[GLOBAL TEARDOWN_REQUEST] Removing session from registry.")
-        ScopedSession.remove()
+    if not ScopedSession.registry.has():
+        return
+    t = log_with_timing(None, "teardown_request_started")
+    session = ScopedSession()
+    if exception:
+        t = log_with_timing(t, "teardown_request_rollback")
+        session.rollback()
+    else:
+        t = log_with_timing(t, "teardown_request_commit")
+        session.commit()
+    t = log_with_timing(t, "teardown_request_remove_session")
+    ScopedSession.remove()
 
 if __name__ == '__main__':
     # Replace socketio.run with standard Flask run
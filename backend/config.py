@@ -12,8 +12,202 @@ class Config:
 
     SQLALCHEMY_DATABASE_URI = db_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Database engine (see database/session.py); one pool per worker process
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    # Longest a request waits for a pooled connection before failing
+    DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "5"))
+    # Reconnect before server/load-balancer idle limits close connections under us
+    DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_CONNECT_TIMEOUT_SECONDS = int(os.getenv("DB_CONNECT_TIMEOUT_SECONDS", "5"))
+    # Behind PgBouncer (transaction mode): no client-side pool and no prepared statements
+    DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
     SECRET_KEY = os.getenv("SECRET_KEY")
 
     # CORS settings
     CORS_ORIGINS = os.getenv("CORS_ORIGINS")
     CORS_SUPPORTS_CREDENTIALS = True
+
+    # Logging settings (see helpers/log_helpers.py)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # Per-category sampling for DEBUG/INFO records, e.g. "chat=0.1,rag=0.01"
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+    # Maximum characters kept for any single logged field
+    LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "500"))
+    # Maximum records waiting to be written before new ones are dropped
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    # Outbound client settings (see helpers/clients.py)
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # Optional: proxy or local stub server
+    PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+    # Concurrent requests a single worker serves (1 for sync gunicorn workers)
+    WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+    # A request can have several outbound calls in flight, so pools get headroom per request
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", str(4 * WORKER_CONCURRENCY)))
+    HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", str(HTTP_MAX_CONNECTIONS)))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+    HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+    HTTP_RETRY_BASE_DELAY = float(os.getenv("HTTP_RETRY_BASE_DELAY", "0.5"))
+    HTTP_RETRY_MAX_DELAY = float(os.getenv("HTTP_RETRY_MAX_DELAY", "8"))
+    # A longer Retry-After from the server is ignored in favour of the backoff
+    HTTP_RETRY_AFTER_MAX_SECONDS = float(os.getenv("HTTP_RETRY_AFTER_MAX_SECONDS", "20"))
+
+    # Request deadlines and hedging (see helpers/deadline.py and helpers/hedging.py)
+    # Total time budget of a /api/chat request; kept below the gunicorn timeout
+    CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "60"))
+    # Fire a duplicate LLM/embedding call when the first exceeds the observed p95
+    LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "50"))
+    HEDGE_WINDOW_SIZE = int(os.getenv("HEDGE_WINDOW_SIZE", "500"))
+    HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", str(4 * WORKER_CONCURRENCY)))
+    # At most this fraction of calls is hedged (allowing a burst of HEDGE_MAX_BURST hedges)
+    HEDGE_MAX_FRACTION = float(os.getenv("HEDGE_MAX_FRACTION", "0.05"))
+    HEDGE_MAX_BURST = float(os.getenv("HEDGE_MAX_BURST", "5"))
+
+    # Request coalescing (see helpers/singleflight.py)
+    # Optional directory for sharing in-flight results across workers on the same host
+    SINGLEFLIGHT_DIR = os.getenv("SINGLEFLIGHT_DIR")
+    # How long a result published by another worker may be reused by late joiners
+    SINGLEFLIGHT_RESULT_TTL = float(os.getenv("SINGLEFLIGHT_RESULT_TTL", "2"))
+
+    # Tool-result cache (see helpers/tool_cache.py)
+    TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+    # Tools whose results depend only on their arguments and the corpus
+    TOOL_CACHE_TOOLS = [t.strip() for t in os.getenv("TOOL_CACHE_TOOLS", "cfr_search,m21_search").split(",") if t.strip()]
+    TOOL_CACHE_MEMORY_ENTRIES = int(os.getenv("TOOL_CACHE_MEMORY_ENTRIES", "512"))
+    TOOL_CACHE_TTL_SECONDS = int(os.getenv("TOOL_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    # Empty search results are only kept this long, per worker (0 disables caching them)
+    TOOL_CACHE_EMPTY_TTL_SECONDS = int(os.getenv("TOOL_CACHE_EMPTY_TTL_SECONDS", "60"))
+    # Shared Postgres tier (table tool_result_cache)
+    TOOL_CACHE_DB_ENABLED = os.getenv("TOOL_CACHE_DB_ENABLED", "true").lower() == "true"
+    # Bump to invalidate cached tool results after the corpus/indexes change
+    CORPUS_VERSION = os.getenv("CORPUS_VERSION")
+
+    # Corpus files behind the search tools (see helpers/corpus_store.py)
+    CORPUS_DIR = os.getenv("CORPUS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "json"))
+    # Manifest of embedded chunks kept by the ingestion CLI (scripts/ingest_corpus.py)
+    INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", os.path.join(CORPUS_DIR, "ingest_manifest.json"))
+
+    # Vector search backend for the search tools: "pinecone" or "local" (see helpers/vector_index.py)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+    VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_indexes"))
+    # First-pass storage of local indexes: "int8" (4x smaller), "binary" (32x smaller) or "float32"
+    VECTOR_INDEX_MODE = os.getenv("VECTOR_INDEX_MODE", "int8").lower()
+    # Candidates rescored at full precision per result (unset: per-mode default)
+    VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR")) if os.getenv("VECTOR_RESCORE_FACTOR") else None
+    # Largest recall@10 loss versus exact search accepted by scripts/bench_vector_index.py
+    VECTOR_RECALL_TOLERANCE = float(os.getenv("VECTOR_RECALL_TOLERANCE", "0.02"))
+
+    # Nearest-tag matching for conditions (see services/tagging_service.py)
+    # HNSW candidate list size per query: higher is more accurate and slower (pgvector default 40)
+    TAG_MATCH_EF_SEARCH = int(os.getenv("TAG_MATCH_EF_SEARCH", "100"))
+    TAG_MATCH_TOP_K = int(os.getenv("TAG_MATCH_TOP_K", "3"))
+    # Cosine distance above which a tag is not considered a match (unset: no cut-off)
+    TAG_MATCH_MAX_DISTANCE = float(os.getenv("TAG_MATCH_MAX_DISTANCE")) if os.getenv("TAG_MATCH_MAX_DISTANCE") else None
+    # Conditions matched per SQL statement
+    TAG_MATCH_BATCH_SIZE = int(os.getenv("TAG_MATCH_BATCH_SIZE", "1000"))
+
+    # Background recomputation of stale nexus summaries (see services/nexus_summary_service.py)
+    NEXUS_SUMMARY_MODEL = os.getenv("NEXUS_SUMMARY_MODEL", "gpt-4o-mini-2024-07-18")
+    NEXUS_WORKER_BATCH_SIZE = int(os.getenv("NEXUS_WORKER_BATCH_SIZE", "20"))
+    # Concurrent LLM calls per worker process
+    NEXUS_WORKER_CONCURRENCY = int(os.getenv("NEXUS_WORKER_CONCURRENCY", "4"))
+    NEXUS_WORKER_REQUESTS_PER_MINUTE = int(os.getenv("NEXUS_WORKER_REQUESTS_PER_MINUTE", "60"))
+    NEXUS_WORKER_POLL_SECONDS = float(os.getenv("NEXUS_WORKER_POLL_SECONDS", "10"))
+    # A claimed row is handed to another worker when its lease is older than this (must exceed a batch)
+    NEXUS_WORKER_LEASE_SECONDS = int(os.getenv("NEXUS_WORKER_LEASE_SECONDS", "600"))
+    # Failed rows are retried after an exponential back-off and given up after this many attempts
+    NEXUS_WORKER_MAX_ATTEMPTS = int(os.getenv("NEXUS_WORKER_MAX_ATTEMPTS", "5"))
+    NEXUS_WORKER_RETRY_BASE_SECONDS = float(os.getenv("NEXUS_WORKER_RETRY_BASE_SECONDS", "60"))
+    NEXUS_WORKER_RETRY_MAX_SECONDS = float(os.getenv("NEXUS_WORKER_RETRY_MAX_SECONDS", "3600"))
+
+    # Token-credit metering of /api/chat against Users.credits_remaining (see services/metering_service.py)
+    CREDIT_METERING_ENABLED = os.getenv("CREDIT_METERING_ENABLED", "false").lower() == "true"
+    # Completion allowance reserved per request, on top of the estimated prompt tokens
+    CREDIT_RESERVE_COMPLETION_TOKENS = int(os.getenv("CREDIT_RESERVE_COMPLETION_TOKENS", "1500"))
+    # Tokens of the system prompt and tool definitions not visible in the request body
+    CREDIT_PROMPT_OVERHEAD_TOKENS = int(os.getenv("CREDIT_PROMPT_OVERHEAD_TOKENS", "600"))
+    # Settlements are flushed every interval, or earlier once this many are pending in the process
+    CREDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("CREDIT_FLUSH_INTERVAL_SECONDS", "2"))
+    CREDIT_FLUSH_MAX_PENDING = int(os.getenv("CREDIT_FLUSH_MAX_PENDING", "500"))
+    # Ledger rows applied per flush transaction
+    CREDIT_FLUSH_BATCH_SIZE = int(os.getenv("CREDIT_FLUSH_BATCH_SIZE", "1000"))
+
+    # Admission control for /api/chat (see helpers/admission_control.py)
+    ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+    # "postgres" shares the buckets across workers and replicas; "memory" keeps them per process
+    ADMISSION_STORE = os.getenv("ADMISSION_STORE", "postgres").lower()
+    USER_REQUESTS_PER_MINUTE = int(os.getenv("USER_REQUESTS_PER_MINUTE", "20"))
+    USER_TOKENS_PER_MINUTE = int(os.getenv("USER_TOKENS_PER_MINUTE", "60000"))
+    GLOBAL_REQUESTS_PER_MINUTE = int(os.getenv("GLOBAL_REQUESTS_PER_MINUTE", "300"))
+    # Keep below the OpenAI tokens-per-minute limit of the account
+    GLOBAL_TOKENS_PER_MINUTE = int(os.getenv("GLOBAL_TOKENS_PER_MINUTE", "1000000"))
+    # Per client address, whatever userUUID it sends (several users may share an address)
+    ADDRESS_REQUESTS_PER_MINUTE = int(os.getenv("ADDRESS_REQUESTS_PER_MINUTE", "60"))
+    ADDRESS_TOKENS_PER_MINUTE = int(os.getenv("ADDRESS_TOKENS_PER_MINUTE", "180000"))
+    # Proxies in front of the app that append to X-Forwarded-For; 0 ignores the header
+    ADMISSION_TRUSTED_PROXIES = int(os.getenv("ADMISSION_TRUSTED_PROXIES", "0"))
+    # Rows the global limits are split over in the shared store, so they are not one hot row
+    ADMISSION_GLOBAL_SHARDS = int(os.getenv("ADMISSION_GLOBAL_SHARDS", "8"))
+    # How often each process deletes buckets idle long enough to be full again
+    ADMISSION_EXPIRY_INTERVAL_SECONDS = float(os.getenv("ADMISSION_EXPIRY_INTERVAL_SECONDS", "60"))
+    # Requests that fit within this wait are queued (at most ADMISSION_QUEUE_SIZE per worker); others get 429.
+    # A queued request holds its worker thread: only enable the queue with threaded workers (gunicorn --threads).
+    ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "2"))
+    ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "0"))
+    # Admit requests when the bucket store is unavailable
+    ADMISSION_FAIL_OPEN = os.getenv("ADMISSION_FAIL_OPEN", "true").lower() == "true"
+
+    # Model routing (see helpers/model_router.py). Models are dated ids priced in helpers/token_utils.py
+    MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+    # Chat model for standard requests, tool-heavy turns and escalations
+    CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4.1-mini-2025-04-14")
+    # Cheaper, faster chat model for simple requests
+    CHAT_SIMPLE_MODEL = os.getenv("CHAT_SIMPLE_MODEL", "gpt-4.1-nano-2025-04-14")
+    # A request is simple when it is short, shallow and needs no citations or retrieval
+    ROUTER_SIMPLE_MAX_CHARS = int(os.getenv("ROUTER_SIMPLE_MAX_CHARS", "400"))
+    ROUTER_SIMPLE_MAX_TURNS = int(os.getenv("ROUTER_SIMPLE_MAX_TURNS", "4"))
+    # Query rewrite models for cfr_search/m21_search (short queries use the simple model)
+    REWRITE_MODEL = os.getenv("REWRITE_MODEL", "gpt-4o-2024-08-06")
+    REWRITE_SIMPLE_MODEL = os.getenv("REWRITE_SIMPLE_MODEL", "gpt-4.1-nano-2025-04-14")
+    REWRITE_SIMPLE_MAX_CHARS = int(os.getenv("REWRITE_SIMPLE_MAX_CHARS", "200"))
+
+    # Speculative retrieval (see helpers/speculative_retrieval.py)
+    SPECULATIVE_RETRIEVAL_ENABLED = os.getenv("SPECULATIVE_RETRIEVAL_ENABLED", "true").lower() == "true"
+    SPECULATIVE_MAX_WORKERS = int(os.getenv("SPECULATIVE_MAX_WORKERS", str(2 * WORKER_CONCURRENCY)))
+    # Minimum word overlap between the user message and the model's search query to use the prefetch
+    SPECULATIVE_MIN_SIMILARITY = float(os.getenv("SPECULATIVE_MIN_SIMILARITY", "0.3"))
+    # Do not speculate when less of the request budget than this is left
+    SPECULATIVE_MIN_BUDGET_SECONDS = float(os.getenv("SPECULATIVE_MIN_BUDGET_SECONDS", "10"))
+
+    # CFR citation graph (see helpers/cfr_graph.py)
+    # Tokens of cited-section excerpts attached to cfr_search results (0 disables)
+    CFR_NEIGHBOR_TOKEN_BUDGET = int(os.getenv("CFR_NEIGHBOR_TOKEN_BUDGET", "600"))
+    CFR_NEIGHBOR_EXCERPT_TOKENS = int(os.getenv("CFR_NEIGHBOR_EXCERPT_TOKENS", "200"))
+    CFR_NEIGHBOR_MAX_SECTIONS = int(os.getenv("CFR_NEIGHBOR_MAX_SECTIONS", "3"))
+
+    # Cold-start budget checked by scripts/bench_startup.py (import of app.py, plus warmup with --warmup)
+    STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5"))
+
+    # Health probes (see helpers/health.py): /readyz serves the results of background probes
+    HEALTH_PROBE_INTERVAL_SECONDS = float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "15"))
+    # Per-probe timeout (database statement timeout, vector store request timeout)
+    HEALTH_PROBE_TIMEOUT_SECONDS = float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "3"))
+    # Results older than this count as failed (a stuck prober makes the worker unready)
+    HEALTH_PROBE_MAX_AGE_SECONDS = float(os.getenv("HEALTH_PROBE_MAX_AGE_SECONDS", "60"))
+
+    # Wire format (see helpers/wire_format.py); orjson, msgpack and brotli are used when installed
+    MSGPACK_ENABLED = os.getenv("MSGPACK_ENABLED", "true").lower() == "true"
+    COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    # Smaller responses are sent as is (compression would not pay for itself)
+    COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+    # Moderate levels: most of the size reduction for a fraction of the CPU of the maximum
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
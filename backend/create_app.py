@@ -5,6 +5,9 @@ from flask import Flask
 from flask_cors import CORS
 from config import Config
 from database import db, bcrypt
+from helpers.wire_format import init_wire_format
+from helpers.token_utils import unpriced_models
+from helpers.log_helpers import get_logger
 import os
 
 # create_app function to initialize the Flask application
@@ -15,6 +18,13 @@ def create_app():
     # Apply configuration from Config class
     app.config.from_object(Config)
 
+    # Calls to a model without pricing are counted at cost 0; report the misconfiguration at startup
+    missing = unpriced_models()
+    if missing:
+        get_logger("pricing").error("configured_models_unpriced", models=missing)
+
+    # Fast JSON encoding and MessagePack-aware requests
+    init_wire_format(app)
 
     # Initialize SQLAlchemy and Bcrypt with the app instance
     db.init_app(app)
@@ -2,6 +2,17 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 
+
+class SharedEngineSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy on the process-wide engine of database/session.py (one pool per worker)."""
+
+    def _make_engine(self, bind_key, options, app):
+        if bind_key is None:
+            from database.session import engine
+            return engine
+        return super()._make_engine(bind_key, options, app)
+
+
 # Initialize SQLAlchemy and Bcrypt
-db = SQLAlchemy()
-bcrypt = Bcrypt()
\ No newline at end of file
+db = SharedEngineSQLAlchemy()
+bcrypt = Bcrypt()
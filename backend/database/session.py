@@ -1,8 +1,34 @@
 # /server/database/session.py
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+"""
+Session
+-------
+The single SQLAlchemy engine of a process, shared by ScopedSession and by
+Flask-SQLAlchemy's `db` (database/__init__.py), so each worker has one
+connection pool.
+
+- Pool: a QueuePool of Config.DB_POOL_SIZE connections plus DB_MAX_OVERFLOW
+  temporary ones, recycled after DB_POOL_RECYCLE_SECONDS and handed out LIFO so
+  surplus connections go idle and are closed by the server. A checkout waits at
+  most DB_POOL_TIMEOUT_SECONDS.
+- PgBouncer mode (DB_PGBOUNCER=true): PgBouncer in transaction mode owns the
+  pooling, so the engine keeps no connections (NullPool) and psycopg 3 does not
+  prepare statements (they do not survive a change of server connection).
+- Metrics: the time a checkout waits for a connection (including opening one),
+  checkout timeouts and the connections currently checked out.
+
+Sessions are lazy: ScopedSession() opens nothing until the first query, and
+app.py only commits and removes a request's session if the request created one.
+"""
+
 import os
+import time
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import NullPool, QueuePool
+from config import Config
+from helpers.metrics import DB_POOL_CHECKOUT_WAIT, DB_POOL_TIMEOUTS, DB_POOL_CHECKED_OUT
 
 # Get the raw database URL from the environment
 raw_db_url = os.getenv("DATABASE_URL")
@@ -11,7 +37,55 @@ raw_db_url = os.getenv("DATABASE_URL")
 if raw_db_url and raw_db_url.startswith("postgres://"):
     raw_db_url = raw_db_url.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(raw_db_url, pool_pre_ping=True)
+
+class _TimedCheckout:
+    """Pool mixin that records how long getting a connection from the pool takes."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedNullPool(_TimedCheckout, NullPool):
+    pass
+
+
+def build_engine(url):
+    """Create the engine with the configured pool (or none, behind PgBouncer)."""
+    connect_args = {"connect_timeout": Config.DB_CONNECT_TIMEOUT_SECONDS}
+    if Config.DB_PGBOUNCER:
+        if make_url(url).get_driver_name() == "psycopg":
+            connect_args["prepare_threshold"] = None
+        engine = create_engine(url, poolclass=InstrumentedNullPool, connect_args=connect_args)
+    else:
+        engine = create_engine(
+            url,
+            poolclass=InstrumentedQueuePool,
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=Config.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=Config.DB_POOL_PRE_PING,
+            pool_use_lifo=True,
+            connect_args=connect_args
+        )
+
+    event.listen(engine, "checkout", lambda *args: DB_POOL_CHECKED_OUT.inc())
+    event.listen(engine, "checkin", lambda *args: DB_POOL_CHECKED_OUT.dec())
+    return engine
+
+
+engine = build_engine(raw_db_url)
 
 # Create a configured "Session" class
 SessionFactory = sessionmaker(bind=engine)
@@ -0,0 +1,61 @@
+# server/gunicorn.conf.py
+
+# Gunicorn configuration for the production server.
+# Usage: gunicorn -c gunicorn.conf.py app:app
+
+# Importing necessary libraries
+import os
+import shutil
+
+# Server socket and workers (overridable from the environment)
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Load the app and its read-only state once in the master, then fork the workers,
+# so the corpus, indexes and tables are shared copy-on-write (see helpers/warmup.py)
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Directory where each worker writes its Prometheus samples, so /api/metrics
+# can aggregate across workers. Set before the app (and prometheus_client) is imported.
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+# Create it here, not in on_starting: with preload_app the master imports the app
+# before on_starting runs, and metrics without labels open their files on import.
+# Files left behind by a previous run are cleared on the first load only, not when
+# a SIGHUP re-reads this file while the master's own files are in use.
+if os.environ.get("GUNICORN_METRICS_DIR_OWNER") != str(os.getpid()):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.environ["GUNICORN_METRICS_DIR_OWNER"] = str(os.getpid())
+os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop the live-gauge files of a worker that has exited."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    """With preload_app, build the read-only state and freeze it before the workers are forked."""
+    if preload_app:
+        from helpers.warmup import warmup
+        warmup(freeze=True)
+
+
+def post_fork(server, worker):
+    """Give each worker its own network pools, database connections and health prober."""
+    from helpers.clients import reset_clients
+    from helpers.health import start_probes
+    from database.session import engine
+    reset_clients()
+    # Connections opened in the master must not be shared; close=False leaves them to the master
+    engine.dispose(close=False)
+    start_probes()
+
+
+def post_worker_init(worker):
+    """Without preload_app, warm each worker before it accepts requests."""
+    if not preload_app:
+        from helpers.warmup import warmup
+        warmup(freeze=False)
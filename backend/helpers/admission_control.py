@@ -0,0 +1,368 @@
+# server/helpers/admission_control.py
+
+"""
+Admission Control
+-----------------
+Token-bucket rate limiting in front of expensive routes (/api/chat).
+
+- Buckets: per client address, per user (when the userUUID header holds a
+  UUID) and global, each counting both requests and estimated tokens. A request
+  is admitted only if every bucket can pay for it; the buckets are then debited
+  together. The address is the peer address, or the X-Forwarded-For entry added
+  by the nearest trusted proxy when ADMISSION_TRUSTED_PROXIES is set, so neither
+  a rotated userUUID nor a forged X-Forwarded-For escapes the address limit.
+- Shared store: by default the buckets live in the `rate_limit_buckets` table and
+  are checked and debited in one statement that locks the rows (in key order) and
+  refills them from database time, so limits hold across workers and replicas.
+  The global limits are split over ADMISSION_GLOBAL_SHARDS rows, each with its
+  share of the limit, and a request pays one shard picked at random, so requests
+  do not all queue on the lock of a single row. ADMISSION_STORE=memory keeps the
+  buckets per process (local development).
+- Expiry: a bucket idle long enough to have refilled completely is deleted (it
+  would be recreated full), so keys of past clients do not accumulate.
+- Queueing: a request that would fit within ADMISSION_MAX_WAIT_SECONDS waits for
+  capacity, up to ADMISSION_QUEUE_SIZE waiting requests per worker. A waiting
+  request holds its worker thread, so the queue is only useful with threaded
+  workers (gunicorn --threads) and is off by default. Everything else is shed
+  immediately with 429 and a Retry-After header.
+- If the store is unavailable, requests are admitted (ADMISSION_FAIL_OPEN) and the
+  failure is logged and counted.
+"""
+
+# Import necessary libraries
+import time
+import math
+import uuid
+import random
+import threading
+from functools import wraps
+from flask import jsonify, request
+from sqlalchemy import text
+from config import Config
+from helpers.metrics import ADMISSION_DECISIONS, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT
+from helpers.log_helpers import get_logger
+
+logger = get_logger("admission")
+
+###############################################################################
+# 1. BUCKET STORES
+###############################################################################
+
+class Bucket:
+    """A token bucket refilled at `per_minute`, holding at most `capacity` units."""
+
+    def __init__(self, key, per_minute, cost, capacity=None):
+        self.key = key
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else per_minute)
+        # A request larger than the bucket can never fit; charge it a full bucket instead
+        self.cost = float(min(cost, self.capacity))
+
+    @property
+    def refill_seconds(self):
+        """Seconds after which an idle bucket is full again, whatever its level."""
+        return self.capacity / self.rate
+
+
+def _retry_after(buckets, available):
+    """Seconds until every bucket can pay its cost, given the currently available levels."""
+    waits = [
+        (bucket.cost - available[bucket.key]) / bucket.rate
+        for bucket in buckets
+        if available[bucket.key] < bucket.cost
+    ]
+    return max(waits) if waits else 0.0
+
+
+class MemoryBucketStore:
+    """Per-process buckets; limits are not shared between workers."""
+
+    def __init__(self):
+        self._levels = {}
+        self._lock = threading.Lock()
+        self._last_expiry = time.monotonic()
+
+    def _expire(self, now):
+        """Drop buckets that have been idle long enough to be full again."""
+        self._levels = {
+            key: (level, updated, refill_seconds)
+            for key, (level, updated, refill_seconds) in self._levels.items()
+            if now - updated < refill_seconds
+        }
+        self._last_expiry = now
+
+    def take(self, buckets):
+        """Debit all buckets if all can pay; returns (admitted, retry_after_seconds)."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_expiry >= Config.ADMISSION_EXPIRY_INTERVAL_SECONDS:
+                self._expire(now)
+            available = {}
+            for bucket in buckets:
+                level, updated, _ = self._levels.get(bucket.key, (bucket.capacity, now, None))
+                available[bucket.key] = min(bucket.capacity, level + (now - updated) * bucket.rate)
+            admitted = all(available[bucket.key] >= bucket.cost for bucket in buckets)
+            for bucket in buckets:
+                level = available[bucket.key] - (bucket.cost if admitted else 0)
+                self._levels[bucket.key] = (level, now, bucket.refill_seconds)
+        return admitted, 0.0 if admitted else _retry_after(buckets, available)
+
+
+class PostgresBucketStore:
+    """Buckets in the rate_limit_buckets table, shared by every worker and replica."""
+
+    # Create missing buckets (full) ...
+    _CREATE_SQL = text("""
+        INSERT INTO rate_limit_buckets (bucket_key, level, updated_at)
+        SELECT k, c, clock_timestamp()
+        FROM unnest(CAST(:keys AS text[]), CAST(:capacities AS float8[])) AS n(k, c)
+        ON CONFLICT (bucket_key) DO NOTHING
+    """)
+
+    # ... then refill, check and debit them in one locked statement (in the same transaction)
+    _TAKE_SQL = text("""
+        WITH req AS (
+            SELECT * FROM unnest(
+                CAST(:keys AS text[]),
+                CAST(:capacities AS float8[]),
+                CAST(:rates AS float8[]),
+                CAST(:costs AS float8[])
+            ) AS r(bucket_key, capacity, rate, cost)
+        ),
+        locked AS (
+            SELECT b.bucket_key, r.cost,
+                   LEAST(r.capacity, b.level + GREATEST(0, EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at)) * r.rate) AS available
+            FROM rate_limit_buckets AS b
+            JOIN req AS r ON r.bucket_key = b.bucket_key
+            ORDER BY b.bucket_key
+            FOR UPDATE OF b
+        ),
+        decision AS (
+            SELECT bool_and(available >= cost) AS admitted FROM locked
+        ),
+        debited AS (
+            -- Data-modifying CTEs always run, whether or not the final SELECT reads them
+            UPDATE rate_limit_buckets AS b
+            SET level = l.available - CASE WHEN d.admitted THEN l.cost ELSE 0 END,
+                updated_at = clock_timestamp()
+            FROM locked AS l, decision AS d
+            WHERE b.bucket_key = l.bucket_key
+        )
+        SELECT l.bucket_key, l.available, d.admitted
+        FROM locked AS l, decision AS d
+    """)
+
+    # Buckets idle for longer than their refill time are full; deleting them changes nothing
+    _EXPIRE_SQL = text("""
+        DELETE FROM rate_limit_buckets
+        WHERE bucket_key IN (
+            SELECT bucket_key FROM rate_limit_buckets
+            WHERE updated_at < clock_timestamp() - make_interval(secs => :idle_seconds)
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+    """)
+
+    EXPIRY_BATCH_SIZE = 1000
+
+    def __init__(self):
+        self._expiry_lock = threading.Lock()
+        self._last_expiry = time.monotonic()
+        self._idle_seconds = 0.0
+
+    def _take_once(self, buckets):
+        from database.session import engine
+
+        params = {
+            "keys": [bucket.key for bucket in buckets],
+            "capacities": [bucket.capacity for bucket in buckets],
+            "rates": [bucket.rate for bucket in buckets],
+            "costs": [bucket.cost for bucket in buckets]
+        }
+        # Two statements: psycopg 3 does not run several statements with bound parameters at once
+        with engine.begin() as connection:
+            connection.execute(self._CREATE_SQL, params)
+            return connection.execute(self._TAKE_SQL, params).fetchall()
+
+    def take(self, buckets):
+        """Debit all buckets if all can pay; returns (admitted, retry_after_seconds)."""
+        rows = self._take_once(buckets)
+        if len(rows) < len(buckets):
+            # A bucket was expired between its creation and the locked read; create it again
+            rows = self._take_once(buckets)
+        self._maybe_expire(buckets)
+
+        available = {row.bucket_key: row.available for row in rows}
+        admitted = bool(rows) and rows[0].admitted
+        return admitted, 0.0 if admitted else _retry_after(buckets, available)
+
+    def _maybe_expire(self, buckets):
+        """At most once per ADMISSION_EXPIRY_INTERVAL_SECONDS per process, delete idle buckets."""
+        from database.session import engine
+
+        self._idle_seconds = max([self._idle_seconds] + [bucket.refill_seconds for bucket in buckets])
+        now = time.monotonic()
+        if now - self._last_expiry < Config.ADMISSION_EXPIRY_INTERVAL_SECONDS or not self._expiry_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_expiry = now
+            with engine.begin() as connection:
+                deleted = connection.execute(self._EXPIRE_SQL, {
+                    "idle_seconds": self._idle_seconds,
+                    "batch_size": self.EXPIRY_BATCH_SIZE
+                }).rowcount
+            if deleted:
+                logger.info("rate_limit_buckets_expired", count=deleted)
+        except Exception as e:
+            logger.error("rate_limit_bucket_expiry_failed", error=str(e))
+        finally:
+            self._expiry_lock.release()
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = MemoryBucketStore() if Config.ADMISSION_STORE == "memory" else PostgresBucketStore()
+    return _store
+
+###############################################################################
+# 2. ADMISSION
+###############################################################################
+
+def client_address():
+    """
+    The caller's address. X-Forwarded-For is only trusted behind the configured
+    number of proxies, and then only the entry added by the nearest of them
+    (earlier entries are whatever the client sent).
+    """
+    trusted_proxies = Config.ADMISSION_TRUSTED_PROXIES
+    if trusted_proxies > 0:
+        forwarded_for = [address.strip() for address in request.headers.get("X-Forwarded-For", "").split(",")]
+        forwarded_for = [address for address in forwarded_for if address]
+        if len(forwarded_for) >= trusted_proxies:
+            return forwarded_for[-trusted_proxies]
+    return request.remote_addr
+
+
+def user_identity():
+    """The userUUID header when it holds a UUID, else None."""
+    try:
+        return str(uuid.UUID(request.headers.get("userUUID", "")))
+    except ValueError:
+        return None
+
+
+def _global_shards():
+    # Per-process buckets are not contended; only the shared store is sharded
+    return 1 if Config.ADMISSION_STORE == "memory" else max(1, Config.ADMISSION_GLOBAL_SHARDS)
+
+
+def build_buckets(route, address, user_uuid, estimated_tokens):
+    buckets = [
+        Bucket(f"{route}:ip:{address}:requests", Config.ADDRESS_REQUESTS_PER_MINUTE, 1),
+        Bucket(f"{route}:ip:{address}:tokens", Config.ADDRESS_TOKENS_PER_MINUTE, estimated_tokens),
+    ]
+    if user_uuid:
+        buckets += [
+            Bucket(f"{route}:user:{user_uuid}:requests", Config.USER_REQUESTS_PER_MINUTE, 1),
+            Bucket(f"{route}:user:{user_uuid}:tokens", Config.USER_TOKENS_PER_MINUTE, estimated_tokens),
+        ]
+    shards = _global_shards()
+    shard = random.randrange(shards)
+    return buckets + [
+        Bucket(f"{route}:global:{shard}:requests", Config.GLOBAL_REQUESTS_PER_MINUTE / shards, 1),
+        Bucket(f"{route}:global:{shard}:tokens", Config.GLOBAL_TOKENS_PER_MINUTE / shards, estimated_tokens),
+    ]
+
+
+_queue_lock = threading.Lock()
+_waiting = 0
+
+
+def _try_enqueue():
+    global _waiting
+    with _queue_lock:
+        if _waiting >= Config.ADMISSION_QUEUE_SIZE:
+            return False
+        _waiting += 1
+        return True
+
+
+def _dequeue():
+    global _waiting
+    with _queue_lock:
+        _waiting -= 1
+
+
+def admit(route, buckets):
+    """
+    Return (admitted, retry_after_seconds). Waits in the bounded queue when the
+    buckets will have capacity within ADMISSION_MAX_WAIT_SECONDS.
+    """
+    store = get_store()
+    try:
+        admitted, retry_after = store.take(buckets)
+    except Exception as e:
+        ADMISSION_DECISIONS.labels(route=route, outcome="store_error").inc()
+        logger.error("admission_store_failed", route=route, error=str(e))
+        return Config.ADMISSION_FAIL_OPEN, 1.0
+    if admitted:
+        ADMISSION_DECISIONS.labels(route=route, outcome="admitted").inc()
+        return True, 0.0
+
+    if retry_after > Config.ADMISSION_MAX_WAIT_SECONDS or not _try_enqueue():
+        ADMISSION_DECISIONS.labels(route=route, outcome="rejected").inc()
+        return False, retry_after
+
+    queue_depth = ADMISSION_QUEUE_DEPTH.labels(route=route)
+    queue_depth.inc()
+    start = time.monotonic()
+    try:
+        give_up_at = start + Config.ADMISSION_MAX_WAIT_SECONDS
+        while True:
+            time.sleep(min(retry_after, max(0.0, give_up_at - time.monotonic())) + 0.01)
+            try:
+                admitted, retry_after = store.take(buckets)
+            except Exception as e:
+                logger.error("admission_store_failed", route=route, error=str(e))
+                return Config.ADMISSION_FAIL_OPEN, 1.0
+            if admitted:
+                ADMISSION_DECISIONS.labels(route=route, outcome="queued").inc()
+                ADMISSION_WAIT.labels(route=route).observe(time.monotonic() - start)
+                return True, 0.0
+            if time.monotonic() + retry_after > give_up_at:
+                ADMISSION_DECISIONS.labels(route=route, outcome="rejected").inc()
+                return False, retry_after
+    finally:
+        queue_depth.dec()
+        _dequeue()
+
+
+def rate_limited_response(retry_after):
+    response = jsonify({"error": "Too many requests. Please retry shortly.", "retry_after": math.ceil(retry_after)})
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response, 429
+
+
+def admission_controlled(route, estimate_tokens=None):
+    """
+    Decorator applying admission control to a route. `estimate_tokens(request)`
+    returns the request's estimated LLM tokens (0 when omitted).
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not Config.ADMISSION_CONTROL_ENABLED or request.method == "OPTIONS":
+                return func(*args, **kwargs)
+            estimated_tokens = estimate_tokens(request) if estimate_tokens else 0
+            buckets = build_buckets(route, client_address(), user_identity(), estimated_tokens)
+            admitted, retry_after = admit(route, buckets)
+            if not admitted:
+                logger.info("request_shed", route=route, retry_after=round(retry_after, 2))
+                return rate_limited_response(retry_after)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
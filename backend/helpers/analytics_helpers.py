@@ -1,7 +1,11 @@
-from datetime import datetime
-from models.sql_models import AnalyticsData
+import re
+from datetime import datetime, timedelta, timezone
+from models.sql_models import AnalyticsData, ChatSpan
 from database.session import ScopedSession
-from sqlalchemy import func
+from sqlalchemy import func, text
+from helpers.log_helpers import get_logger
+
+logger = get_logger("analytics")
 
 def get_analytics_summary():
     """Get summary of analytics data."""
@@ -58,7 +62,7 @@ def get_analytics_summary():
             "costByModel": cost_by_model
         }
     except Exception as e:
-        print(f"Error getting analytics summary: {e}")
+        logger.error("get_analytics_summary_failed", error=str(e))
         return {
             "totalCost": 0,
             "totalRequests": 0,
@@ -68,4 +72,219 @@ def get_analytics_summary():
             "averageLatency": 0,
             "requestsByDate": [],
             "costByModel": {}
-        }
\ No newline at end of file
+        }
+
+def get_stage_latency_percentiles(start=None, end=None):
+    """Get per-stage latency percentiles (p50/p95/p99) from the stored chat spans."""
+    query = ScopedSession.query(
+        ChatSpan.name,
+        func.count(ChatSpan.id),
+        func.avg(ChatSpan.duration_ms),
+        func.percentile_cont(0.5).within_group(ChatSpan.duration_ms),
+        func.percentile_cont(0.95).within_group(ChatSpan.duration_ms),
+        func.percentile_cont(0.99).within_group(ChatSpan.duration_ms),
+        func.max(ChatSpan.duration_ms)
+    )
+    if start:
+        query = query.filter(ChatSpan.created_at >= start)
+    if end:
+        query = query.filter(ChatSpan.created_at < end)
+
+    rows = query.group_by(ChatSpan.name).order_by(ChatSpan.name).all()
+    return [{
+        "stage": name,
+        "count": count,
+        "avg_ms": float(avg_ms or 0),
+        "p50_ms": float(p50 or 0),
+        "p95_ms": float(p95 or 0),
+        "p99_ms": float(p99 or 0),
+        "max_ms": float(max_ms or 0)
+    } for name, count, avg_ms, p50, p95, p99, max_ms in rows]
+
+# Time series. Buckets are aligned to a fixed origin (a Monday), so weekly buckets start on Mondays
+TIMESERIES_ORIGIN = datetime(2001, 1, 1)
+TIMESERIES_DEFAULT_BUCKET = "1h"
+TIMESERIES_DEFAULT_RANGE = timedelta(days=1)
+# Longer ranges are downsampled to the next coarser step so a response has at most this many buckets
+TIMESERIES_MAX_BUCKETS = 500
+TIMESERIES_BUCKET_STEPS = [
+    timedelta(minutes=1), timedelta(minutes=5), timedelta(minutes=15), timedelta(hours=1),
+    timedelta(hours=6), timedelta(days=1), timedelta(days=7), timedelta(days=30)
+]
+# At most four digits, so the width always fits a timedelta (9999d is over 27 years)
+_BUCKET_PATTERN = re.compile(r"^(\d{1,4})([mhd])$")
+_BUCKET_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+def parse_bucket(bucket):
+    """Parse a bucket width such as "5m", "1h" or "1d"."""
+    match = _BUCKET_PATTERN.match(bucket or "")
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"bucket must look like 5m, 1h or 1d, not {bucket!r}")
+    return timedelta(**{_BUCKET_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def format_bucket(width):
+    """The shortest "<n><unit>" spelling of a bucket width."""
+    seconds = int(width.total_seconds())
+    for unit, unit_seconds in (("d", 86400), ("h", 3600)):
+        if seconds % unit_seconds == 0:
+            return f"{seconds // unit_seconds}{unit}"
+    return f"{seconds // 60}m"
+
+
+def downsample_bucket(width, start, end, max_buckets=TIMESERIES_MAX_BUCKETS):
+    """The bucket width to use: `width`, or the finest coarser step that keeps the range within max_buckets."""
+    needed = (end - start) / max_buckets
+    if width >= needed:
+        return width
+    for step in TIMESERIES_BUCKET_STEPS:
+        if step >= needed and step > width:
+            return step
+    # Beyond the largest step: whole days
+    return timedelta(days=-(-needed.total_seconds() // 86400))
+
+
+def _bucket_starts(width, start, end):
+    first = TIMESERIES_ORIGIN + ((start - TIMESERIES_ORIGIN) // width) * width
+    while first < end:
+        yield first
+        first += width
+
+
+def _utc_naive(value):
+    """Analytics dates are naive UTC; convert aware datetimes to match."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def get_timeseries(bucket=TIMESERIES_DEFAULT_BUCKET, start=None, end=None, model=None):
+    """
+    Requests, tokens, cost and latency percentiles of the analytics data per time
+    bucket, computed in Postgres (date_bin and percentile_cont). Buckets without
+    requests are included with zero counts, and long ranges are downsampled.
+    """
+    end = _utc_naive(end) or datetime.utcnow()
+    start = _utc_naive(start) or end - TIMESERIES_DEFAULT_RANGE
+    if start >= end:
+        raise ValueError("from must be before to")
+    requested = parse_bucket(bucket)
+    width = downsample_bucket(requested, start, end)
+
+    bucket_start = func.date_bin(width, AnalyticsData.date, TIMESERIES_ORIGIN).label("bucket_start")
+    query = ScopedSession.query(
+        bucket_start,
+        func.count(AnalyticsData.id),
+        func.sum(AnalyticsData.prompt_tokens),
+        func.sum(AnalyticsData.completion_tokens),
+        func.sum(AnalyticsData.total_tokens),
+        func.sum(AnalyticsData.total_cost),
+        func.avg(AnalyticsData.latency_ms),
+        func.percentile_cont(0.5).within_group(AnalyticsData.latency_ms),
+        func.percentile_cont(0.95).within_group(AnalyticsData.latency_ms),
+        func.percentile_cont(0.99).within_group(AnalyticsData.latency_ms)
+    ).filter(AnalyticsData.date >= start, AnalyticsData.date < end)
+    if model:
+        query = query.filter(AnalyticsData.model == model)
+    rows = {row[0]: row for row in query.group_by(bucket_start).order_by(bucket_start).all()}
+
+    points = []
+    for bucket_time in _bucket_starts(width, start, end):
+        row = rows.get(bucket_time)
+        if row is None:
+            points.append({"bucket_start": bucket_time.isoformat(), "requests": 0, "prompt_tokens": 0,
+                           "completion_tokens": 0, "total_tokens": 0, "total_cost": 0.0,
+                           "avg_latency_ms": None, "p50_latency_ms": None, "p95_latency_ms": None,
+                           "p99_latency_ms": None})
+            continue
+        _, count, prompt_tokens, completion_tokens, total_tokens, total_cost, avg_ms, p50, p95, p99 = row
+        points.append({
+            "bucket_start": bucket_time.isoformat(),
+            "requests": count,
+            "prompt_tokens": int(prompt_tokens or 0),
+            "completion_tokens": int(completion_tokens or 0),
+            "total_tokens": int(total_tokens or 0),
+            "total_cost": float(total_cost or 0),
+            "avg_latency_ms": float(avg_ms) if avg_ms is not None else None,
+            "p50_latency_ms": float(p50) if p50 is not None else None,
+            "p95_latency_ms": float(p95) if p95 is not None else None,
+            "p99_latency_ms": float(p99) if p99 is not None else None
+        })
+    return {
+        "bucket": format_bucket(width),
+        "requested_bucket": format_bucket(requested),
+        "downsampled": width != requested,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "model": model,
+        "points": points
+    }
+
+# OpenAI log search. The expressions must stay identical to the indexes of
+# migrations/002_openai_api_logs_jsonb.sql and 004, or Postgres cannot use them.
+# The function is the one called in the logged turn, not in earlier turns of its history.
+LOG_FUNCTION_NAME_SQL = "request_payload -> 'function_call' ->> 'name'"
+LOG_MODEL_SQL = "COALESCE(response_json ->> 'model', request_payload ->> 'model')"
+LOG_FINISH_REASON_SQL = "response_json #>> '{choices,0,finish_reason}'"
+
+LOG_SEARCH_FILTERS = {
+    "function_name": f"{LOG_FUNCTION_NAME_SQL} = :function_name",
+    "model": f"{LOG_MODEL_SQL} = :model",
+    "status": "status = :status",
+    "finish_reason": f"{LOG_FINISH_REASON_SQL} = :finish_reason",
+    "start": "request_sent_at >= :start",
+    "end": "request_sent_at < :end",
+    "cursor": "id < :cursor",
+}
+LOG_SEARCH_DEFAULT_LIMIT = 50
+LOG_SEARCH_MAX_LIMIT = 200
+# Characters of the prompt and error message returned per log
+LOG_PREVIEW_CHARS = 300
+
+def search_openai_logs(function_name=None, model=None, status=None, finish_reason=None,
+                       start=None, end=None, cursor=None, limit=LOG_SEARCH_DEFAULT_LIMIT):
+    """
+    Search the OpenAI API logs in Postgres, newest first, returning only summary
+    fields (not the payloads). Pages by keyset: pass the returned `next_cursor`
+    (the last id) to get the next page.
+    """
+    limit = max(1, min(int(limit), LOG_SEARCH_MAX_LIMIT))
+    params = {
+        "function_name": function_name,
+        "model": model,
+        "status": status,
+        "finish_reason": finish_reason,
+        "start": start,
+        "end": end,
+        "cursor": cursor,
+    }
+    params = {key: value for key, value in params.items() if value is not None}
+    conditions = [LOG_SEARCH_FILTERS[key] for key in params] or ["TRUE"]
+    statement = text(f"""
+        SELECT id, request_sent_at, status,
+               {LOG_MODEL_SQL} AS model,
+               {LOG_FINISH_REASON_SQL} AS finish_reason,
+               {LOG_FUNCTION_NAME_SQL} AS function_name,
+               CAST(response_json #>> '{{usage,total_tokens}}' AS integer) AS total_tokens,
+               request_payload #>> '{{routing,tier}}' AS routing_tier,
+               EXTRACT(EPOCH FROM response_received_at - request_sent_at) * 1000 AS latency_ms,
+               left(request_prompt, :preview_chars) AS request_prompt,
+               left(error_message, :preview_chars) AS error_message
+        FROM openai_api_logs
+        WHERE {" AND ".join(conditions)}
+        ORDER BY id DESC
+        LIMIT :limit
+    """)
+    rows = ScopedSession.execute(
+        statement, {**params, "preview_chars": LOG_PREVIEW_CHARS, "limit": limit + 1}
+    ).mappings().all()
+
+    logs = [{
+        **row,
+        "request_sent_at": row["request_sent_at"].isoformat() if row["request_sent_at"] else None,
+        "latency_ms": float(row["latency_ms"]) if row["latency_ms"] is not None else None
+    } for row in rows[:limit]]
+    return {
+        "logs": logs,
+        "next_cursor": logs[-1]["id"] if len(rows) > limit else None
+    }
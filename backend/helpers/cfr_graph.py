@@ -0,0 +1,165 @@
+# server/helpers/cfr_graph.py
+
+"""
+CFR Citation Graph
+------------------
+Which 38 CFR sections cite which, extracted from the "§ X.Y" / "§§ X.Y and
+X.Z" references in the Part 3 and Part 4 corpus files when the graph is first
+used. Only references to sections present in the corpus are kept.
+
+- search_cfr_documents attaches short excerpts of the sections most cited by
+  its results, within Config.CFR_NEIGHBOR_TOKEN_BUDGET, so the answer can
+  follow a citation (§ 3.310 → § 3.303) without another search round trip.
+- The cfr_related tool lists the sections a section cites and is cited by,
+  with excerpts, straight from the graph (no external calls).
+"""
+
+# Import necessary libraries
+import re
+import threading
+from collections import Counter
+from config import Config
+from helpers import corpus_store
+
+CFR_SOURCES = ("3", "4")
+
+# "§ 3.310", "§§ 3.156(c) and 3.400(q)(2)", "§§ 4.88c or 4.89", "Section 3.307"
+_REFERENCE_PATTERN = re.compile(
+    r"(?:§§?|\bSection)\s*((?:\d+\.\d+[a-z]?\d*(?:\([^)\s]{1,6}\))*(?:\s*(?:,|and|or|through|to)\s*)?)+)"
+)
+_SECTION_NUMBER_PATTERN = re.compile(r"\d+\.\d+[a-z]?\d*")
+_HEADING_PATTERN = re.compile(r"^§\s*\S+\s*")
+
+# Rough characters per token, for the excerpt budget
+CHARS_PER_TOKEN = 4
+
+_graph = None
+_lock = threading.Lock()
+
+###############################################################################
+# 1. GRAPH
+###############################################################################
+
+class CitationGraph:
+    """Directed citation counts between CFR sections."""
+
+    def __init__(self, titles, texts, cites):
+        self.titles = titles
+        self.texts = texts
+        self.cites = cites
+        self.cited_by = {}
+        for section, cited in cites.items():
+            for target, count in cited.items():
+                self.cited_by.setdefault(target, Counter())[section] += count
+
+    def cited(self, section_number, limit=None):
+        """Sections cited by `section_number`, most-cited first."""
+        return [target for target, _ in self.cites.get(section_number, Counter()).most_common(limit)]
+
+    def citing(self, section_number, limit=None):
+        """Sections that cite `section_number`, most citations first."""
+        return [source for source, _ in self.cited_by.get(section_number, Counter()).most_common(limit)]
+
+    def excerpt(self, section_number, max_tokens):
+        """The section's title and the start of its text, within `max_tokens`."""
+        text = _HEADING_PATTERN.sub("", self.texts.get(section_number) or "")
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        if len(text) > max_chars:
+            text = text[:max_chars].rsplit(" ", 1)[0] + " ..."
+        return f"§ {section_number}: {text}"
+
+
+def extract_references(text):
+    """Section numbers referenced in `text`, in order of appearance (with repeats)."""
+    references = []
+    for match in _REFERENCE_PATTERN.finditer(text):
+        references.extend(_SECTION_NUMBER_PATTERN.findall(match.group(1)))
+    return references
+
+
+def build_graph(documents_by_source):
+    """Build the graph from {source: {section number: document}}."""
+    titles, texts = {}, {}
+    for documents in documents_by_source.values():
+        for section_number, document in documents.items():
+            titles[section_number] = document.get("metadata", {}).get("section_title", "")
+            texts[section_number] = document.get("text", "")
+
+    cites = {}
+    for section_number, text in texts.items():
+        cited = Counter(
+            reference for reference in extract_references(text)
+            if reference != section_number and reference in texts
+        )
+        if cited:
+            cites[section_number] = cited
+    return CitationGraph(titles, texts, cites)
+
+
+def get_graph():
+    """The process-wide citation graph, built on first use from the local corpus."""
+    global _graph
+    if _graph is None:
+        with _lock:
+            if _graph is None:
+                _graph = build_graph({source: corpus_store.get_documents(source) for source in CFR_SOURCES})
+    return _graph
+
+
+def reset_graph():
+    """Drop the graph (e.g. after re-ingesting the corpus)."""
+    global _graph
+    with _lock:
+        _graph = None
+
+###############################################################################
+# 2. NEIGHBOR EXCERPTS AND THE cfr_related TOOL
+###############################################################################
+
+def cited_neighbors(section_numbers, limit):
+    """Sections most cited by the given sections, excluding the sections themselves."""
+    graph = get_graph()
+    given = set(section_numbers)
+    counts = Counter()
+    for section_number in section_numbers:
+        for target, count in graph.cites.get(section_number, Counter()).items():
+            if target not in given:
+                counts[target] += count
+    return [target for target, _ in counts.most_common(limit)]
+
+
+def neighbor_excerpts(section_numbers, token_budget=None):
+    """
+    Excerpts of the sections cited by `section_numbers`, most cited first,
+    within `token_budget` tokens in total (Config.CFR_NEIGHBOR_TOKEN_BUDGET by default).
+    """
+    token_budget = Config.CFR_NEIGHBOR_TOKEN_BUDGET if token_budget is None else token_budget
+    if token_budget <= 0:
+        return []
+    graph = get_graph()
+    excerpts = []
+    for target in cited_neighbors(section_numbers, Config.CFR_NEIGHBOR_MAX_SECTIONS):
+        excerpt_tokens = min(Config.CFR_NEIGHBOR_EXCERPT_TOKENS, token_budget)
+        if excerpt_tokens < 20:
+            break
+        excerpt = graph.excerpt(target, excerpt_tokens)
+        excerpts.append(excerpt)
+        token_budget -= len(excerpt) // CHARS_PER_TOKEN + 1
+    return excerpts
+
+
+def cfr_related(section_number: str, limit: int = 5) -> str:
+    """Sections cited by and citing a CFR section, with short excerpts."""
+    graph = get_graph()
+    section_number = section_number.strip().lstrip("§").strip()
+    if section_number not in graph.texts:
+        return f"Section {section_number} is not in the 38 CFR corpus."
+
+    lines = [f"§ {section_number} {graph.titles.get(section_number, '')}".rstrip()]
+    for label, related in (("Cites", graph.cited(section_number, limit)),
+                           ("Cited by", graph.citing(section_number, limit))):
+        lines.append(f"\n{label}:")
+        if not related:
+            lines.append("  (none)")
+        lines.extend(f"  {graph.excerpt(target, Config.CFR_NEIGHBOR_EXCERPT_TOKENS)}" for target in related)
+    return "\n".join(lines)
@@ -0,0 +1,300 @@
+# server/helpers/clients.py
+
+"""
+Clients
+-------
+One place that owns the backend's outbound clients and their connection pools.
+
+- OpenAI: a single client per process backed by a tuned httpx pool (keep-alive,
+  connection limit sized to worker concurrency, HTTP/2 when `h2` is installed)
+  with explicit connect/read/pool timeouts. The SDK does not retry; 429/5xx
+  responses and connection errors are retried by call_with_retries(), like
+  Pinecone queries, so each retry is counted once.
+- Pinecone: one client per process and one cached handle per index. Queries go
+  through query_index(), which applies timeouts and retries 429/5xx/connection
+  errors with full-jitter exponential backoff.
+- Retries: full-jitter exponential backoff, or the server's Retry-After
+  (retry-after-ms) when it sends one and it is not longer than
+  Config.HTTP_RETRY_AFTER_MAX_SECONDS.
+- Deadlines: create_chat_completion(), create_embedding() and query_index() take
+  an optional request Deadline. Each attempt then gets the remaining budget as
+  its timeout and retries stop once the budget cannot cover the wait.
+  OpenAI calls are also hedged when hedging is enabled (helpers/hedging.py).
+
+Clients are created lazily on first use, so importing a module no longer opens
+network pools. reset_clients() drops them (e.g. in a freshly forked worker).
+In-flight requests, pool limits, pool timeouts and retries are exported as metrics.
+"""
+
+# Import necessary libraries
+import time
+import random
+import threading
+import email.utils
+from config import Config
+from helpers.metrics import HTTP_POOL_IN_FLIGHT, HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_TIMEOUTS, HTTP_RETRIES
+from helpers.hedging import hedged_call
+from helpers.deadline import DeadlineExceeded
+from helpers.usage_meter import record_usage
+
+# Status codes worth retrying: rate limits and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+_lock = threading.Lock()
+_openai_client = None
+_pinecone_client = None
+_pinecone_indexes = {}
+
+###############################################################################
+# 1. OPENAI
+###############################################################################
+
+def _http2_available():
+    """HTTP/2 needs the optional `h2` package."""
+    if not Config.HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_openai_client():
+    """Create the OpenAI client on an instrumented, tuned httpx pool."""
+    import httpx
+    from openai import OpenAI, DefaultHttpxClient
+
+    class InstrumentedTransport(httpx.HTTPTransport):
+        """HTTP transport that reports in-flight requests and pool timeouts."""
+
+        def handle_request(self, request):
+            in_flight = HTTP_POOL_IN_FLIGHT.labels(pool="openai")
+            in_flight.inc()
+            try:
+                return super().handle_request(request)
+            except httpx.PoolTimeout:
+                HTTP_POOL_TIMEOUTS.labels(pool="openai").inc()
+                raise
+            finally:
+                in_flight.dec()
+
+    transport = InstrumentedTransport(
+        http2=_http2_available(),
+        limits=httpx.Limits(
+            max_connections=Config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    timeout = httpx.Timeout(
+        Config.HTTP_READ_TIMEOUT,
+        connect=Config.HTTP_CONNECT_TIMEOUT,
+        pool=Config.HTTP_POOL_TIMEOUT
+    )
+    http_client = DefaultHttpxClient(
+        transport=transport,
+        timeout=timeout
+    )
+    HTTP_POOL_MAX_CONNECTIONS.labels(pool="openai").set(Config.HTTP_MAX_CONNECTIONS)
+
+    return OpenAI(
+        api_key=Config.OPENAI_API_KEY,
+        base_url=Config.OPENAI_BASE_URL or None,
+        http_client=http_client,
+        timeout=timeout,
+        # Retried by call_with_retries() (see _openai_call)
+        max_retries=0
+    )
+
+
+def get_openai_client():
+    """Return the process-wide OpenAI client, creating it on first use."""
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                _openai_client = _build_openai_client()
+    return _openai_client
+
+
+def _openai_call(call_type, deadline, make_request, model=None):
+    """Run make_request(client) within the request deadline, hedged when enabled."""
+    def attempt():
+        client = get_openai_client()
+        if deadline is not None:
+            client = client.with_options(timeout=deadline.timeout(call_type))
+        return make_request(client)
+
+    return hedged_call(
+        call_type,
+        lambda: call_with_retries("openai", attempt, deadline=deadline),
+        deadline=deadline,
+        model=model
+    )
+
+
+def create_chat_completion(call_type="chat", deadline=None, **params):
+    """
+    Create a chat completion; `call_type` labels latency tracking and hedging.
+    The usage of every completed attempt, including a hedge that loses, is
+    recorded on the current request's usage meter (for credit metering).
+    """
+    def make_request(client):
+        completion = client.chat.completions.create(**params)
+        record_usage(params.get("model"), getattr(completion, "usage", None))
+        return completion
+
+    return _openai_call(call_type, deadline, make_request, model=params.get("model"))
+
+
+def create_embedding(deadline=None, **params):
+    """Create embeddings within the request deadline."""
+    return _openai_call("embedding", deadline, lambda client: client.embeddings.create(**params),
+                        model=params.get("model"))
+
+###############################################################################
+# 2. PINECONE
+###############################################################################
+
+def get_pinecone_client():
+    """Return the process-wide Pinecone client, creating it on first use."""
+    global _pinecone_client
+    if _pinecone_client is None:
+        with _lock:
+            if _pinecone_client is None:
+                from pinecone import Pinecone
+                _pinecone_client = Pinecone(
+                    api_key=Config.PINECONE_API_KEY,
+                    pool_threads=Config.HTTP_MAX_CONNECTIONS
+                )
+                HTTP_POOL_MAX_CONNECTIONS.labels(pool="pinecone").set(Config.HTTP_MAX_CONNECTIONS)
+    return _pinecone_client
+
+
+def get_pinecone_index(index_name):
+    """Return the cached handle for a Pinecone index."""
+    index = _pinecone_indexes.get(index_name)
+    if index is None:
+        pc = get_pinecone_client()
+        with _lock:
+            index = _pinecone_indexes.get(index_name)
+            if index is None:
+                index = _pinecone_indexes[index_name] = pc.Index(
+                    index_name,
+                    pool_threads=Config.HTTP_MAX_CONNECTIONS
+                )
+    return index
+
+
+def query_index(index_name, deadline=None, **query_kwargs):
+    """
+    Query a Pinecone index with explicit timeouts and retries.
+    With a `deadline`, each attempt's read timeout is capped to the remaining budget.
+    """
+    index = get_pinecone_index(index_name)
+    in_flight = HTTP_POOL_IN_FLIGHT.labels(pool="pinecone")
+
+    def run_query():
+        read_timeout = Config.HTTP_READ_TIMEOUT
+        if deadline is not None:
+            read_timeout = deadline.timeout("vector_query", cap=read_timeout)
+        in_flight.inc()
+        try:
+            return index.query(
+                _request_timeout=(min(Config.HTTP_CONNECT_TIMEOUT, read_timeout), read_timeout),
+                **query_kwargs
+            )
+        finally:
+            in_flight.dec()
+
+    return call_with_retries("pinecone", run_query, deadline=deadline)
+
+###############################################################################
+# 3. RETRIES
+###############################################################################
+
+def _retry_reason(exc):
+    """Return a metric label if `exc` is worth retrying, else None."""
+    status = getattr(exc, "status", None) or getattr(exc, "status_code", None)
+    if status in RETRYABLE_STATUS_CODES:
+        return str(status)
+    if isinstance(exc, DeadlineExceeded):
+        return None
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return type(exc).__name__
+    # urllib3 (used by Pinecone) and the OpenAI SDK raise their own connection/timeout errors
+    if type(exc).__module__.startswith("urllib3"):
+        return type(exc).__name__
+    if type(exc).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return type(exc).__name__
+    return None
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff: uniform in [0, min(max, base * 2**attempt)]."""
+    return random.uniform(0, min(Config.HTTP_RETRY_MAX_DELAY, Config.HTTP_RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def retry_after_seconds(exc):
+    """The wait the server asked for (retry-after-ms or Retry-After, in seconds or as a date), or None."""
+    # OpenAI errors carry the httpx response; Pinecone (urllib3) errors carry the headers
+    headers = getattr(getattr(exc, "response", None), "headers", None) or getattr(exc, "headers", None)
+    if not headers:
+        return None
+    for header, divisor in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) / divisor)
+        except ValueError:
+            if header == "retry-after":
+                try:
+                    return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    return None
+    return None
+
+
+def retry_delay(exc, attempt):
+    """The server's Retry-After when it gives a usable one, else jittered backoff."""
+    retry_after = retry_after_seconds(exc)
+    if retry_after is not None and retry_after <= Config.HTTP_RETRY_AFTER_MAX_SECONDS:
+        return retry_after
+    return backoff_delay(attempt)
+
+
+def call_with_retries(pool, fn, *args, max_retries=None, deadline=None, **kwargs):
+    """
+    Call `fn`, retrying 429/5xx and connection errors after the server's
+    Retry-After or a jittered backoff. With a `deadline`, gives up once the
+    remaining budget cannot cover the wait.
+    """
+    max_retries = Config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            reason = _retry_reason(e)
+            if reason is None or attempt >= max_retries:
+                raise
+            delay = retry_delay(e, attempt)
+            if deadline is not None and deadline.remaining() <= delay:
+                raise
+            HTTP_RETRIES.labels(pool=pool, reason=reason).inc()
+            time.sleep(delay)
+            attempt += 1
+
+###############################################################################
+# 4. LIFECYCLE
+###############################################################################
+
+def reset_clients():
+    """Forget all clients so the next use opens fresh pools (call after fork)."""
+    global _openai_client, _pinecone_client
+    with _lock:
+        _openai_client = None
+        _pinecone_client = None
+        _pinecone_indexes.clear()
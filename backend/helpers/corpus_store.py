@@ -0,0 +1,108 @@
+# server/helpers/corpus_store.py
+
+"""
+Corpus Store
+------------
+The local corpus files behind the search tools (38 CFR Parts 3/4 and the M21
+manuals). Each file is loaded once per process and indexed by section/article
+number, so search results are resolved to their text with a dict lookup instead
+of re-reading and scanning the JSON on every tool call.
+
+The same file list is used by the ingestion CLI (scripts/ingest_corpus.py) to
+build the vector indexes, so the indexes and the text lookup cannot drift apart.
+"""
+
+# Import necessary libraries
+import os
+import json
+import threading
+from config import Config
+from helpers.log_helpers import get_logger
+
+logger = get_logger("corpus")
+
+INDEX_NAME_CFR = "38-cfr-index"
+INDEX_NAME_M21 = "m21-index"
+
+# One entry per corpus file: which index it feeds and how its documents are identified
+CORPUS_FILES = [
+    {"file_name": "part_3_flattened.json", "index_name": INDEX_NAME_CFR, "source": "3", "id_field": "section_number"},
+    {"file_name": "part_4_flattened.json", "index_name": INDEX_NAME_CFR, "source": "4", "id_field": "section_number"},
+    {"file_name": "m21_1_chunked3k.json", "index_name": INDEX_NAME_M21, "source": "M21-1", "id_field": "article_number"},
+    {"file_name": "m21_5_chunked3k.json", "index_name": INDEX_NAME_M21, "source": "M21-5", "id_field": "article_number"},
+]
+
+_lock = threading.Lock()
+_documents = {}
+
+
+def corpus_path(file_name: str) -> str:
+    """Absolute path of a corpus file inside Config.CORPUS_DIR."""
+    return os.path.join(Config.CORPUS_DIR, file_name)
+
+
+def load_corpus_file(file_name: str) -> list:
+    """Return the documents of a corpus file ([] if it is missing or unreadable)."""
+    try:
+        with open(corpus_path(file_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning("corpus_file_missing", file_path=corpus_path(file_name))
+        return []
+    except Exception as e:
+        logger.error("corpus_load_failed", file_path=corpus_path(file_name), error=str(e))
+        return []
+
+
+def _get_documents(source: str) -> dict:
+    """Return {document id: document} for a source ("3", "4", "M21-1", "M21-5")."""
+    documents = _documents.get(source)
+    if documents is None:
+        with _lock:
+            documents = _documents.get(source)
+            if documents is None:
+                documents = {}
+                for entry in CORPUS_FILES:
+                    if entry["source"] != source:
+                        continue
+                    for item in load_corpus_file(entry["file_name"]):
+                        doc_id = item.get("metadata", {}).get(entry["id_field"])
+                        if doc_id:
+                            documents.setdefault(doc_id, item)
+                _documents[source] = documents
+    return documents
+
+
+def get_documents(source: str) -> dict:
+    """All documents of a source, keyed by section/article number."""
+    return _get_documents(source)
+
+
+def get_section_text(section_number: str, part_number: str):
+    """Text of a 38 CFR section, or None if unknown."""
+    document = _get_documents(part_number).get(section_number)
+    return document.get("text") if document else None
+
+
+def get_article_text(article_number: str, manual: str):
+    """Text of an M21 article, or None if unknown."""
+    document = _get_documents(manual).get(article_number)
+    return document.get("text") if document else None
+
+
+def corpus_file_stats() -> list:
+    """(file name, size, mtime) of every corpus file, used to version the corpus."""
+    stats = []
+    for entry in CORPUS_FILES:
+        try:
+            stat = os.stat(corpus_path(entry["file_name"]))
+            stats.append(f"{entry['file_name']}:{stat.st_size}:{int(stat.st_mtime)}")
+        except OSError:
+            stats.append(f"{entry['file_name']}:missing")
+    return stats
+
+
+def clear():
+    """Drop the loaded documents (e.g. after re-ingesting the corpus)."""
+    with _lock:
+        _documents.clear()
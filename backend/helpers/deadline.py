@@ -0,0 +1,47 @@
+# server/helpers/deadline.py
+
+"""
+Deadline
+--------
+A per-request time budget. The /api/chat route creates one Deadline and passes
+it down through process_chat, transform_query and the embedding/vector calls;
+each stage asks for the remaining budget and uses it as its timeout, so a slow
+upstream call can no longer hold a worker until the gunicorn timeout.
+"""
+
+# Import necessary libraries
+import time
+from helpers.metrics import DEADLINE_EXCEEDED
+
+# Below this many seconds there is no point in starting another upstream call
+MIN_STAGE_BUDGET_SECONDS = 0.05
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs out of its time budget."""
+
+
+class Deadline:
+    """Absolute point in time by which a request must finish."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left in the budget (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, stage, cap=None):
+        """
+        Return the timeout to use for `stage`: the remaining budget, optionally capped.
+        Raises DeadlineExceeded when too little budget is left to start the stage.
+        """
+        remaining = self.remaining()
+        if remaining < MIN_STAGE_BUDGET_SECONDS:
+            DEADLINE_EXCEEDED.labels(stage=stage).inc()
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:.0f}s exceeded before {stage}")
+        return remaining if cap is None else min(remaining, cap)
@@ -0,0 +1,170 @@
+# server/helpers/health.py
+
+"""
+Health
+------
+Liveness and readiness for the container healthcheck and the Kubernetes probes.
+
+- /healthz (liveness) answers from the worker itself: no database session, no
+  dependency calls. It fails only when the worker cannot serve requests at all.
+- /readyz (readiness) reports the cached results of background probes of the
+  dependencies a chat request needs: the database (a SELECT 1 through the
+  engine's pool), the vector store (local indexes loaded, or the Pinecone index
+  stats) and the local corpus. Each worker probes on its own thread every
+  Config.HEALTH_PROBE_INTERVAL_SECONDS, so a probe request costs a dict lookup.
+  Results older than Config.HEALTH_PROBE_MAX_AGE_SECONDS count as failed, so a
+  stuck prober makes the worker unready instead of reporting stale success.
+
+The prober thread is started after the fork (gunicorn.conf.py post_fork), or
+by the first /readyz request of a process that was not started by gunicorn.
+Until its first round completes, /readyz reports the worker as not ready.
+"""
+
+# Import necessary libraries
+import os
+import time
+import threading
+from sqlalchemy import text
+from config import Config
+from database.session import engine
+from helpers import corpus_store
+from helpers.metrics import HEALTH_PROBE_UP, HEALTH_PROBE_DURATION
+from helpers.log_helpers import get_logger
+
+logger = get_logger("health")
+
+VECTOR_INDEX_NAMES = (corpus_store.INDEX_NAME_CFR, corpus_store.INDEX_NAME_M21)
+
+###############################################################################
+# 1. PROBES
+###############################################################################
+
+def probe_database():
+    """A SELECT 1 through the pool, bounded by a statement timeout."""
+    timeout_ms = int(Config.HEALTH_PROBE_TIMEOUT_SECONDS * 1000)
+    with engine.connect() as connection:
+        connection.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+        connection.execute(text("SELECT 1"))
+    return {"pool": engine.pool.status()}
+
+
+def probe_vector_store():
+    """The local indexes are loaded, or the Pinecone indexes answer a stats request."""
+    if Config.VECTOR_BACKEND == "local":
+        from helpers.vector_index import get_local_index
+        return {
+            "backend": "local",
+            "vectors": {index_name: len(get_local_index(index_name)) for index_name in VECTOR_INDEX_NAMES}
+        }
+
+    from helpers.clients import get_pinecone_index
+    vectors = {}
+    for index_name in VECTOR_INDEX_NAMES:
+        stats = get_pinecone_index(index_name).describe_index_stats(
+            _request_timeout=Config.HEALTH_PROBE_TIMEOUT_SECONDS
+        )
+        vectors[index_name] = getattr(stats, "total_vector_count", None)
+    return {"backend": "pinecone", "vectors": vectors}
+
+
+def probe_corpus():
+    """
+    Every search tool has documents to resolve its results (loading them on the
+    first round). A missing file of one source is reported, not fatal.
+    """
+    documents = {entry["source"]: len(corpus_store.get_documents(entry["source"])) for entry in corpus_store.CORPUS_FILES}
+    by_index = {}
+    for entry in corpus_store.CORPUS_FILES:
+        by_index[entry["index_name"]] = by_index.get(entry["index_name"], 0) + documents[entry["source"]]
+    empty = [index_name for index_name, count in by_index.items() if not count]
+    if empty:
+        raise RuntimeError(f"No corpus documents loaded for {', '.join(empty)}")
+    return {"documents": documents}
+
+
+PROBES = {
+    "database": probe_database,
+    "vector_store": probe_vector_store,
+    "corpus": probe_corpus,
+}
+
+###############################################################################
+# 2. BACKGROUND PROBER
+###############################################################################
+
+class HealthProber:
+    """Runs the probes on a daemon thread and keeps their latest results."""
+
+    def __init__(self, probes):
+        self.probes = probes
+        self.results = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the probe thread of this process (no-op if it is running; threads do not survive a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.results = {}
+            threading.Thread(target=self._run, name="health-prober", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.run_once()
+            time.sleep(Config.HEALTH_PROBE_INTERVAL_SECONDS)
+
+    def run_once(self):
+        """Run every probe once and record the results."""
+        for name, probe in self.probes.items():
+            start = time.perf_counter()
+            try:
+                result = {"ok": True, **probe()}
+            except Exception as e:
+                result = {"ok": False, "error": str(e)}
+            duration = time.perf_counter() - start
+            HEALTH_PROBE_DURATION.labels(probe=name).observe(duration)
+            HEALTH_PROBE_UP.labels(probe=name).set(1 if result["ok"] else 0)
+
+            previous = self.results.get(name)
+            if previous is None or previous["ok"] != result["ok"]:
+                if result["ok"]:
+                    logger.info("health_probe_ok", probe=name)
+                else:
+                    logger.warning("health_probe_failed", probe=name, error=result["error"])
+            result.update(checked_at=time.time(), duration_ms=round(duration * 1000, 1))
+            self.results[name] = result
+
+    def readiness(self):
+        """Return (ready, {probe: result with its age}) from the cached results."""
+        now = time.time()
+        ready = True
+        report = {}
+        for name in self.probes:
+            result = self.results.get(name)
+            if result is None:
+                result = {"ok": False, "error": "not probed yet"}
+            else:
+                result = {**result, "age_s": round(now - result["checked_at"], 1)}
+                if result["age_s"] > Config.HEALTH_PROBE_MAX_AGE_SECONDS:
+                    result.update(ok=False, error="result is stale")
+            ready = ready and result["ok"]
+            report[name] = result
+        return ready, report
+
+
+_prober = HealthProber(PROBES)
+
+
+def start_probes():
+    """Start the background probes of this process."""
+    _prober.start()
+
+
+def readiness():
+    """Cached readiness of this process: (ready, {probe: result})."""
+    _prober.start()
+    return _prober.readiness()
@@ -0,0 +1,162 @@
+# server/helpers/hedging.py
+
+"""
+Hedging
+-------
+Optional hedged requests for idempotent upstream calls (chat completions,
+query rewrites, embeddings). Latencies are tracked per call type and model over
+a rolling window; when a call takes longer than the observed p95, a duplicate
+is fired and whichever finishes first wins. The loser is left to finish in
+the background (its timeout is bounded by the request deadline).
+
+- Hedges are capped at Config.HEDGE_MAX_FRACTION of calls: every call earns
+  that fraction of a hedge, up to a small burst.
+- A call runs on the calling thread unless a hedge could be fired for it. Only
+  then does it move to the hedge executor, so the caller is free to take the
+  hedge's result. Attempts never queue for the executor: a call that would have
+  to wait for a worker runs on the calling thread unhedged, so the p95 wait
+  starts when the attempt starts and a saturated pool fires no extra hedges.
+
+Disabled unless Config.LLM_HEDGING_ENABLED is set, and inactive for a call type
+and model until Config.HEDGE_MIN_SAMPLES latencies have been observed.
+"""
+
+# Import necessary libraries
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from config import Config
+from helpers.deadline import DeadlineExceeded
+from helpers.metrics import HEDGED_REQUESTS
+
+
+class LatencyTracker:
+    """Rolling window of observed latencies per key ((call type, model))."""
+
+    def __init__(self, window_size):
+        self._window_size = window_size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self._window_size)
+            samples.append(seconds)
+
+    def percentile(self, key, q, min_samples):
+        """Return the q-th percentile (0-1) for `key`, or None with too few samples."""
+        with self._lock:
+            samples = self._samples.get(key)
+            if not samples or len(samples) < min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeBudget:
+    """Allows at most `fraction` hedges per call: each call earns `fraction` of a hedge, up to `burst`."""
+
+    def __init__(self, fraction, burst):
+        self._fraction = fraction
+        self._burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self._burst, self._tokens + self._fraction)
+
+    def available(self):
+        with self._lock:
+            return self._tokens >= 1
+
+    def spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+latency_tracker = LatencyTracker(Config.HEDGE_WINDOW_SIZE)
+hedge_budget = HedgeBudget(Config.HEDGE_MAX_FRACTION, burst=Config.HEDGE_MAX_BURST)
+_executor = ThreadPoolExecutor(max_workers=Config.HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+
+# Attempts running on the executor; kept below HEDGE_MAX_WORKERS so none ever queues
+_active_lock = threading.Lock()
+_active = 0
+
+
+def _timed(key, fn):
+    """Run fn and record its latency when it succeeds."""
+    start = time.perf_counter()
+    result = fn()
+    latency_tracker.observe(key, time.perf_counter() - start)
+    return result
+
+
+def _try_submit(key, fn, headroom=0):
+    """
+    Start fn on the executor if a worker is free, keeping `headroom` more free
+    (for the hedge); returns the future, or None instead of queueing.
+    """
+    global _active
+    with _active_lock:
+        if _active + 1 + headroom > Config.HEDGE_MAX_WORKERS:
+            return None
+        _active += 1
+
+    def run():
+        global _active
+        try:
+            return _timed(key, fn)
+        finally:
+            with _active_lock:
+                _active -= 1
+
+    # Each attempt runs in its own copy of the context (trace, usage meter, etc.)
+    return _executor.submit(contextvars.copy_context().run, run)
+
+
+def hedged_call(call_type, fn, deadline=None, model=None):
+    """
+    Call `fn` (no arguments), hedging it with a duplicate call when it runs past
+    the p95 latency observed for `call_type` on `model`. Returns the first
+    successful result.
+    """
+    key = (call_type, model)
+    hedge_budget.earn()
+    hedge_after = None
+    if Config.LLM_HEDGING_ENABLED and hedge_budget.available():
+        hedge_after = latency_tracker.percentile(key, 0.95, Config.HEDGE_MIN_SAMPLES)
+    primary = _try_submit(key, fn, headroom=1) if hedge_after is not None else None
+    if primary is None:
+        return _timed(key, fn)
+
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    secondary = _try_submit(key, fn) if hedge_budget.spend() else None
+    if secondary is None:
+        pending = {primary}
+    else:
+        HEDGED_REQUESTS.labels(call=call_type, outcome="fired").inc()
+        pending = {primary, secondary}
+    first_error = None
+    while pending:
+        timeout = deadline.remaining() if deadline is not None else None
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f"Request deadline exceeded during hedged {call_type} call")
+        for future in done:
+            if future.exception() is None:
+                if future is secondary:
+                    HEDGED_REQUESTS.labels(call=call_type, outcome="hedge_won").inc()
+                return future.result()
+            first_error = first_error or future.exception()
+    raise first_error
@@ -1,14 +1,10 @@
 # llm_wrappers.py
 
 # Import necessary modules
-import os
-from openai import OpenAI
 from datetime import datetime
+from config import Config
 from database.session import ScopedSession
-
-# Ensure the OpenAI API key is set
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+from helpers.clients import create_embedding
 
 # Function to get embeddings using OpenAI API
 def call_openai_embeddings(
@@ -18,11 +14,11 @@ def call_openai_embeddings(
 ):
     """Get embeddings from OpenAI API."""
     # 1) Get the OpenAI API key from environment variables
-    if not api_key:
+    if not Config.OPENAI_API_KEY:
         raise ValueError("OpenAI API key is not set.")
 
     # 2) Call the OpenAI API to get embeddings
-    response = client.embeddings.create(
+    response = create_embedding(
             input=input_text,
             model=model,
             **kwargs
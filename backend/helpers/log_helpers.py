@@ -0,0 +1,218 @@
+# server/helpers/log_helpers.py
+
+"""
+Log Helpers
+-----------
+Structured, sampled, non-blocking logging for the backend.
+
+    logger = get_logger("chat")
+    logger.debug("request_payload_prepared", payload=request_payload)
+    logger.info("chat_completed", latency_ms=latency_ms)
+
+- Levels: records below Config.LOG_LEVEL are discarded before any formatting.
+- Sampling: DEBUG/INFO records are kept with the probability configured for
+  their category in Config.LOG_SAMPLE_RATES. Warnings and errors are never sampled.
+- Truncation: every field is reduced to at most Config.LOG_MAX_FIELD_CHARS
+  characters with a bounded repr, so large payloads are never fully stringified.
+- Non-blocking: records are put on a bounded in-memory queue and written to
+  stdout as JSON lines by a background thread. When the queue is full, records
+  are dropped rather than blocking the request.
+"""
+
+# Import necessary libraries
+import os
+import sys
+import json
+import queue
+import random
+import reprlib
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from config import Config
+
+# Parent logger of every category logger
+ROOT_LOGGER_NAME = "vsa"
+
+###############################################################################
+# 1. FIELD TRUNCATION
+###############################################################################
+
+_field_repr = reprlib.Repr()
+_field_repr.maxlevel = 3
+_field_repr.maxdict = 10
+_field_repr.maxlist = 10
+_field_repr.maxstring = Config.LOG_MAX_FIELD_CHARS
+_field_repr.maxother = Config.LOG_MAX_FIELD_CHARS
+
+
+def truncate_field(value, max_chars=Config.LOG_MAX_FIELD_CHARS):
+    """Reduce a field to a JSON-safe scalar of bounded size."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        text = value
+    else:
+        # Bounded repr: only the first few items/levels of containers are visited
+        text = _field_repr.repr(value)
+    if len(text) > max_chars:
+        return f"{text[:max_chars]}...[{len(text) - max_chars} more chars]"
+    return text
+
+###############################################################################
+# 2. SAMPLING
+###############################################################################
+
+def _parse_sample_rates(raw):
+    """Parse "category=rate,..." into a dict of floats."""
+    rates = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        category, rate = item.split("=", 1)
+        try:
+            rates[category.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+SAMPLE_RATES = _parse_sample_rates(Config.LOG_SAMPLE_RATES)
+
+###############################################################################
+# 3. QUEUE-BACKED OUTPUT
+###############################################################################
+
+class JSONLineFormatter(logging.Formatter):
+    """Render a record as a single JSON line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "category": getattr(record, "category", record.name),
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks and leaves formatting to the listener thread."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Fields are already truncated; only exceptions need rendering while the frames exist
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+_listener = None
+
+
+def _start_listener(log_queue):
+    """Start the background thread that writes queued records to stdout."""
+    global _listener
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONLineFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+
+
+def _stop_listener():
+    """Flush the remaining records and stop the writer thread."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _configure_root_logger():
+    """Attach the queue handler to the root backend logger (once per process)."""
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(Config.LOG_LEVEL.upper())
+    root.propagate = False
+    handler = _DroppingQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+    root.addHandler(handler)
+    _start_listener(handler.queue)
+    atexit.register(_stop_listener)
+
+    # Threads do not survive fork: give each gunicorn worker its own queue and writer
+    # thread (records still queued at fork time are written by the parent only)
+    def _reinit_in_child():
+        handler.queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+        _start_listener(handler.queue)
+
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_reinit_in_child)
+
+
+_configure_root_logger()
+
+###############################################################################
+# 4. CATEGORY LOGGERS
+###############################################################################
+
+class StructuredLogger:
+    """Logger for one category; fields are passed as keyword arguments."""
+
+    def __init__(self, category):
+        self.category = category
+        self._logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{category}")
+        self._sample_rate = SAMPLE_RATES.get(category, SAMPLE_RATES.get("*", 1.0))
+
+    def _log(self, level, event, fields, exc_info=None):
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING and self._sample_rate < 1.0 and random.random() >= self._sample_rate:
+            return
+        record_fields = {key: truncate_field(value) for key, value in fields.items()}
+        self._logger.log(
+            level,
+            event,
+            exc_info=exc_info,
+            extra={"category": self.category, "fields": record_fields}
+        )
+
+    def is_enabled_for(self, level):
+        """True when records at `level` would be emitted (use to skip building expensive fields)."""
+        return self._logger.isEnabledFor(level)
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        """Log an error together with the traceback of the exception being handled."""
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+_loggers = {}
+
+
+def get_logger(category):
+    """Return the structured logger for `category` (e.g. "chat", "rag", "http")."""
+    logger = _loggers.get(category)
+    if logger is None:
+        logger = _loggers[category] = StructuredLogger(category)
+    return logger
@@ -0,0 +1,223 @@
+# server/helpers/metrics.py
+
+"""
+Metrics
+-------
+In-process Prometheus metrics for the backend. Updates are plain in-memory
+increments, so recording a metric on the hot path is cheap.
+
+When PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it for the
+production server), every worker writes its samples to memory-mapped files in
+that directory, and /api/metrics aggregates the files of all workers. Without
+it (e.g. `flask run`), the default single-process registry is used.
+"""
+
+# Import necessary libraries
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Latency buckets (seconds) sized for LLM round trips rather than the library's web defaults
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+# Finer buckets for local/database work
+FAST_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+###############################################################################
+# METRIC DEFINITIONS
+###############################################################################
+
+CHAT_LATENCY = Histogram(
+    "chat_request_duration_seconds",
+    "End-to-end latency of process_chat.",
+    ["status"],
+    buckets=LLM_LATENCY_BUCKETS
+)
+
+STAGE_LATENCY = Histogram(
+    "chat_stage_duration_seconds",
+    "Latency of each traced stage of a chat request.",
+    ["stage"],
+    buckets=LLM_LATENCY_BUCKETS
+)
+
+TOOL_LATENCY = Histogram(
+    "chat_tool_duration_seconds",
+    "Latency of tool execution, by tool name.",
+    ["tool"],
+    buckets=LLM_LATENCY_BUCKETS
+)
+
+OPENAI_ERRORS = Counter(
+    "openai_errors_total",
+    "OpenAI API errors, by exception type.",
+    ["error_type"]
+)
+
+TOKENS = Counter(
+    "openai_tokens_total",
+    "Tokens consumed by chat completions, by model and kind (prompt/completion).",
+    ["model", "kind"]
+)
+
+DB_WRITE_LATENCY = Histogram(
+    "db_write_duration_seconds",
+    "Latency of database writes on the request path, by operation.",
+    ["operation"],
+    buckets=FAST_LATENCY_BUCKETS
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups, by cache name and result (hit/miss).",
+    ["cache", "result"]
+)
+
+HTTP_POOL_IN_FLIGHT = Gauge(
+    "http_pool_in_flight_requests",
+    "Requests currently using a connection from an outbound pool.",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+HTTP_POOL_MAX_CONNECTIONS = Gauge(
+    "http_pool_max_connections",
+    "Configured connection limit of an outbound pool (summed over live workers).",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+HTTP_POOL_TIMEOUTS = Counter(
+    "http_pool_timeouts_total",
+    "Requests that timed out waiting for a free pooled connection.",
+    ["pool"]
+)
+
+HTTP_RETRIES = Counter(
+    "http_retries_total",
+    "Outbound requests retried after a 429/5xx or connection error, by pool and reason.",
+    ["pool", "reason"]
+)
+
+DEADLINE_EXCEEDED = Counter(
+    "deadline_exceeded_total",
+    "Requests that ran out of their time budget, by the stage they were about to start.",
+    ["stage"]
+)
+
+HEDGED_REQUESTS = Counter(
+    "hedged_requests_total",
+    "Hedged upstream calls, by call type and outcome (fired/hedge_won).",
+    ["call", "outcome"]
+)
+
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total",
+    "Coalesced calls, by group and role (leader ran the call, follower/shared reused its result).",
+    ["group", "role"]
+)
+
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "Admission control outcomes for rate-limited routes (admitted, queued, rejected, store_error).",
+    ["route", "outcome"]
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Requests waiting for rate-limit capacity (summed over live workers).",
+    ["route"],
+    multiprocess_mode="livesum"
+)
+
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds",
+    "Time admitted requests spent waiting in the admission queue.",
+    ["route"],
+    buckets=FAST_LATENCY_BUCKETS
+)
+
+MODEL_ROUTES = Counter(
+    "model_routes_total",
+    "Model routing decisions, by call, routed tier and chosen model (escalations included).",
+    ["call", "tier", "model"]
+)
+
+MODEL_ESCALATIONS = Counter(
+    "model_escalations_total",
+    "Requests escalated from the simple model to the standard one, by reason.",
+    ["reason"]
+)
+
+SPECULATIVE_RETRIEVALS = Counter(
+    "speculative_retrievals_total",
+    "Speculative retrievals, by tool and outcome (started, used, other_tool, dissimilar_query, "
+    "no_tool_call, error, timeout, failed).",
+    ["tool", "outcome"]
+)
+
+SPECULATIVE_WASTED_SECONDS = Counter(
+    "speculative_wasted_seconds_total",
+    "Time spent on speculative retrievals that were discarded.",
+    ["tool"]
+)
+
+HEALTH_PROBE_UP = Gauge(
+    "health_probe_up",
+    "Result of the last background dependency probe (1 ok, 0 failed; minimum over live workers).",
+    ["probe"],
+    multiprocess_mode="livemin"
+)
+
+HEALTH_PROBE_DURATION = Histogram(
+    "health_probe_duration_seconds",
+    "Duration of the background dependency probes behind /readyz.",
+    ["probe"],
+    buckets=FAST_LATENCY_BUCKETS
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time to get a database connection from the pool (waiting for one, or opening a new one).",
+    buckets=FAST_LATENCY_BUCKETS
+)
+
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts_total",
+    "Database connection checkouts that timed out waiting for the pool."
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Database connections currently checked out of the pool (summed over live workers).",
+    multiprocess_mode="livesum"
+)
+
+###############################################################################
+# HELPERS
+###############################################################################
+
+def record_cache_lookup(cache, hit):
+    """Count a cache lookup as a hit or a miss."""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text exposition format.
+    Returns a (body, content_type) tuple.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Aggregate the samples written by every worker process
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
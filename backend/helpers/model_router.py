@@ -0,0 +1,156 @@
+# server/helpers/model_router.py
+
+"""
+Model Router
+------------
+Picks the chat and query-rewrite model per request from cheap local features,
+so simple requests are answered by a cheaper, faster model.
+
+- Classification: message length, citations (38 CFR sections, M21 references,
+  diagnostic codes), conversation depth and whether the question is likely to
+  need retrieval. Only short, shallow requests without citations or retrieval
+  hints are "simple" and go to Config.CHAT_SIMPLE_MODEL; everything else goes
+  to Config.CHAT_MODEL.
+- Escalation: a simple-routed turn moves to the standard model when the simple
+  model calls a tool (the answer has to be written over retrieved regulations),
+  or when its answer looks low-confidence (empty, cut off at the token limit, or
+  hedging).
+- Query rewrites for cfr_search/m21_search use Config.REWRITE_SIMPLE_MODEL for
+  short queries and Config.REWRITE_MODEL otherwise.
+
+The chosen model is stored in AnalyticsData.model, and the decision (tier,
+reasons, escalation) in the request payload and the llm_call spans.
+"""
+
+# Import necessary libraries
+import re
+from config import Config
+from helpers.metrics import MODEL_ROUTES, MODEL_ESCALATIONS
+
+SIMPLE = "simple"
+STANDARD = "standard"
+
+# Section/article references the answer has to be grounded in
+_CITATION_PATTERN = re.compile(
+    r"§|\b38\s*C\.?F\.?R\b|\bM21-\d|\b\d\.\d{2,4}\b|\bDC\s*\d{4}\b|\bdiagnostic code\b",
+    re.IGNORECASE
+)
+
+# Topics the assistant answers from the regulations (through cfr_search/m21_search)
+_RETRIEVAL_PATTERN = re.compile(
+    r"\b(regulations?|cfr|m21|manual|ratings?|rated|eligib\w*|service[- ]connect\w*|presumptive|"
+    r"criteria|evidence|claims?|appeals?|compensation|pension|disabilit\w*|nexus|"
+    r"diagnostic|percent)\b|%",
+    re.IGNORECASE
+)
+
+_HEDGE_PATTERN = re.compile(
+    r"\b(i'?m not sure|i am not sure|i don'?t know|i do not know|i'?m unable to|i am unable to|"
+    r"cannot determine|can'?t determine|not certain)\b",
+    re.IGNORECASE
+)
+
+
+class RouteDecision:
+    """The routed tier and model of one chat request, with the reasons behind it."""
+
+    def __init__(self, tier, model, reasons):
+        self.tier = tier
+        self.model = model
+        self.reasons = reasons
+        self.escalated_to = None
+        self.escalation_reason = None
+
+    @property
+    def final_model(self):
+        return self.escalated_to or self.model
+
+    def escalate(self, reason):
+        """Move the rest of the request to the standard model; returns the model to use."""
+        if self.escalated_to is None and self.model != Config.CHAT_MODEL:
+            self.escalated_to = Config.CHAT_MODEL
+            self.escalation_reason = reason
+            MODEL_ESCALATIONS.labels(reason=reason).inc()
+            MODEL_ROUTES.labels(call="chat", tier="escalated", model=Config.CHAT_MODEL).inc()
+        return self.final_model
+
+    def as_dict(self):
+        return {
+            "tier": self.tier,
+            "model": self.model,
+            "reasons": self.reasons,
+            "escalated_to": self.escalated_to,
+            "escalation_reason": self.escalation_reason
+        }
+
+###############################################################################
+# 1. CHAT ROUTING
+###############################################################################
+
+def conversation_depth(conversation_history):
+    """Number of user and assistant turns in the conversation so far."""
+    return sum(
+        1 for message in conversation_history
+        if isinstance(message, dict) and message.get("role") in ("user", "assistant")
+    )
+
+
+def needs_retrieval(user_message):
+    """Whether the message asks about topics answered from the regulations."""
+    return bool(_RETRIEVAL_PATTERN.search(user_message))
+
+
+def classify_request(user_message, conversation_history):
+    """Return (tier, reasons) for a chat request; reasons lists why it is not simple."""
+    reasons = []
+    if len(user_message) > Config.ROUTER_SIMPLE_MAX_CHARS:
+        reasons.append("long_message")
+    if _CITATION_PATTERN.search(user_message):
+        reasons.append("citation")
+    if conversation_depth(conversation_history) > Config.ROUTER_SIMPLE_MAX_TURNS:
+        reasons.append("deep_conversation")
+    if needs_retrieval(user_message):
+        reasons.append("needs_retrieval")
+    return (STANDARD if reasons else SIMPLE), reasons
+
+
+def route_chat(user_message, conversation_history):
+    """Choose the chat model for a request."""
+    if not Config.MODEL_ROUTING_ENABLED:
+        decision = RouteDecision(STANDARD, Config.CHAT_MODEL, ["routing_disabled"])
+    else:
+        tier, reasons = classify_request(user_message, conversation_history)
+        decision = RouteDecision(tier, Config.CHAT_SIMPLE_MODEL if tier == SIMPLE else Config.CHAT_MODEL, reasons)
+    MODEL_ROUTES.labels(call="chat", tier=decision.tier, model=decision.model).inc()
+    return decision
+
+
+def low_confidence_reason(completion):
+    """Why an answer from the simple model should be retried on the standard model (None if it is fine)."""
+    choice = completion.choices[0]
+    content = (choice.message.content or "").strip()
+    if choice.finish_reason == "length":
+        return "truncated"
+    if not content:
+        return "empty"
+    if _HEDGE_PATTERN.search(content):
+        return "hedging"
+    return None
+
+###############################################################################
+# 2. QUERY REWRITE ROUTING
+###############################################################################
+
+def route_rewrite(user_query):
+    """Choose the query-rewrite model: short queries need little more than a cleanup."""
+    if Config.MODEL_ROUTING_ENABLED and len(user_query) <= Config.REWRITE_SIMPLE_MAX_CHARS:
+        tier, rewrite_model = SIMPLE, Config.REWRITE_SIMPLE_MODEL
+    else:
+        tier, rewrite_model = STANDARD, Config.REWRITE_MODEL
+    MODEL_ROUTES.labels(call="rewrite", tier=tier, model=rewrite_model).inc()
+    return rewrite_model
+
+
+def rewrite_models():
+    """Every model a rewrite may use (part of the tool-result cache version)."""
+    return sorted({Config.REWRITE_MODEL, Config.REWRITE_SIMPLE_MODEL})
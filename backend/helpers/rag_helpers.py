@@ -1,56 +1,81 @@
 # server/helpers/rag_helpers.py
 
 # Import necessary libraries
-import os
-import json
-import decimal
-import requests
-from flask import g
-from database import db
-from openai import OpenAI
-from pinecone import Pinecone
+import hashlib
+from config import Config
+from helpers.trace_helpers import span
+from helpers.log_helpers import get_logger
+from helpers.clients import create_chat_completion, create_embedding, query_index
+from helpers.singleflight import Group, make_key
+from helpers import corpus_store
+from helpers.corpus_store import INDEX_NAME_CFR, INDEX_NAME_M21
+from helpers.model_router import route_rewrite, rewrite_models
+from helpers.cfr_graph import neighbor_excerpts
 
 ###############################################################################
 # 1. ENV & GLOBAL SETUP
 ###############################################################################
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_ENV = "us-east-1"
+# Structured logger for retrieval
+logger = get_logger("rag")
 
-INDEX_NAME_CFR = "38-cfr-index"
-INDEX_NAME_M21 = "m21-index"
+PINECONE_ENV = "us-east-1"
 
 # Embedding model:
 # - The "small" one for Pinecone (1536 dims)
 EMBEDDING_MODEL_SMALL = "text-embedding-3-small"
 
-# Initialize the OpenAI client
-client = OpenAI()
+# Results of a search that matched nothing; also returned when the matches could not be
+# resolved in the corpus, so the tool cache keeps them only briefly (helpers/tool_cache.py)
+NO_CFR_RESULTS = "No sections found (CFR)."
+NO_M21_RESULTS = "No articles found (M21)."
+EMPTY_SEARCH_RESULTS = {NO_CFR_RESULTS, NO_M21_RESULTS}
+
+# The OpenAI client and the Pinecone indexes come from helpers/clients.py (created on first use)
+
+# Identical concurrent rewrites, embeddings and vector queries share one upstream call.
+# Results are JSON-serializable, so they can also be shared across workers.
+rewrite_flight = Group("rewrite", dumps=lambda result: result, loads=lambda data: data)
+embedding_flight = Group("embedding", dumps=lambda result: result, loads=lambda data: data)
+vector_query_flight = Group("vector_query", dumps=lambda result: result, loads=lambda data: data)
 
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-# Initialize the Pinecone indexes
-index_cfr = pc.Index(INDEX_NAME_CFR)
-index_m21 = pc.Index(INDEX_NAME_M21)
+# The corpus JSON files are loaded and indexed once by helpers/corpus_store.py
 
-# Load the JSON files
-PART_3_URL = "./server/json/part_3_flattened.json"
-PART_4_URL = "./server/json/part_4_flattened.json"
-M21_1_URL = "./server/json/m21_1_chunked3k.json"
-M21_5_URL = "./server/json/m21_5_chunked3k.json"
+_corpus_version = None
+
+# Function to identify the corpus/index build that search results come from
+def get_corpus_version() -> str:
+    """
+    Return a short identifier of the corpus behind the search tools. Uses Config.CORPUS_VERSION
+    when set; otherwise a hash of the index names, models and corpus file sizes/mtimes.
+    """
+    global _corpus_version
+    if _corpus_version is None:
+        if Config.CORPUS_VERSION:
+            _corpus_version = Config.CORPUS_VERSION
+        else:
+            parts = [INDEX_NAME_CFR, INDEX_NAME_M21, EMBEDDING_MODEL_SMALL, *rewrite_models()]
+            # cfr_search results include cited-section excerpts sized by these settings
+            parts.append(f"neighbors:{Config.CFR_NEIGHBOR_TOKEN_BUDGET}:{Config.CFR_NEIGHBOR_EXCERPT_TOKENS}:"
+                         f"{Config.CFR_NEIGHBOR_MAX_SECTIONS}")
+            parts.extend(corpus_store.corpus_file_stats())
+            _corpus_version = hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
+    return _corpus_version
 
 ###############################################################################
 # 2. QUERY CLEANUP
 ###############################################################################
 
 # Function to transform the user query
-def transform_query(user_query: str) -> str:
+def transform_query(user_query: str, deadline=None) -> str:
     """
     Uses an OpenAI LLM to rewrite the user query into a formal, structured inquiry that is 
     optimized for semantic search on 38 CFR or the M21 Manual of VA Regulations. The LLM will 
     expand contractions, fix grammatical errors, remove irrelevant sentences, and create a query 
-    suitable for text embeddings.
+    suitable for text embeddings. An optional request `deadline` bounds the call to the
+    remaining time budget. The rewrite model is chosen by helpers/model_router.py.
     """
+    rewrite_model = route_rewrite(user_query)
     system_message = (
         """
         # Identity
@@ -71,33 +96,44 @@ def transform_query(user_query: str) -> str:
         {"role": "user", "content": user_query}
     ]
 
-    # Directly call the OpenAI API
-    completion = client.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        max_completion_tokens=750,
-        temperature=0.0
-    )
-    
-    # Extract the cleaned query from the response
-    cleaned_query = completion.choices[0].message.content
-    return cleaned_query.strip()
+    def rewrite():
+        # Directly call the OpenAI API
+        completion = create_chat_completion(
+            call_type="rewrite",
+            deadline=deadline,
+            model=rewrite_model,
+            messages=messages,
+            max_completion_tokens=750,
+            temperature=0.0
+        )
+
+        # Extract the cleaned query from the response
+        cleaned_query = completion.choices[0].message.content
+        return cleaned_query.strip()
+
+    # Concurrent identical queries share one rewrite
+    return rewrite_flight.do(make_key(rewrite_model, user_query), rewrite, deadline=deadline)
 
 ###############################################################################
 # 3. EMBEDDING FUNCTIONS
 ###############################################################################
 
 # Function to get the embedding for a given text
-def get_embedding_small(model, text: str) -> list:
+def get_embedding_small(model, text: str, deadline=None) -> list:
 
     """
     Fetches the embedding for the given text using a smaller model or large model.
     """
-    response = client.embeddings.create(
-        input=text,
-        model=model
-        )
-    return response.data[0].embedding
+    def embed():
+        response = create_embedding(
+            deadline=deadline,
+            input=text,
+            model=model
+            )
+        return response.data[0].embedding
+
+    # Concurrent identical texts share one embeddings request
+    return embedding_flight.do(make_key(model, text), embed, deadline=deadline)
 
 ###############################################################################
 # 4. MULTITHREADED SECTION RETRIEVAL FOR CFR / M21
@@ -106,43 +142,22 @@ def get_embedding_small(model, text: str) -> list:
 # Function to fetch matched content from Pinecone for 38 CFR
 def fetch_matches_content(search_results) -> list:
     """
-    Fetch section text for all Pinecone matches (38 CFR) from local JSON files.
+    Fetch section text for all Pinecone matches (38 CFR) from the local corpus.
+    Matches on several chunks of the same section are returned once.
     """
     matches = search_results.get("matches", [])
 
-    def get_section_text(section_number: str, part_number: str) -> str:
-        # Determine which local file to load based on the part number
-        if part_number == "3":
-            file_path = PART_3_URL
-        elif part_number == "4":
-            file_path = PART_4_URL
-        else:
-            return None
-        
-        # Open and load JSON data from the local file
-        try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-        except Exception as e:
-            print(f"[ERROR] Unable to open or parse JSON from {file_path}: {e}")
-            return None
-
-        # Search for the matching section_number in the JSON data
-        for item in data:
-            meta = item.get("metadata", {})
-            if meta.get("section_number") == section_number:
-                return item.get("text")
-        return None
-
     matching_texts = []
+    seen = set()
     for match in matches:
         metadata = match.get("metadata", {})
         section_num = metadata.get("section_number")
         part_number = metadata.get("part_number")
-        if not section_num or not part_number:
+        if not section_num or not part_number or (part_number, section_num) in seen:
             continue
+        seen.add((part_number, section_num))
 
-        section_text = get_section_text(section_num, part_number)
+        section_text = corpus_store.get_section_text(section_num, part_number)
         matching_texts.append({
             "section_number": section_num,
             "matching_text": section_text
@@ -153,44 +168,22 @@ def fetch_matches_content(search_results) -> list:
 # Function to fetch matched content from Pinecone for M21
 def fetch_matches_content_m21(search_results) -> list:
     """
-    Fetch article text for all Pinecone matches (M21) from remote JSON files in the server.
+    Fetch article text for all Pinecone matches (M21) from the local corpus.
     Returns a list of dicts with 'article_number' and 'matching_text'.
     """
     matches = search_results.get("matches", [])
 
-    def get_article_text(article_number: str, manual: str) -> str:
-        # Determine which URL to download based on manual
-        if manual == "M21-1":
-            file_path = M21_1_URL
-        elif manual == "M21-5":
-            file_path = M21_5_URL
-        else:
-            return None
-
-        # Open and load JSON data from the local file
-        try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-        except Exception as e:
-            print(f"[ERROR] Unable to open or parse JSON from {file_path}: {e}")
-            return None
-
-        # Search for the matching article_number
-        for item in data:
-            meta = item.get("metadata", {})
-            if meta.get("article_number") == article_number:
-                return item.get("text")
-        return None
-
     matching_texts = []
+    seen = set()
     for match in matches:
         metadata = match.get("metadata", {})
         article_num = metadata.get("article_number")
         manual_val = metadata.get("manual")
-        if not article_num or not manual_val:
+        if not article_num or not manual_val or (manual_val, article_num) in seen:
             continue
+        seen.add((manual_val, article_num))
 
-        article_text = get_article_text(article_num, manual_val)
+        article_text = corpus_store.get_article_text(article_num, manual_val)
         matching_texts.append({
             "article_number": article_num,
             "matching_text": article_text
@@ -202,50 +195,80 @@ def fetch_matches_content_m21(search_results) -> list:
 # 5. PINECONE SEARCH FUNCTIONS (CFR and M21)
 ###############################################################################
 
+# Function to run a (coalesced) vector query against a Pinecone index
+def vector_search(index_name: str, cleaned_query: str, query_emb: list, top_k: int, deadline=None) -> dict:
+    """
+    Query `index_name` with the embedding of `cleaned_query` and return the results as a dict.
+    The embedding is a pure function of the cleaned query, so the query text keys the coalescing.
+    With Config.VECTOR_BACKEND = "local" the query runs in-process against the quantized index.
+    """
+    if Config.VECTOR_BACKEND == "local":
+        from helpers.vector_index import query_local_index
+        return query_local_index(index_name, query_emb, top_k=top_k, include_metadata=True)
+
+    def run_query():
+        results = query_index(
+            index_name,
+            deadline=deadline,
+            vector=query_emb,
+            top_k=top_k,
+            include_metadata=True
+        )
+        return results.to_dict() if hasattr(results, "to_dict") else results
+
+    key = make_key(index_name, top_k, EMBEDDING_MODEL_SMALL, cleaned_query)
+    return vector_query_flight.do(key, run_query, deadline=deadline)
+
 # Function to search for documents in the CFR indexes
-def search_cfr_documents(query: str, top_k: int = 3) -> str:
-    cleaned_query = transform_query(query)
-    query_emb = get_embedding_small(EMBEDDING_MODEL_SMALL,cleaned_query)
-
-    results = index_cfr.query(
-        vector=query_emb,
-        top_k=top_k,
-        include_metadata=True
-    )
+def search_cfr_documents(query: str, top_k: int = 3, deadline=None) -> str:
+    with span("query_rewrite"):
+        cleaned_query = transform_query(query, deadline=deadline)
+    with span("embedding", model=EMBEDDING_MODEL_SMALL):
+        query_emb = get_embedding_small(EMBEDDING_MODEL_SMALL, cleaned_query, deadline=deadline)
 
-    matching_sections = fetch_matches_content(results)
+    with span("vector_query", index=INDEX_NAME_CFR):
+        results = vector_search(INDEX_NAME_CFR, cleaned_query, query_emb, top_k, deadline=deadline)
+
+    with span("corpus_fetch"):
+        matching_sections = fetch_matches_content(results)
     if not matching_sections:
-        return "No sections found (CFR)."
+        return NO_CFR_RESULTS
 
     references_str = ""
     for item in matching_sections:
         sec_num = item["section_number"]
         text_snippet = item["matching_text"] or "N/A"
         references_str += f"\n---\nSection {sec_num}:\n{text_snippet}\n"
-    print(references_str)
+
+    # Excerpts of the sections the results cite, so citations can be followed without another search
+    with span("citation_neighbors"):
+        neighbors = neighbor_excerpts([item["section_number"] for item in matching_sections])
+    if neighbors:
+        references_str += "\n---\nCited sections (excerpts):\n" + "\n\n".join(neighbors) + "\n"
+    logger.debug("cfr_search_results", query=cleaned_query, references=references_str)
 
     return references_str.strip()
 
 # Function to search for documents in the M21 indexes
-def search_m21_documents(query: str, top_k: int = 3) -> str:
-    cleaned_query = transform_query(query)
-    query_emb = get_embedding_small(EMBEDDING_MODEL_SMALL,cleaned_query)
-
-    results = index_m21.query(
-        vector=query_emb,
-        top_k=top_k,
-        include_metadata=True
-    )
-    matching_articles = fetch_matches_content_m21(results)
+def search_m21_documents(query: str, top_k: int = 3, deadline=None) -> str:
+    with span("query_rewrite"):
+        cleaned_query = transform_query(query, deadline=deadline)
+    with span("embedding", model=EMBEDDING_MODEL_SMALL):
+        query_emb = get_embedding_small(EMBEDDING_MODEL_SMALL, cleaned_query, deadline=deadline)
+
+    with span("vector_query", index=INDEX_NAME_M21):
+        results = vector_search(INDEX_NAME_M21, cleaned_query, query_emb, top_k, deadline=deadline)
+    with span("corpus_fetch"):
+        matching_articles = fetch_matches_content_m21(results)
     if not matching_articles:
-        return "No articles found (M21)."
+        return NO_M21_RESULTS
 
     references_str = ""
     for item in matching_articles:
         article_num = item["article_number"]
         text_snippet = item["matching_text"] or "N/A"
         references_str += f"\n---\nArticle {article_num}:\n{text_snippet}\n"
-    print(references_str)
+    logger.debug("m21_search_results", query=cleaned_query, references=references_str)
     return references_str.strip()
 
 def calculator_tool(expression: str) -> str:
@@ -0,0 +1,38 @@
+# server/helpers/rate_limiter.py
+
+"""
+Rate Limiter
+------------
+A thread-safe token bucket that paces work to a per-minute budget within one
+process (e.g. embedding tokens during ingestion, LLM requests in background
+workers). acquire() blocks until the requested amount is available.
+"""
+
+# Import necessary libraries
+import time
+import threading
+
+
+class RateLimiter:
+    """Token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute):
+        self._rate = per_minute / 60.0
+        self._capacity = float(per_minute)
+        self._available = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # A single request larger than the budget waits for a full bucket instead of forever
+        amount = min(amount, self._capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(self._capacity, self._available + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait_seconds = (amount - self._available) / self._rate
+            time.sleep(wait_seconds)
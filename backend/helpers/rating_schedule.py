@@ -0,0 +1,287 @@
+# server/helpers/rating_schedule.py
+
+"""
+Rating Schedule
+---------------
+Structured, in-memory index of the 38 CFR Part 4 rating schedule, parsed from
+part_4_flattened.json: diagnostic code → condition name → rating levels and
+their criteria. The rating_lookup tool answers "what percentage is diagnostic
+code X at severity Y" from it directly, without a query rewrite, an embedding,
+a vector query or whole Part 4 sections in the prompt.
+
+Parsing the flattened section text:
+- A diagnostic code is a four-digit number from 5000 to 9999 followed by a
+  capitalized name; references such as "DC 7800" or "diagnostic codes 6100,
+  6200" are not code entries.
+- A code's name runs to the first ":" or ".", and its criteria are split on the
+  rating percentages (0-100 in steps of ten) that end each level. Tables with
+  major/minor (dominant/non-dominant extremity) columns end a level with two.
+- Codes without levels of their own take the levels of a "General Rating
+  Formula": the one whose heading names their code range (the spine, sinusitis),
+  the one they refer to by name (the skin), or else the next formula after them
+  in the section (mental disorders).
+- "Note" paragraphs are kept with their code.
+
+The index is built once per process, on first use, from the Part 4 documents
+of helpers/corpus_store.py.
+"""
+
+# Import necessary libraries
+import re
+import threading
+from helpers import corpus_store
+
+# A code entry: not preceded by "DC", "code(s)", "§" or another digit, followed by a capitalized name
+_CODE_PATTERN = re.compile(
+    r"(?<![\d.§])(?<!DC )(?<!DC's )(?<!code )(?<!codes )(?<!and )(?<!or )(?<!through )"
+    r"\b([5-9]\d{3})\s+(?=[A-Z\"'(])"
+)
+# A formula heading, optionally followed by the codes it applies to; "under the ..." is a reference
+_FORMULA_PATTERN = re.compile(
+    r"(?<!under the )General Rating Formula [Ff]or ([^:(]+?)\s*(\([^)]*\)|[Ff]or DC'?s? [^:]*)?\s*(?::|Rating\b)"
+)
+_FORMULA_REFERENCE_PATTERN = re.compile(r"General Rating Formula for ([^.,;:(]+)", re.IGNORECASE)
+_CODE_RANGE_PATTERN = re.compile(r"\b(\d{4})(?:\s*(?:–|-|to|through)\s*(\d{4}))?\b")
+# A rating level ends with its percentage (major and minor columns, after an optional footnote
+# digit), followed by the next level, a note or the end of the entry
+_LEVEL_PATTERN = re.compile(
+    r"\s(?:[1-9]\s)?(100|[1-9]0|0)(?:\s(100|[1-9]0|0))?(?:\s[1-9])?(?=\.?\s+[A-Z(\"']|\.?\s*$)"
+)
+_NOTE_PATTERN = re.compile(r"\s(?=Note(?:\s\(\d+\))?:)")
+_TRAILER_PATTERN = re.compile(r"\s*(?:\(Authority:[^)]*\)\s*)?(?:\[[^\]]*\])?\s*$")
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+_index = None
+_lock = threading.Lock()
+
+
+def _words(text):
+    return set(_WORD_PATTERN.findall(text.casefold()))
+
+###############################################################################
+# 1. PARSING
+###############################################################################
+
+def _split_notes(text):
+    """Return (text before the first note, [notes])."""
+    parts = _NOTE_PATTERN.split(text)
+    return parts[0].strip(), [part.strip() for part in parts[1:] if part.strip()]
+
+
+def parse_levels(body):
+    """
+    Split an entry's criteria into [{"percent", "criteria"}] levels, plus any
+    leading text that is not a level (instructions such as "Rate hearing impairment").
+    """
+    levels = []
+    position = 0
+    for match in _LEVEL_PATTERN.finditer(body):
+        level = {"percent": int(match.group(1)), "criteria": body[position:match.start()].strip(" ;,")}
+        if match.group(2) is not None:
+            level["percent_minor"] = int(match.group(2))
+        levels.append(level)
+        position = match.end()
+    remainder = body[position:].strip()
+    return levels, remainder
+
+
+def _parse_entry(code, text, section):
+    text = _TRAILER_PATTERN.sub("", text)
+    text, notes = _split_notes(text)
+    name_end = min((i for i in (text.find(":"), text.find(". ")) if i != -1), default=-1)
+    if name_end == -1:
+        name, body = text.strip(), ""
+    else:
+        name, body = text[:name_end].strip().rstrip("."), text[name_end + 1:].strip()
+    levels, instructions = parse_levels(" " + body) if body else ([], "")
+
+    # A single rating directly after the name ("Tinnitus, recurrent 10")
+    single = re.search(r"\s(100|[1-9]0|0)$", name)
+    if not levels and single:
+        name = name[:single.start()]
+        levels = [{"percent": int(single.group(1)), "criteria": ""}]
+    return {
+        "code": code,
+        "name": name,
+        "section_number": section["section_number"],
+        "section_title": section["section_title"],
+        "levels": levels,
+        "instructions": instructions,
+        "notes": notes,
+        "formula": None
+    }
+
+
+def _parse_formula(formula_match, text):
+    text = _TRAILER_PATTERN.sub("", text)
+    text, notes = _split_notes(text)
+    levels, instructions = parse_levels(" " + text.strip())
+    code_ranges = [
+        (first, last or first)
+        for first, last in _CODE_RANGE_PATTERN.findall(formula_match.group(2) or "")
+    ]
+    return {
+        "name": formula_match.group(1).strip(),
+        "codes": code_ranges or None,
+        "levels": levels,
+        "instructions": instructions,
+        "notes": notes
+    }
+
+
+def parse_section(section):
+    """Parse the diagnostic code entries and rating formulas of one Part 4 section."""
+    text = section["text"]
+    codes = list(_CODE_PATTERN.finditer(text))
+    entries, formulas = [], []
+    pending = []
+    for i, match in enumerate(codes):
+        end = codes[i + 1].start() if i + 1 < len(codes) else len(text)
+        chunk = text[match.end():end]
+        formula_match = _FORMULA_PATTERN.search(chunk)
+        entry = _parse_entry(match.group(1), chunk[:formula_match.start()] if formula_match else chunk, section)
+        entries.append(entry)
+        if not entry["levels"]:
+            pending.append(entry)
+        else:
+            pending = []
+        if formula_match:
+            formula = _parse_formula(formula_match, chunk[formula_match.end():])
+            formulas.append(formula)
+            # Without a code range, the formula rates the codes listed before it
+            if formula["codes"] is None:
+                for waiting in pending:
+                    waiting["formula"] = formula
+            pending = []
+
+    for formula in formulas:
+        if formula["codes"] is not None:
+            for entry in entries:
+                if not entry["levels"] and any(first <= entry["code"] <= last for first, last in formula["codes"]):
+                    entry["formula"] = formula
+    return entries, formulas
+
+
+def _link_formula_references(index, formulas):
+    """Entries that say "Evaluate under the General Rating Formula for X" take formula X."""
+    by_name = {formula["name"].casefold(): formula for formula in formulas}
+    for entry in index.values():
+        if entry["levels"] or entry["formula"]:
+            continue
+        reference = _FORMULA_REFERENCE_PATTERN.search(entry["instructions"])
+        if reference:
+            name = reference.group(1).strip().casefold()
+            entry["formula"] = by_name.get(name) or next(
+                (formula for key, formula in by_name.items() if key.startswith(name) or name.startswith(key)),
+                None
+            )
+
+
+class RatingIndex:
+    """Diagnostic code entries, with an inverted index of the words in their names."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.name_words = {code: _words(entry["name"]) for code, entry in entries.items()}
+        self.by_word = {}
+        for code, words in self.name_words.items():
+            for word in words:
+                self.by_word.setdefault(word, set()).add(code)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def build_rating_index(sections):
+    """Return a RatingIndex of the given Part 4 sections."""
+    index = {}
+    all_formulas = []
+    for item in sections:
+        metadata = item.get("metadata", {})
+        section = {
+            "text": item.get("text", ""),
+            "section_number": metadata.get("section_number", ""),
+            "section_title": metadata.get("section_title", "").rstrip(".")
+        }
+        entries, formulas = parse_section(section)
+        all_formulas.extend(formulas)
+        for entry in entries:
+            # Keep the first (schedule) entry of a code that is mentioned again later
+            existing = index.get(entry["code"])
+            if existing is None or (not existing["levels"] and not existing["formula"] and
+                                    (entry["levels"] or entry["formula"])):
+                index[entry["code"]] = entry
+    _link_formula_references(index, all_formulas)
+    return RatingIndex(index)
+
+
+def get_rating_index():
+    """The process-wide rating index, built on first use from the local corpus."""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = build_rating_index(corpus_store.get_documents("4").values())
+    return _index
+
+###############################################################################
+# 2. LOOKUP
+###############################################################################
+
+def find_entries(diagnostic_code=None, condition=None, limit=5):
+    """Entries for a diagnostic code, or the best name matches for a condition."""
+    index = get_rating_index()
+    if diagnostic_code:
+        code = re.sub(r"\D", "", str(diagnostic_code))
+        return [index.entries[code]] if code in index.entries else []
+    if not condition:
+        return []
+    query = _words(condition)
+    candidates = set().union(*(index.by_word.get(word, set()) for word in query)) if query else set()
+    scored = []
+    for code in candidates:
+        name_words = index.name_words[code]
+        overlap = len(query & name_words)
+        scored.append((overlap / len(query | name_words), overlap, code, index.entries[code]))
+    if not scored:
+        return []
+    # Only the entries sharing the most words with the query
+    best_overlap = max(item[1] for item in scored)
+    scored = sorted((item for item in scored if item[1] == best_overlap), key=lambda item: (-item[0], item[2]))
+    return [entry for _, _, _, entry in scored[:limit]]
+
+
+def _format_levels(levels, percent):
+    if percent is not None:
+        levels = [level for level in levels if level["percent"] == percent] or levels
+    lines = []
+    for level in levels:
+        percent_text = f"{level['percent']}%"
+        if "percent_minor" in level:
+            percent_text += f" (major) / {level['percent_minor']}% (minor)"
+        lines.append(f"  {percent_text}: {level['criteria'] or '(no further criteria)'}")
+    return lines
+
+
+def format_entry(entry, percent=None):
+    lines = [f"DC {entry['code']} {entry['name']} (§ {entry['section_number']} {entry['section_title']})"]
+    if entry["instructions"]:
+        lines.append(f"  {entry['instructions']}")
+    lines.extend(_format_levels(entry["levels"], percent))
+    if not entry["levels"] and entry["formula"]:
+        lines.append(f"  Rated under the General Rating Formula for {entry['formula']['name']}:")
+        lines.extend(_format_levels(entry["formula"]["levels"], percent))
+    lines.extend(f"  {note}" for note in entry["notes"])
+    return "\n".join(lines)
+
+
+def rating_lookup(diagnostic_code=None, condition=None, percent=None):
+    """
+    Rating levels and criteria for a diagnostic code, or for conditions matching
+    a name. With `percent`, only that level is shown (all levels if it does not exist).
+    """
+    entries = find_entries(diagnostic_code=diagnostic_code, condition=condition)
+    if not entries:
+        target = f"diagnostic code {diagnostic_code}" if diagnostic_code else f"'{condition}'"
+        return f"No rating schedule entry found for {target}."
+    return "\n\n".join(format_entry(entry, percent) for entry in entries)
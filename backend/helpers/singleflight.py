@@ -0,0 +1,180 @@
+# server/helpers/singleflight.py
+
+"""
+Singleflight
+------------
+Coalesces identical in-flight calls. While a call for a given key is running,
+concurrent callers with the same key wait for it and share its result (or its
+exception) instead of issuing their own upstream request.
+
+- Within a worker, callers are coordinated with a lock and an Event per key,
+  which works for threads and for monkey-patched greenlets alike.
+- Across workers on the same host (optional, when Config.SINGLEFLIGHT_DIR is
+  set), a per-key file lock elects one leader; its result is published as a
+  JSON file that the other workers read for Config.SINGLEFLIGHT_RESULT_TTL
+  seconds. Only groups given a `dumps`/`loads` pair take part.
+
+This is request coalescing, not caching: results are only shared between calls
+that overlap in time. The token usage recorded while the leader ran is
+recorded again for every caller that shares its result (and published with it
+across workers), so each request is metered as if it had made the call.
+"""
+
+# Import necessary libraries
+import os
+import json
+import time
+import errno
+import random
+import hashlib
+import threading
+from config import Config
+from helpers.deadline import DeadlineExceeded
+from helpers.metrics import SINGLEFLIGHT_CALLS
+from helpers.usage_meter import capture_usage, replay_usage
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; cross-worker coalescing is then disabled
+    fcntl = None
+
+# Interval between attempts to take another worker's key lock
+_LOCK_POLL_SECONDS = 0.01
+
+
+def make_key(*parts):
+    """Build a stable key from JSON-serializable parts."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """A call in flight and the outcome its followers are waiting for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.usage = None
+
+
+class Group:
+    """A namespace of coalesced calls (e.g. "rewrite", "embedding")."""
+
+    def __init__(self, name, dumps=None, loads=None):
+        self.name = name
+        self._dumps = dumps
+        self._loads = loads
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, deadline=None):
+        """Run fn() once for all concurrent callers with the same key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            timeout = deadline.remaining() if deadline is not None else None
+            if not call.done.wait(timeout):
+                raise DeadlineExceeded(f"Request deadline exceeded waiting for coalesced {self.name} call")
+            SINGLEFLIGHT_CALLS.labels(group=self.name, role="follower").inc()
+            if call.error is not None:
+                raise call.error
+            replay_usage(call.usage)
+            return call.result
+
+        try:
+            with capture_usage() as captured:
+                if self._shared_across_workers():
+                    call.result = self._do_across_workers(key, fn, deadline, captured)
+                else:
+                    SINGLEFLIGHT_CALLS.labels(group=self.name, role="leader").inc()
+                    call.result = fn()
+            call.usage = captured.snapshot()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    ###########################################################################
+    # Cross-worker coalescing
+    ###########################################################################
+
+    def _shared_across_workers(self):
+        return bool(Config.SINGLEFLIGHT_DIR) and fcntl is not None and self._dumps is not None
+
+    def _read_published(self, result_path):
+        """Return a result another worker published within the TTL (its usage recorded here too), else None."""
+        try:
+            if time.time() - os.path.getmtime(result_path) > Config.SINGLEFLIGHT_RESULT_TTL:
+                return None
+            with open(result_path, "r") as f:
+                published = json.load(f)
+            result = self._loads(published["result"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        replay_usage(published.get("usage"))
+        return result
+
+    def _do_across_workers(self, key, fn, deadline, captured):
+        os.makedirs(Config.SINGLEFLIGHT_DIR, exist_ok=True)
+        base = os.path.join(Config.SINGLEFLIGHT_DIR, f"{self.name}-{key}")
+        result_path = base + ".json"
+
+        published = self._read_published(result_path)
+        if published is not None:
+            SINGLEFLIGHT_CALLS.labels(group=self.name, role="shared").inc()
+            return published
+
+        with open(base + ".lock", "a") as lock_file:
+            # Poll instead of blocking so greenlet workers keep serving other requests
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except OSError as e:
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                    if deadline is not None and deadline.expired():
+                        raise DeadlineExceeded(f"Request deadline exceeded waiting for coalesced {self.name} call")
+                    time.sleep(_LOCK_POLL_SECONDS)
+            try:
+                # Another worker may have finished the call while we waited for the lock
+                published = self._read_published(result_path)
+                if published is not None:
+                    SINGLEFLIGHT_CALLS.labels(group=self.name, role="shared").inc()
+                    return published
+
+                SINGLEFLIGHT_CALLS.labels(group=self.name, role="leader").inc()
+                result = fn()
+                tmp_path = f"{result_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump({"result": self._dumps(result), "usage": captured.snapshot()}, f)
+                os.replace(tmp_path, result_path)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                if random.random() < 0.01:
+                    _sweep_stale_files()
+
+
+def _sweep_stale_files():
+    """Remove lock/result files that have not been touched for a while."""
+    cutoff = time.time() - max(60.0, 10 * Config.SINGLEFLIGHT_RESULT_TTL)
+    try:
+        with os.scandir(Config.SINGLEFLIGHT_DIR) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        pass
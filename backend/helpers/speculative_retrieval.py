@@ -0,0 +1,156 @@
+# server/helpers/speculative_retrieval.py
+
+"""
+Speculative Retrieval
+---------------------
+Starts the CFR/M21 search for a chat request on a background thread while the
+first completion is still in flight, so a retrieval-needing question no longer
+pays for the query rewrite, the embedding and the vector query after the model
+has asked for them.
+
+- Prediction: the local classifier of helpers/model_router.py decides whether
+  retrieval is likely; M21 wording (manual, procedures, development) selects
+  m21_search, anything else cfr_search. Rating-schedule questions (diagnostic
+  codes, percentages) are left to the local rating_lookup tool and not
+  prefetched. The user message is the query.
+- Use: when the model calls the predicted tool with a query whose words overlap
+  the user message by at least Config.SPECULATIVE_MIN_SIMILARITY, the prefetched
+  result is used (waiting for it if it is still running).
+- Discard: a different tool, a dissimilar query or no tool call at all discards
+  the prefetch. Discarded prefetches are counted, and the time they spent is
+  added to speculative_wasted_seconds_total, so the hit rate and the cost of
+  speculation can be compared.
+"""
+
+# Import necessary libraries
+import re
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from config import Config
+from database.session import ScopedSession
+from helpers.model_router import needs_retrieval
+from helpers.trace_helpers import span
+from helpers.metrics import SPECULATIVE_RETRIEVALS, SPECULATIVE_WASTED_SECONDS
+from helpers.log_helpers import get_logger
+
+logger = get_logger("speculation")
+
+_M21_PATTERN = re.compile(r"\bM21\b|\bmanual\b|\bprocedur\w*|\bdevelop\w*|\badjudicat\w*", re.IGNORECASE)
+_RATING_PATTERN = re.compile(r"\bDC\s*\d{4}\b|\bdiagnostic codes?\b|\b(?:ratings?|rated|percent(?:age)?)\b|%", re.IGNORECASE)
+_WORD_PATTERN = re.compile(r"[a-z0-9§.]+")
+
+# Words that do not change what a search retrieves
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it me my of on or "
+    "should the to what when where which who why will with you your".split()
+)
+
+_executor = ThreadPoolExecutor(max_workers=Config.SPECULATIVE_MAX_WORKERS, thread_name_prefix="speculative")
+
+
+def predict_tool(user_message):
+    """The search tool the model is likely to call for this message, or None."""
+    if not needs_retrieval(user_message) or _RATING_PATTERN.search(user_message):
+        return None
+    return "m21_search" if _M21_PATTERN.search(user_message) else "cfr_search"
+
+
+def _content_words(text):
+    return {word.strip(".") for word in _WORD_PATTERN.findall(text.casefold())} - _STOPWORDS - {""}
+
+
+def query_similarity(first, second):
+    """Overlap of the content words of two queries (Jaccard, 0-1)."""
+    first_words, second_words = _content_words(first), _content_words(second)
+    if not first_words or not second_words:
+        return 0.0
+    return len(first_words & second_words) / len(first_words | second_words)
+
+
+class Speculation:
+    """One prefetched tool call; used at most once, otherwise discarded."""
+
+    def __init__(self, tool_name, query, future):
+        self.tool_name = tool_name
+        self.query = query
+        self.future = future
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.settled = False
+
+    def take(self, function_name, function_args, deadline=None):
+        """
+        Return the prefetched (result, source) when the model's call matches the
+        prediction, else None (and the prefetch is discarded).
+        """
+        if self.settled:
+            return None
+        query = (function_args or {}).get("query", "")
+        if function_name != self.tool_name:
+            self.discard("other_tool")
+            return None
+        similarity = query_similarity(self.query, query)
+        if similarity < Config.SPECULATIVE_MIN_SIMILARITY:
+            self.discard("dissimilar_query", similarity=round(similarity, 2))
+            return None
+
+        self.settled = True
+        try:
+            result = self.future.result(timeout=deadline.remaining() if deadline else None)
+        except FutureTimeout:
+            SPECULATIVE_RETRIEVALS.labels(tool=self.tool_name, outcome="timeout").inc()
+            return None
+        except Exception as e:
+            SPECULATIVE_RETRIEVALS.labels(tool=self.tool_name, outcome="failed").inc()
+            logger.warning("speculative_retrieval_failed", tool=self.tool_name, error=str(e))
+            return None
+        SPECULATIVE_RETRIEVALS.labels(tool=self.tool_name, outcome="used").inc()
+        logger.debug("speculative_retrieval_used", tool=self.tool_name, similarity=round(similarity, 2))
+        return result
+
+    def discard(self, reason, **fields):
+        """Give up on the prefetch and account for the work it did (no-op once taken or discarded)."""
+        if self.settled:
+            return
+        self.settled = True
+        SPECULATIVE_RETRIEVALS.labels(tool=self.tool_name, outcome=reason).inc()
+        logger.debug("speculative_retrieval_discarded", tool=self.tool_name, reason=reason, **fields)
+        if self.future.cancel():
+            return
+        # Count the time spent once the background work has finished
+        self.future.add_done_callback(lambda _: SPECULATIVE_WASTED_SECONDS.labels(tool=self.tool_name).inc(
+            (self.finished_at or time.perf_counter()) - self.started_at
+        ))
+
+
+def start_speculative_retrieval(user_message, compute, deadline=None):
+    """
+    Start `compute(tool_name, arguments)` in the background for the predicted
+    search tool. Returns a Speculation, or None when retrieval is unlikely,
+    speculation is disabled or too little of the request budget is left.
+    """
+    if not Config.SPECULATIVE_RETRIEVAL_ENABLED:
+        return None
+    tool_name = predict_tool(user_message)
+    if tool_name is None:
+        return None
+    if deadline is not None and deadline.remaining() < Config.SPECULATIVE_MIN_BUDGET_SECONDS:
+        return None
+
+    arguments = {"query": user_message}
+    speculation = Speculation(tool_name, user_message, None)
+
+    def run():
+        try:
+            with span("speculative_retrieval", tool=tool_name):
+                return compute(tool_name, arguments)
+        finally:
+            speculation.finished_at = time.perf_counter()
+            # Worker threads must not keep a session (and its connection) between jobs
+            ScopedSession.remove()
+
+    # The background work runs in a copy of the request context (trace, usage meter)
+    speculation.future = _executor.submit(contextvars.copy_context().run, run)
+    SPECULATIVE_RETRIEVALS.labels(tool=tool_name, outcome="started").inc()
+    return speculation
@@ -2,7 +2,7 @@
 
 import json
 from sqlalchemy import or_
-from flask import g
+from database.session import ScopedSession
 from models.sql_models import MyTable
 
 def myFunction():
@@ -12,8 +12,8 @@ def myFunction():
     Returns:
         list: A list of filtered results from the table.
     """
-    # Use the session attached to Flask's global context.
-    session = g.session
+    # Use the request's session (created on first use, finished in app.py's teardown).
+    session = ScopedSession()
 
     # Start with a base query.
     query = session.query(MyTable)
@@ -1,5 +1,53 @@
 # server/helpers/token_utils.py
 
+# Import necessary libraries
+from config import Config
+from helpers.log_helpers import get_logger
+
+logger = get_logger("pricing")
+
+# Pricing rates per 1 million tokens for each model (built once at import, shared by forked workers)
+MODEL_PRICING = {
+    # GPT-4.5 Preview
+    "gpt-4.5-preview-2025-02-27": {"input": 75.00, "cached": 37.50, "output": 150.00},
+
+    # GPT-4o Series
+    "gpt-4o-2024-08-06": {"input": 2.50, "cached": 1.25, "output": 10.00},
+    "gpt-4o-2024-11-20": {"input": 2.50, "cached": 1.25, "output": 10.00},
+    "gpt-4o-2024-05-13": {"input": 5.00, "cached": None, "output": 15.00},
+    "gpt-4o-audio-preview-2024-12-17": {"input": 2.50, "cached": None, "output": 10.00},
+    "gpt-4o-audio-preview-2024-10-01": {"input": 2.50, "cached": None, "output": 10.00},
+    "gpt-4o-realtime-preview-2024-12-17": {"input": 5.00, "cached": 2.50, "output": 20.00},
+    "gpt-4o-realtime-preview-2024-10-01": {"input": 5.00, "cached": 2.50, "output": 20.00},
+    "gpt-4o-mini-2024-07-18": {"input": 0.15, "cached": 0.075, "output": 0.60},
+    "gpt-4o-mini-audio-preview-2024-12-17": {"input": 0.15, "cached": None, "output": 0.60},
+    "gpt-4o-mini-realtime-preview-2024-12-17": {"input": 0.60, "cached": 0.30, "output": 2.40},
+    "gpt-4o-mini-search-preview-2025-03-11": {"input": 0.15, "cached": None, "output": 0.60},
+    "gpt-4o-search-preview-2025-03-11": {"input": 2.50, "cached": None, "output": 10.00},
+
+    # o-Series Models
+    "o1-2024-12-17": {"input": 15.00, "cached": 7.50, "output": 60.00},
+    "o1-preview-2024-09-12": {"input": 15.00, "cached": 7.50, "output": 60.00},
+    "o1-pro-2025-03-19": {"input": 150.00, "cached": None, "output": 600.00},
+    "o1-mini-2024-09-12": {"input": 1.10, "cached": 0.55, "output": 4.40},
+    "o3-mini-2025-01-31": {"input": 1.10, "cached": 0.55, "output": 4.40},
+
+    # GPT-4.1 Series
+    "gpt-4.1-2025-04-14": {"input": 2.00, "cached": 0.50, "output": 8.00},
+    "gpt-4.1-mini-2025-04-14": {"input": 0.40, "cached": 0.10, "output": 1.60},
+    "gpt-4.1-nano-2025-04-14": {"input": 0.10, "cached": 0.025, "output": 0.40},
+
+    # Computer Use Preview
+    "computer-use-preview-2025-03-11": {"input": 3.00, "cached": None, "output": 12.00},
+
+    # Fine-Tuned Models
+    "ft:gpt-4.1-mini-2025-04-14:personal:a001:BMR8CaY3": {"input": 0.80, "cached": 0.20, "output": 3.20},
+
+    # GPT-3.5 Turbo
+    "gpt-3.5-turbo-0125": {"input": 0.50, "cached": None, "output": 1.50}
+}
+
+
 def calculate_token_cost(prompt_tokens, completion_tokens, model="o1-2024-12-17", cached_prompt_tokens=0):
     """
     Calculate the cost of tokens for a given model using its pricing per 1 million tokens.
@@ -26,49 +74,9 @@ def calculate_token_cost(prompt_tokens, completion_tokens, model="o1-2024-12-17"
       ValueError: if the provided model is not supported.
     """
     
-    # Define pricing rates per 1 million tokens for each model.
-    pricing = {
-        # GPT-4.5 Preview
-        "gpt-4.5-preview-2025-02-27": {"input": 75.00, "cached": 37.50, "output": 150.00},
-
-        # GPT-4o Series
-        "gpt-4o-2024-08-06": {"input": 2.50, "cached": 1.25, "output": 10.00},
-        "gpt-4o-2024-11-20": {"input": 2.50, "cached": 1.25, "output": 10.00},
-        "gpt-4o-2024-05-13": {"input": 5.00, "cached": None, "output": 15.00},
-        "gpt-4o-audio-preview-2024-12-17": {"input": 2.50, "cached": None, "output": 10.00},
-        "gpt-4o-audio-preview-2024-10-01": {"input": 2.50, "cached": None, "output": 10.00},
-        "gpt-4o-realtime-preview-2024-12-17": {"input": 5.00, "cached": 2.50, "output": 20.00},
-        "gpt-4o-realtime-preview-2024-10-01": {"input": 5.00, "cached": 2.50, "output": 20.00},
-        "gpt-4o-mini-2024-07-18": {"input": 0.15, "cached": 0.075, "output": 0.60},
-        "gpt-4o-mini-audio-preview-2024-12-17": {"input": 0.15, "cached": None, "output": 0.60},
-        "gpt-4o-mini-realtime-preview-2024-12-17": {"input": 0.60, "cached": 0.30, "output": 2.40},
-        "gpt-4o-mini-search-preview-2025-03-11": {"input": 0.15, "cached": None, "output": 0.60},
-        "gpt-4o-search-preview-2025-03-11": {"input": 2.50, "cached": None, "output": 10.00},
-
-        # o-Series Models
-        "o1-2024-12-17": {"input": 15.00, "cached": 7.50, "output": 60.00},
-        "o1-preview-2024-09-12": {"input": 15.00, "cached": 7.50, "output": 60.00},
-        "o1-pro-2025-03-19": {"input": 150.00, "cached": None, "output": 600.00},
-        "o1-mini-2024-09-12": {"input": 1.10, "cached": 0.55, "output": 4.40},
-        "o3-mini-2025-01-31": {"input": 1.10, "cached": 0.55, "output": 4.40},
-
-        # GPT-4.1 Series
-        "gpt-4.1-2025-04-14": {"input": 2.00, "cached": 0.50, "output": 8.00},
-        "gpt-4.1-mini-2025-04-14": {"input": 0.40, "cached": 0.10, "output": 1.60},
-        "gpt-4.1-nano-2025-04-14": {"input": 0.10, "cached": 0.025, "output": 0.40},
-
-        # Computer Use Preview
-        "computer-use-preview-2025-03-11": {"input": 3.00, "cached": None, "output": 12.00},
-
-        # Fine-Tuned Models
-        "ft:gpt-4.1-mini-2025-04-14:personal:a001:BMR8CaY3": {"input": 0.80, "cached": 0.20, "output": 3.20},
-
-        # GPT-3.5 Turbo
-        "gpt-3.5-turbo-0125": {"input": 0.50, "cached": None, "output": 1.50}
-    }
 
     
-    rates = pricing.get(model)
+    rates = MODEL_PRICING.get(model)
     if rates is None:
         raise ValueError(f"The pricing for model '{model}' is not available.")
     
@@ -94,4 +102,41 @@ def calculate_token_cost(prompt_tokens, completion_tokens, model="o1-2024-12-17"
         "cached_cost": cached_cost,
         "completion_cost": completion_cost,
         "total_cost": total_cost
-    } 
\ No newline at end of file
+    }
+
+
+def calculate_usage_cost(usage):
+    """
+    Total tokens and cost of several calls, each priced at its own model's rates.
+    The tokens of a model without pricing are counted at cost 0, with a warning.
+
+    Arguments:
+      usage (dict): {model: (prompt_tokens, completion_tokens)}, e.g. a UsageMeter snapshot.
+
+    Returns:
+      dict: the keys of calculate_token_cost(), summed over the models.
+    """
+    totals = dict.fromkeys([
+        "prompt_tokens", "cached_prompt_tokens", "completion_tokens", "total_tokens",
+        "prompt_cost", "cached_cost", "completion_cost", "total_cost"
+    ], 0)
+    for model, (prompt_tokens, completion_tokens) in usage.items():
+        if model in MODEL_PRICING:
+            cost = calculate_token_cost(prompt_tokens, completion_tokens, model=model)
+        else:
+            logger.warning("model_pricing_missing", model=model)
+            cost = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens}
+        for key in totals:
+            totals[key] += cost.get(key, 0)
+    return totals
+
+
+# Settings naming a model whose calls are priced (turn cost, analytics, credit settlement)
+PRICED_MODEL_SETTINGS = ("CHAT_MODEL", "CHAT_SIMPLE_MODEL", "REWRITE_MODEL", "REWRITE_SIMPLE_MODEL", "NEXUS_SUMMARY_MODEL")
+
+
+def unpriced_models():
+    """The configured models missing from MODEL_PRICING, as {setting: model}."""
+    configured = {setting: getattr(Config, setting) for setting in PRICED_MODEL_SETTINGS}
+    return {setting: model for setting, model in configured.items() if model not in MODEL_PRICING} 
\ No newline at end of file
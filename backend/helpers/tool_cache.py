@@ -0,0 +1,203 @@
+# server/helpers/tool_cache.py
+
+"""
+Tool Cache
+----------
+Caches tool results in the tool-dispatch path of process_chat, keyed by
+(tool name, canonicalized JSON arguments, corpus version). A hit skips the
+query rewrite, the embedding, the vector query and the corpus fetch.
+
+- Memory tier: a bounded LRU per worker (Config.TOOL_CACHE_MEMORY_ENTRIES).
+- Shared tier: the `tool_result_cache` table, shared by all workers and
+  replicas, with a TTL (Config.TOOL_CACHE_TTL_SECONDS).
+
+Only the tools in Config.TOOL_CACHE_TOOLS are cached. Empty search results
+("No sections found") may come from a transient failure to resolve matches, so
+they are kept in the memory tier only, for Config.TOOL_CACHE_EMPTY_TTL_SECONDS.
+The shared tier runs on its own short-lived connection, never the request's
+session: a lookup does not hold a transaction open during the rest of the turn
+and a failure cannot roll back the request's pending changes. Failures are
+logged and treated as misses; they never fail the request.
+"""
+
+# Import necessary libraries
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from config import Config
+from database.session import engine
+from models.sql_models import ToolResultCache
+from helpers.rag_helpers import get_corpus_version, EMPTY_SEARCH_RESULTS
+from helpers.metrics import record_cache_lookup
+from helpers.log_helpers import get_logger
+
+logger = get_logger("tool_cache")
+
+###############################################################################
+# 1. KEYS
+###############################################################################
+
+def _canonical_value(value):
+    """Normalize argument values so trivially different calls share a key."""
+    if isinstance(value, str):
+        # Case and whitespace do not change what the search tools retrieve
+        return re.sub(r"\s+", " ", value).strip().casefold()
+    if isinstance(value, dict):
+        return {key: _canonical_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_canonical_value(item) for item in value]
+    return value
+
+
+def canonicalize_arguments(arguments):
+    """Return the canonical form of a tool call's arguments."""
+    return _canonical_value(arguments or {})
+
+
+def make_cache_key(tool_name, arguments):
+    """sha256 of the tool name, canonical JSON arguments and corpus version."""
+    canonical_json = json.dumps(canonicalize_arguments(arguments), sort_keys=True, separators=(",", ":"))
+    raw = f"{tool_name}\n{canonical_json}\n{get_corpus_version()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+###############################################################################
+# 2. MEMORY TIER
+###############################################################################
+
+class MemoryTier:
+    """Bounded LRU of (result, expiry) entries, safe to share between threads."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            result, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def set(self, key, result, ttl_seconds=None):
+        ttl_seconds = self._ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (result, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+memory_tier = MemoryTier(Config.TOOL_CACHE_MEMORY_ENTRIES, Config.TOOL_CACHE_TTL_SECONDS)
+
+###############################################################################
+# 3. SHARED (POSTGRES) TIER
+###############################################################################
+
+def _db_get(key):
+    """Return (result, remaining ttl seconds) from the shared tier, or (None, 0)."""
+    try:
+        now = datetime.utcnow()
+        with engine.connect() as connection:
+            row = connection.execute(
+                select(ToolResultCache.result, ToolResultCache.expires_at).where(
+                    ToolResultCache.cache_key == key,
+                    ToolResultCache.expires_at > now
+                )
+            ).first()
+        if row is None:
+            return None, 0
+        return row.result, (row.expires_at - now).total_seconds()
+    except Exception as e:
+        logger.warning("tool_cache_db_get_failed", error=str(e))
+        return None, 0
+
+
+def _db_set(key, tool_name, arguments, result):
+    """Upsert a result into the shared tier."""
+    try:
+        now = datetime.utcnow()
+        values = {
+            "cache_key": key,
+            "tool_name": tool_name,
+            "arguments": canonicalize_arguments(arguments),
+            "corpus_version": get_corpus_version(),
+            "result": result,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=Config.TOOL_CACHE_TTL_SECONDS)
+        }
+        statement = insert(ToolResultCache).values(**values)
+        statement = statement.on_conflict_do_update(
+            index_elements=[ToolResultCache.cache_key],
+            set_={
+                "result": statement.excluded.result,
+                "corpus_version": statement.excluded.corpus_version,
+                "created_at": statement.excluded.created_at,
+                "expires_at": statement.excluded.expires_at
+            }
+        )
+        with engine.begin() as connection:
+            connection.execute(statement)
+            # Occasionally drop expired rows so the table stays small
+            if random.random() < 0.01:
+                connection.execute(delete(ToolResultCache).where(ToolResultCache.expires_at <= now))
+    except Exception as e:
+        logger.warning("tool_cache_db_set_failed", error=str(e))
+
+###############################################################################
+# 4. LOOKUP
+###############################################################################
+
+def is_cacheable(tool_name):
+    return Config.TOOL_CACHE_ENABLED and tool_name in Config.TOOL_CACHE_TOOLS
+
+
+def get_or_compute(tool_name, arguments, compute):
+    """
+    Return (result, source) for a tool call, where source is "memory", "db",
+    "computed" (a miss; the result was stored) or "uncached" (tool not cacheable).
+    `compute` is called with no arguments on a miss.
+    """
+    if not is_cacheable(tool_name):
+        return compute(), "uncached"
+
+    key = make_cache_key(tool_name, arguments)
+
+    result = memory_tier.get(key)
+    record_cache_lookup("tool_memory", result is not None)
+    if result is not None:
+        return result, "memory"
+
+    if Config.TOOL_CACHE_DB_ENABLED:
+        result, ttl_seconds = _db_get(key)
+        record_cache_lookup("tool_db", result is not None)
+        if result is not None:
+            memory_tier.set(key, result, ttl_seconds=ttl_seconds)
+            return result, "db"
+
+    result = compute()
+    if result in EMPTY_SEARCH_RESULTS:
+        if Config.TOOL_CACHE_EMPTY_TTL_SECONDS > 0:
+            memory_tier.set(key, result, ttl_seconds=Config.TOOL_CACHE_EMPTY_TTL_SECONDS)
+    elif isinstance(result, str):
+        memory_tier.set(key, result)
+        if Config.TOOL_CACHE_DB_ENABLED:
+            _db_set(key, tool_name, arguments, result)
+    return result, "computed"
@@ -0,0 +1,78 @@
+# server/helpers/trace_helpers.py
+
+"""
+Trace Helpers
+-------------
+Lightweight span tracing for the chat pipeline. A trace is started once per
+request in process_chat and made "current" through a context variable, so that
+helpers deeper in the call stack (e.g. the RAG search functions) can record
+their own stages without the trace being passed through every signature.
+When no trace is active, span() is a no-op.
+"""
+
+# Import necessary libraries
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# The trace for the request currently being processed (if any)
+_current_trace = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Collects timed spans for a single chat request."""
+
+    def __init__(self):
+        self.spans = []
+        self._origin = time.perf_counter()
+
+    def elapsed_ms(self):
+        """Milliseconds elapsed since the trace was started."""
+        return (time.perf_counter() - self._origin) * 1000
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the enclosed block and record it as a span named `name`."""
+        start = time.perf_counter()
+        record = {
+            "name": name,
+            "start_offset_ms": (start - self._origin) * 1000,
+            "duration_ms": None,
+            "status": "ok",
+            "attributes": attributes or None
+        }
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "error"
+            raise
+        finally:
+            record["duration_ms"] = (time.perf_counter() - start) * 1000
+            self.spans.append(record)
+
+
+@contextmanager
+def start_trace():
+    """Start a new trace and make it the current one for the enclosed block."""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    """Return the active trace, or None when tracing is not active."""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Record a span on the current trace (no-op when there is none)."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **attributes) as record:
+        yield record
@@ -0,0 +1,126 @@
+# server/helpers/usage_meter.py
+
+"""
+Usage Meter
+-----------
+Collects the token usage of the chat completions made while handling one
+request. helpers/clients.create_chat_completion() records each completed
+attempt (hedges included) into the meter that is current in the request's
+context; services/metering_service.py settles it against the user's credits.
+Outside a metered request, recording is a no-op.
+
+- Usage that arrives after the meter was closed (a hedge that lost, a
+  speculative call still running when the request finished) goes to
+  record_late(), which subclasses settle on their own.
+- capture_usage() records a call's usage into a separate meter as well, so
+  requests coalesced onto that call (helpers/singleflight.py) can be charged
+  the same usage with replay_usage(). Replayed usage is charged as credits but
+  marked, so snapshot(replayed=False) leaves it out of token metrics and
+  analytics cost, which would otherwise count one OpenAI call once per request.
+"""
+
+# Import necessary libraries
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+class UsageMeter:
+    """Prompt/completion tokens per model for one request (safe across hedge threads)."""
+
+    def __init__(self):
+        self.usage = {}
+        # The part of `usage` replayed from calls made by other requests
+        self.replayed = {}
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def record(self, model, prompt_tokens, completion_tokens, replayed=False):
+        with self._lock:
+            if not self.closed:
+                for usage in (self.usage, self.replayed) if replayed else (self.usage,):
+                    totals = usage.setdefault(model, [0, 0])
+                    totals[0] += prompt_tokens
+                    totals[1] += completion_tokens
+                return
+        self.record_late(model, prompt_tokens, completion_tokens)
+
+    def record_late(self, model, prompt_tokens, completion_tokens):
+        """Usage recorded after close(); dropped unless a subclass settles it."""
+
+    def close(self):
+        """Stop collecting and return the final usage ({model: (prompt, completion)})."""
+        with self._lock:
+            self.closed = True
+            return {model: tuple(totals) for model, totals in self.usage.items()}
+
+    def snapshot(self, replayed=True):
+        """The usage so far; with replayed=False, only the calls this request made itself."""
+        with self._lock:
+            snapshot = {}
+            for model, (prompt_tokens, completion_tokens) in self.usage.items():
+                replayed_prompt, replayed_completion = (0, 0) if replayed else self.replayed.get(model, (0, 0))
+                if prompt_tokens - replayed_prompt or completion_tokens - replayed_completion:
+                    snapshot[model] = (prompt_tokens - replayed_prompt, completion_tokens - replayed_completion)
+            return snapshot
+
+    def replayed_snapshot(self):
+        with self._lock:
+            return {model: tuple(totals) for model, totals in self.replayed.items()}
+
+    @property
+    def total_tokens(self):
+        with self._lock:
+            return sum(prompt + completion for prompt, completion in self.usage.values())
+
+
+_current_meter = contextvars.ContextVar("usage_meter", default=None)
+
+
+@contextmanager
+def use_meter(meter):
+    """Make `meter` current for the duration of the block."""
+    token = _current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _current_meter.reset(token)
+
+
+def current_meter():
+    return _current_meter.get()
+
+
+def record_usage(model, usage):
+    """Add a completion's usage to the current meter, if any."""
+    meter = _current_meter.get()
+    if meter is not None and usage is not None:
+        meter.record(model, usage.prompt_tokens or 0, usage.completion_tokens or 0)
+
+
+class _TeeMeter(UsageMeter):
+    """Meter that also records everything into the meter that was current when it was made."""
+
+    def __init__(self, parent):
+        super().__init__()
+        self._parent = parent
+
+    def record(self, model, prompt_tokens, completion_tokens, replayed=False):
+        super().record(model, prompt_tokens, completion_tokens, replayed=replayed)
+        if self._parent is not None:
+            self._parent.record(model, prompt_tokens, completion_tokens, replayed=replayed)
+
+
+@contextmanager
+def capture_usage():
+    """Yield a meter that collects the block's usage, still recorded into the current meter too."""
+    with use_meter(_TeeMeter(_current_meter.get())) as meter:
+        yield meter
+
+
+def replay_usage(usage):
+    """Record usage captured for another request ({model: (prompt, completion)}) into the current meter, marked as replayed."""
+    meter = _current_meter.get()
+    if meter is not None:
+        for model, (prompt_tokens, completion_tokens) in (usage or {}).items():
+            meter.record(model, prompt_tokens, completion_tokens, replayed=True)
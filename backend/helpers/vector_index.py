@@ -0,0 +1,278 @@
+# server/helpers/vector_index.py
+
+"""
+Vector Index
+------------
+An in-process vector index stored as quantized codes, for the CFR/M21 chunks
+(Config.VECTOR_BACKEND = "local") and other embedding sets (e.g. the 3072-dim
+tag/condition embeddings).
+
+- First pass: a scan over quantized codes held in memory.
+  - "int8": per-vector scalar quantization, 4x smaller than float32, scored with
+    blocked float32 matrix-vector products (BLAS/SIMD).
+  - "binary": one sign bit per dimension, 32x smaller, scored by Hamming distance
+    with vectorized XOR + popcount.
+  - "float32": no quantization, the exact baseline.
+- Rescoring: the top `top_k * rescore_factor` candidates are rescored against the
+  full-precision vectors, which stay in a memory-mapped file and are paged in on
+  demand (and shared between workers through the page cache).
+
+Vectors are L2-normalized, so scores are cosine similarities, as in Pinecone.
+
+On disk an index is a directory holding index.json (ids, metadata, content
+hashes), vectors.npy (float32, memory-mapped), codes.npy and, for int8, scales.npy.
+scripts/bench_vector_index.py measures memory and recall@10 per mode.
+"""
+
+# Import necessary libraries
+import os
+import json
+import threading
+import numpy as np
+from config import Config
+
+MODES = ("int8", "binary", "float32")
+FORMAT_VERSION = 1
+
+# Candidates rescored per requested result when no rescore factor is given
+DEFAULT_RESCORE_FACTORS = {"int8": 4, "binary": 16, "float32": 1}
+
+# Rows scored per block in the int8 pass (bounds the float32 scratch buffer to ~8 MB)
+_BLOCK_BYTES = 8 * 1024 * 1024
+
+# Popcount of every byte value, for NumPy builds without np.bitwise_count
+_POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values]
+
+
+def quantize_int8(vectors):
+    """Symmetric per-vector int8 quantization; returns (codes, scales) with v ~= codes * scale."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors):
+    """One bit per dimension (1 for positive components), packed 8 per byte."""
+    return np.packbits(vectors > 0, axis=1)
+
+
+class QuantizedVectorIndex:
+    """Quantized first-pass search with exact rescoring from a memory-mapped file."""
+
+    def __init__(self, path, mode, ids, metadata, hashes, vectors, codes, scales):
+        self.path = path
+        self.mode = mode
+        self.ids = ids
+        self.metadata = metadata
+        self.hashes = hashes
+        self.vectors = vectors
+        self.codes = codes
+        self.scales = scales
+        self._positions = {vector_id: position for position, vector_id in enumerate(ids)}
+
+    ###########################################################################
+    # Build / load
+    ###########################################################################
+
+    @classmethod
+    def build(cls, path, ids, vectors, metadata=None, hashes=None, mode="int8"):
+        """Write an index directory for `vectors` (n x dim) and return it loaded."""
+        if mode not in MODES:
+            raise ValueError(f"Unknown vector index mode: {mode}")
+        vectors = _normalize(vectors)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one vector per id")
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), vectors)
+        if mode == "int8":
+            codes, scales = quantize_int8(vectors)
+            np.save(os.path.join(path, "codes.npy"), codes)
+            np.save(os.path.join(path, "scales.npy"), scales)
+        elif mode == "binary":
+            np.save(os.path.join(path, "codes.npy"), quantize_binary(vectors))
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "mode": mode,
+            "dim": int(vectors.shape[1]),
+            "count": len(ids),
+            "ids": list(ids),
+            "metadata": list(metadata) if metadata is not None else [{} for _ in ids],
+            "hashes": list(hashes) if hashes is not None else [None for _ in ids]
+        }
+        tmp_path = os.path.join(path, "index.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(path, "index.json"))
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path):
+        """Load codes into memory and memory-map the full-precision vectors."""
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector index format in {path}")
+
+        mode = manifest["mode"]
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        codes = scales = None
+        if mode in ("int8", "binary"):
+            codes = np.load(os.path.join(path, "codes.npy"))
+        if mode == "int8":
+            scales = np.load(os.path.join(path, "scales.npy"))
+        return cls(path, mode, manifest["ids"], manifest["metadata"], manifest["hashes"], vectors, codes, scales)
+
+    ###########################################################################
+    # Search
+    ###########################################################################
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _first_pass_scores(self, query):
+        """Approximate similarity of the query to every vector (higher is closer)."""
+        if self.mode == "float32":
+            return np.asarray(self.vectors @ query)
+        if self.mode == "binary":
+            query_bits = quantize_binary(query[None, :])[0]
+            distances = _popcount(np.bitwise_xor(self.codes, query_bits)).sum(axis=1, dtype=np.int32)
+            return -distances.astype(np.float32)
+
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        block_rows = max(1, _BLOCK_BYTES // (4 * self.codes.shape[1]))
+        for start in range(0, len(self.codes), block_rows):
+            block = self.codes[start:start + block_rows].astype(np.float32)
+            scores[start:start + block_rows] = (block @ query) * self.scales[start:start + block_rows]
+        return scores
+
+    def search(self, query, top_k=10, rescore_factor=None):
+        """Return the top_k matches as dicts with id, score (cosine) and metadata."""
+        if not self.ids:
+            return []
+        query = _normalize(query)
+        top_k = min(top_k, len(self.ids))
+        rescore_factor = rescore_factor or DEFAULT_RESCORE_FACTORS[self.mode]
+        candidate_count = min(len(self.ids), top_k * max(1, rescore_factor))
+
+        scores = self._first_pass_scores(query)
+        if candidate_count < len(scores):
+            candidates = np.argpartition(-scores, candidate_count - 1)[:candidate_count]
+        else:
+            candidates = np.arange(len(scores))
+
+        if self.mode != "float32":
+            # Sorted positions read the memory-mapped rows sequentially
+            candidates = np.sort(candidates)
+            scores = np.asarray(self.vectors[candidates]) @ query
+        else:
+            scores = scores[candidates]
+
+        order = np.argsort(-scores)[:top_k]
+        return [
+            {
+                "id": self.ids[candidates[i]],
+                "score": float(scores[i]),
+                "metadata": self.metadata[candidates[i]]
+            }
+            for i in order
+        ]
+
+    def exact_search(self, query, top_k=10):
+        """Full-precision brute-force search (the recall baseline)."""
+        query = _normalize(query)
+        scores = np.asarray(self.vectors @ query)
+        top_k = min(top_k, len(scores))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        return [self.ids[i] for i in candidates[np.argsort(-scores[candidates])]]
+
+    ###########################################################################
+    # Introspection
+    ###########################################################################
+
+    def get_vector(self, vector_id):
+        """Full-precision vector for an id, or None."""
+        position = self._positions.get(vector_id)
+        return None if position is None else np.asarray(self.vectors[position])
+
+    def get_hash(self, vector_id):
+        position = self._positions.get(vector_id)
+        return None if position is None else self.hashes[position]
+
+    def memory_bytes(self):
+        """Bytes resident for the first pass versus the float32 vectors it replaces."""
+        full_precision = int(self.vectors.shape[0] * self.vectors.shape[1] * 4)
+        resident = full_precision if self.mode == "float32" else int(self.codes.nbytes)
+        if self.scales is not None:
+            resident += int(self.scales.nbytes)
+        return {"resident": resident, "full_precision": full_precision}
+
+###############################################################################
+# LOCAL INDEXES FOR THE SEARCH TOOLS
+###############################################################################
+
+_lock = threading.Lock()
+# index name -> (index, version of its index.json)
+_indexes = {}
+
+
+def local_index_path(index_name):
+    return os.path.join(Config.VECTOR_INDEX_DIR, index_name)
+
+
+def _index_version(path):
+    """Identifies the index.json on disk; changes when scripts/ingest_corpus.py swaps the directory."""
+    try:
+        stat = os.stat(os.path.join(path, "index.json"))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def get_local_index(index_name):
+    """
+    Return the process-wide handle for a local index, loaded on first use and
+    reloaded when its index.json changes (re-ingestion), so workers pick up a
+    new index without a restart.
+    """
+    path = local_index_path(index_name)
+    version = _index_version(path)
+    loaded = _indexes.get(index_name)
+    # While the directory is being swapped index.json is briefly missing; keep serving the old index
+    if loaded is not None and (version is None or loaded[1] == version):
+        return loaded[0]
+    with _lock:
+        loaded = _indexes.get(index_name)
+        if loaded is None or (version is not None and loaded[1] != version):
+            loaded = _indexes[index_name] = (QuantizedVectorIndex.load(path), version)
+    return loaded[0]
+
+
+def query_local_index(index_name, vector, top_k=10, include_metadata=True):
+    """Query a local index; the result has the same shape as a Pinecone query's to_dict()."""
+    matches = get_local_index(index_name).search(vector, top_k=top_k, rescore_factor=Config.VECTOR_RESCORE_FACTOR)
+    if not include_metadata:
+        for match in matches:
+            match.pop("metadata", None)
+    return {"matches": matches, "namespace": ""}
+
+
+def reset_local_indexes():
+    """Forget loaded indexes so the next query reloads them."""
+    with _lock:
+        _indexes.clear()
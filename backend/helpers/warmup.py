@@ -0,0 +1,70 @@
+# server/helpers/warmup.py
+
+"""
+Warmup
+------
+Builds the backend's read-only, process-wide state up front instead of on the
+first request that needs it:
+
+- the corpus documents of every source (helpers/corpus_store.py)
+- the Part 4 rating index and the CFR citation graph
+- the local quantized vector indexes, when Config.VECTOR_BACKEND = "local"
+- the corpus version used by the tool-result cache
+- the model pricing table (built at import)
+
+Under gunicorn with preload_app (gunicorn.conf.py), warmup() runs once in the
+master before the workers are forked. gc.freeze() then moves everything built
+so far into the permanent generation, so the garbage collector of a worker never
+touches (and copies) those pages: the workers share them copy-on-write and the
+first request after a deploy is as fast as steady state.
+
+No network clients are created here; helpers/clients.py opens them lazily, and
+gunicorn's post_fork hook resets them in each worker.
+"""
+
+# Import necessary libraries
+import gc
+import time
+from config import Config
+from helpers.log_helpers import get_logger
+
+logger = get_logger("warmup")
+
+
+def _timed(durations, name, fn):
+    start = time.perf_counter()
+    result = fn()
+    durations[name] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def warmup(freeze=False):
+    """
+    Load all read-only state; with `freeze`, collect garbage and gc.freeze() the
+    survivors (call in the gunicorn master, right before forking). Returns the
+    milliseconds spent per step.
+    """
+    from helpers import corpus_store, rating_schedule, cfr_graph
+    from helpers.rag_helpers import get_corpus_version
+    # Imported for its module-level pricing table
+    import helpers.token_utils  # noqa: F401
+
+    durations = {}
+    for entry in corpus_store.CORPUS_FILES:
+        _timed(durations, f"corpus:{entry['source']}", lambda: corpus_store.get_documents(entry["source"]))
+    _timed(durations, "rating_index", rating_schedule.get_rating_index)
+    _timed(durations, "cfr_graph", cfr_graph.get_graph)
+    _timed(durations, "corpus_version", get_corpus_version)
+    if Config.VECTOR_BACKEND == "local":
+        from helpers.vector_index import get_local_index
+        for index_name in (corpus_store.INDEX_NAME_CFR, corpus_store.INDEX_NAME_M21):
+            try:
+                _timed(durations, f"vector_index:{index_name}", lambda: get_local_index(index_name))
+            except Exception as e:
+                logger.warning("warmup_vector_index_failed", index_name=index_name, error=str(e))
+
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    logger.info("warmup_completed", frozen=freeze, frozen_objects=gc.get_freeze_count(), durations_ms=durations)
+    return durations
@@ -0,0 +1,169 @@
+# server/helpers/wire_format.py
+
+"""
+Wire Format
+-----------
+Encoding and compression of API payloads. Chat responses carry the whole
+conversation_history, tool results (full CFR sections) included, so they are
+often hundreds of KB.
+
+- JSON: with `orjson` installed, app.json encodes responses and decodes
+  request bodies with it instead of the standard library. Keys are still
+  sorted and datetimes and decimals formatted as Flask formats them; only
+  non-ASCII text is sent as UTF-8 rather than \\u escapes.
+- MessagePack (optional, needs `msgpack`): on the chat and analytics
+  blueprints, a client that sends `Accept: application/msgpack` gets
+  MessagePack responses, and request bodies sent as `Content-Type:
+  application/msgpack` are read by request.get_json() like JSON bodies.
+- Compression: responses of the chat and analytics blueprints larger than
+  Config.COMPRESSION_MIN_BYTES are compressed with brotli (when `brotli` is
+  installed and accepted) or gzip, as negotiated through Accept-Encoding.
+
+scripts/bench_wire_format.py measures encoding time and bytes on the wire
+for each format.
+"""
+
+# Import necessary libraries
+import gzip
+from flask import Request, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest
+from config import Config
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard library encoder is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional: MessagePack is then not offered
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered
+    brotli = None
+
+MSGPACK_MIMETYPE = "application/msgpack"
+MSGPACK_MIMETYPES = {MSGPACK_MIMETYPE, "application/x-msgpack"}
+
+# Blueprints whose responses are negotiated (MessagePack) and compressed
+WIRE_FORMAT_BLUEPRINTS = {"chat", "analytics"}
+
+COMPRESSIBLE_MIMETYPES = {"application/json", MSGPACK_MIMETYPE, "text/csv", "text/plain", "text/html"}
+
+###############################################################################
+# 1. ENCODING
+###############################################################################
+
+def _msgpack_default(value):
+    """Types MessagePack cannot encode are sent as they would be in JSON."""
+    return DefaultJSONProvider.default(value)
+
+
+def wants_msgpack():
+    """Whether the current request negotiated a MessagePack response."""
+    if msgpack is None or not Config.MSGPACK_ENABLED or request.blueprint not in WIRE_FORMAT_BLUEPRINTS:
+        return False
+    return request.accept_mimetypes.best_match(["application/json", MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE
+
+
+def encode_msgpack(obj):
+    return msgpack.packb(obj, default=_msgpack_default, datetime=False)
+
+
+class WireJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider on orjson when available, with MessagePack responses on request."""
+
+    def _orjson_options(self, indent=False):
+        # Datetimes go through default() so they keep Flask's (HTTP date) format
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or set(kwargs) - {"indent"}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._orjson_options(kwargs.get("indent"))).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if has_request_context() and wants_msgpack():
+            response = self._app.response_class(encode_msgpack(obj), mimetype=MSGPACK_MIMETYPE)
+            response.vary.add("Accept")
+            return response
+        if orjson is None:
+            return super().response(obj)
+
+        indent = self.compact is None and self._app.debug or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._orjson_options(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+class WireRequest(Request):
+    """Request whose get_json() also reads MessagePack bodies."""
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if msgpack is None or self.mimetype not in MSGPACK_MIMETYPES:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        try:
+            return msgpack.unpackb(self.get_data(cache=cache), raw=False)
+        except Exception as e:
+            if silent:
+                return None
+            raise BadRequest(f"Failed to decode MessagePack body: {e}")
+
+
+def init_wire_format(app):
+    """Use the fast JSON provider and MessagePack-aware requests in `app`."""
+    app.json = WireJSONProvider(app)
+    app.request_class = WireRequest
+
+###############################################################################
+# 2. COMPRESSION
+###############################################################################
+
+def _accepted_encoding():
+    """The best response encoding the client accepts (brotli over gzip), or None."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=Config.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=Config.COMPRESSION_GZIP_LEVEL)
+
+
+def compress_response(response):
+    """after_request hook: compress a large response with the negotiated encoding."""
+    if not Config.COMPRESSION_ENABLED:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < Config.COMPRESSION_MIN_BYTES:
+        return response
+    encoding = _accepted_encoding()
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
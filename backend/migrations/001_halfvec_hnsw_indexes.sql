@@ -0,0 +1,41 @@
+-- server/migrations/001_halfvec_hnsw_indexes.sql
+--
+-- HNSW indexes for the 3072-dim embedding columns Tag.embeddings and
+-- ConditionEmbedding.embedding.
+--
+-- pgvector's HNSW index supports at most 2,000 dimensions for `vector`, but
+-- 4,000 for `halfvec`, so the indexes are built over a half-precision cast of
+-- the columns (half the index size, no measurable recall loss for OpenAI
+-- embeddings). Queries must order by the same expression to use them, e.g.
+--
+--     ORDER BY t.embeddings::halfvec(3072) <=> ce.embedding::halfvec(3072)
+--
+-- (see services/tagging_service.py). Recall/speed at query time is tuned with
+-- the transaction-local `hnsw.ef_search` setting (Config.TAG_MATCH_EF_SEARCH).
+--
+-- Requires pgvector >= 0.7.0. CREATE INDEX CONCURRENTLY cannot run inside a
+-- transaction, so apply this file with autocommit:
+--
+--     psql "$DATABASE_URL" -f backend/migrations/001_halfvec_hnsw_indexes.sql
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+-- Building a large HNSW index is much faster when the graph fits in memory
+SET maintenance_work_mem = '1GB';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tags_embeddings_halfvec_hnsw_idx
+    ON tags
+    USING hnsw ((embeddings::halfvec(3072)) halfvec_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS condition_embeddings_halfvec_hnsw_idx
+    ON condition_embeddings
+    USING hnsw ((embedding::halfvec(3072)) halfvec_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+-- Batched matching looks up the embeddings of many conditions at once
+CREATE INDEX CONCURRENTLY IF NOT EXISTS condition_embeddings_condition_id_idx
+    ON condition_embeddings (condition_id);
+
+ANALYZE tags;
+ANALYZE condition_embeddings;
@@ -0,0 +1,49 @@
+-- server/migrations/002_openai_api_logs_jsonb.sql
+--
+-- Store OpenAIAPILog.request_payload and response_json as JSONB and index the
+-- fields incidents are searched by (see /api/analytics/logs/search and
+-- helpers/analytics_helpers.py), so filtering happens in Postgres instead of
+-- pulling whole payloads into Python:
+--
+-- - the functions whose results are in the logged conversation: a GIN index
+--   over just the `name`s of the "function" messages, not over the payload
+--   (which also holds the tool definitions and the full tool results)
+-- - the model that answered (the requested model for failed calls)
+-- - the finish reason of the (last) completion
+-- - the status, and the request time for time-range filters
+--
+-- Queries must use the same expressions as the indexes, e.g.
+--
+--     WHERE jsonb_path_query_array(request_payload -> 'messages',
+--             '$[*] ? (@.role == "function").name') @> '["m21_search"]'
+--       AND status = 'error'
+--
+-- The type change rewrites the table under an ACCESS EXCLUSIVE lock (chat
+-- requests writing their logs wait for it), so run it off-peak.
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction, so apply this file
+-- with autocommit:
+--
+--     psql "$DATABASE_URL" -f backend/migrations/002_openai_api_logs_jsonb.sql
+
+ALTER TABLE openai_api_logs
+    ALTER COLUMN request_payload TYPE jsonb USING request_payload::jsonb,
+    ALTER COLUMN response_json TYPE jsonb USING response_json::jsonb;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS openai_api_logs_function_names_idx
+    ON openai_api_logs
+    USING gin ((jsonb_path_query_array(request_payload -> 'messages', '$[*] ? (@.role == "function").name')) jsonb_path_ops);
+
+-- The id column lets a filtered search page backwards by id without a sort
+CREATE INDEX CONCURRENTLY IF NOT EXISTS openai_api_logs_model_idx
+    ON openai_api_logs ((COALESCE(response_json ->> 'model', request_payload ->> 'model')), id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS openai_api_logs_finish_reason_idx
+    ON openai_api_logs ((response_json #>> '{choices,0,finish_reason}'), id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS openai_api_logs_status_idx
+    ON openai_api_logs (status, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS openai_api_logs_request_sent_at_idx
+    ON openai_api_logs (request_sent_at);
+
+ANALYZE openai_api_logs;
@@ -0,0 +1,20 @@
+-- server/migrations/003_analytics_data_date_indexes.sql
+--
+-- Indexes for the time-range scans of /api/analytics/timeseries
+-- (helpers/analytics_helpers.py get_timeseries), which buckets analytics_data
+-- with date_bin over [from, to), optionally for a single model. The included
+-- columns let the bucketing read only the index.
+--
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction, so apply this file
+-- with autocommit:
+--
+--     psql "$DATABASE_URL" -f backend/migrations/003_analytics_data_date_indexes.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS analytics_data_date_idx
+    ON analytics_data (date)
+    INCLUDE (prompt_tokens, completion_tokens, total_tokens, total_cost, latency_ms);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS analytics_data_model_date_idx
+    ON analytics_data (model, date);
+
+ANALYZE analytics_data;
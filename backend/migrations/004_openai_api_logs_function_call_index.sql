@@ -0,0 +1,47 @@
+-- server/migrations/004_openai_api_logs_function_call_index.sql
+--
+-- Index the function called in each logged turn, replacing the GIN index of
+-- 002 over the names of every "function" message in the logged history. That
+-- index matched a turn if any earlier turn of the conversation had called the
+-- function. chat_service logs the turn's own call as
+-- request_payload -> 'function_call'. Logs written before it did are
+-- backfilled from the first function message after the last user message.
+--
+-- Queries must use the same expression as the index, e.g.
+--
+--     WHERE request_payload -> 'function_call' ->> 'name' = 'm21_search'
+--
+-- (see helpers/analytics_helpers.py). The backfill rewrites the affected rows
+-- in one transaction, so run it off-peak. CREATE/DROP INDEX CONCURRENTLY cannot
+-- run inside a transaction, so apply this file with autocommit:
+--
+--     psql "$DATABASE_URL" -f backend/migrations/004_openai_api_logs_function_call_index.sql
+
+UPDATE openai_api_logs AS l
+SET request_payload = l.request_payload || jsonb_build_object('function_call', jsonb_build_object('name', turn.name))
+FROM (
+    SELECT id, (
+        SELECT m.message ->> 'name'
+        FROM jsonb_array_elements(request_payload -> 'messages') WITH ORDINALITY AS m(message, position)
+        WHERE m.message ->> 'role' = 'function'
+          AND m.position > (
+              SELECT max(u.position)
+              FROM jsonb_array_elements(request_payload -> 'messages') WITH ORDINALITY AS u(message, position)
+              WHERE u.message ->> 'role' = 'user'
+          )
+        ORDER BY m.position
+        LIMIT 1
+    ) AS name
+    FROM openai_api_logs
+    WHERE jsonb_typeof(request_payload -> 'messages') = 'array'
+      AND NOT request_payload ? 'function_call'
+) AS turn
+WHERE l.id = turn.id AND turn.name IS NOT NULL;
+
+-- The id column lets a filtered search page backwards by id without a sort
+CREATE INDEX CONCURRENTLY IF NOT EXISTS openai_api_logs_function_call_idx
+    ON openai_api_logs ((request_payload -> 'function_call' ->> 'name'), id);
+
+DROP INDEX CONCURRENTLY IF EXISTS openai_api_logs_function_names_idx;
+
+ANALYZE openai_api_logs;
@@ -0,0 +1,23 @@
+-- server/migrations/005_nexus_summaries_worker_lease.sql
+--
+-- Lease and retry columns of nexus_summaries for the background worker
+-- (services/nexus_summary_service.py). The worker claims a batch by stamping
+-- claimed_at/claimed_by and committing, runs the LLM calls without holding
+-- row locks, then writes back only rows it still holds. attempts counts claims
+-- since the last success; failed rows wait until next_attempt_at and are given
+-- up after Config.NEXUS_WORKER_MAX_ATTEMPTS (reset attempts to 0 to retry them).
+--
+-- The partial index covers the claim query, which only scans flagged rows.
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction, so apply this file
+-- with autocommit:
+--
+--     psql "$DATABASE_URL" -f backend/migrations/005_nexus_summaries_worker_lease.sql
+
+ALTER TABLE nexus_summaries ADD COLUMN IF NOT EXISTS claimed_at timestamp;
+ALTER TABLE nexus_summaries ADD COLUMN IF NOT EXISTS claimed_by text;
+ALTER TABLE nexus_summaries ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0;
+ALTER TABLE nexus_summaries ADD COLUMN IF NOT EXISTS next_attempt_at timestamp;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS nexus_summaries_needs_update_idx
+    ON nexus_summaries (updated_at NULLS FIRST, nexus_summary_id)
+    WHERE needs_update;
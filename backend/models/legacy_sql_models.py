@@ -114,7 +114,7 @@ class ConditionEmbedding(db.Model):
     
     embedding_id = db.Column(db.Integer, primary_key=True)
     condition_id = db.Column(db.Integer, ForeignKey('conditions.condition_id', ondelete='CASCADE'), nullable=False)
-    embedding = db.Column(Vector(3072))  # Ensure pgvector is properly configured
+    embedding = db.Column(Vector(3072))  # HNSW index over ::halfvec(3072), see migrations/001_halfvec_hnsw_indexes.sql
     
     conditions = db.relationship("Conditions", back_populates="embedding", lazy='select')
 
@@ -126,7 +126,7 @@ class Tag(db.Model):
     code = db.Column(db.Integer, nullable=False)
     disability_name = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
-    embeddings = db.Column(Vector(3072))  # Ensure pgvector is properly configured
+    embeddings = db.Column(Vector(3072))  # HNSW index over ::halfvec(3072), see migrations/001_halfvec_hnsw_indexes.sql
     
     conditions = db.relationship(
         'Conditions',
@@ -183,6 +183,11 @@ class NexusSummary(db.Model):
     needs_update = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)
     updated_at = db.Column(db.DateTime, onupdate=func.now())
+    # Lease of the background worker recomputing the summary (services/nexus_summary_service.py)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    claimed_by = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
     # Relationship back to NexusTags
     nexus_tag = db.relationship('NexusTags', backref=db.backref('nexus_summaries', lazy='select', cascade='all, delete-orphan'))
 
@@ -2,6 +2,7 @@
 # server/models/sql_models.py
 from datetime import datetime
 from database import db  
+from sqlalchemy.dialects.postgresql import JSONB
 
 # Model for storing full OpenAI API request/response logs
 class OpenAIAPILog(db.Model):
@@ -10,9 +11,9 @@ class OpenAIAPILog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=True)  # Optional: reference to user/session
     request_prompt = db.Column(db.Text, nullable=True)  # The prompt sent to OpenAI
-    request_payload = db.Column(db.JSON, nullable=True)  # The full request payload (if applicable)
+    request_payload = db.Column(JSONB, nullable=True)  # The full request payload (if applicable); JSONB for indexed search
     request_sent_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # When the request was sent
-    response_json = db.Column(db.JSON, nullable=False)  # The full OpenAI API response
+    response_json = db.Column(JSONB, nullable=False)  # The full OpenAI API response
     response_received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # When the response was received
     status = db.Column(db.String(50), nullable=True)  # e.g., 'success', 'error'
     error_message = db.Column(db.Text, nullable=True)  # Optional: error details if any
@@ -38,4 +39,64 @@ class AnalyticsData(db.Model):
     log_id = db.Column(db.Integer, db.ForeignKey('openai_api_logs.id'), nullable=True)
 
     def __repr__(self):
-        return f"<AnalyticsData {self.date} - {self.model}>"
\ No newline at end of file
+        return f"<AnalyticsData {self.date} - {self.model}>"
+
+# Model for storing per-stage timing spans of a chat request
+class ChatSpan(db.Model):
+    __tablename__ = "chat_spans"
+
+    id = db.Column(db.Integer, primary_key=True)
+    log_id = db.Column(db.Integer, db.ForeignKey('openai_api_logs.id', ondelete='CASCADE'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False, index=True)  # e.g., 'llm_call_1', 'vector_query'
+    start_offset_ms = db.Column(db.Float, nullable=False)  # Offset from the start of the request
+    duration_ms = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="ok")  # 'ok' or 'error'
+    attributes = db.Column(db.JSON, nullable=True)  # Optional: extra details (tool name, index name, ...)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<ChatSpan {self.log_id} - {self.name} {self.duration_ms:.1f}ms>"
+
+
+# Model for the shared tier of the tool-result cache
+class ToolResultCache(db.Model):
+    __tablename__ = "tool_result_cache"
+
+    cache_key = db.Column(db.String(64), primary_key=True)  # sha256 of (tool name, canonical args, corpus version)
+    tool_name = db.Column(db.String(100), nullable=False)
+    arguments = db.Column(db.JSON, nullable=True)  # The canonicalized arguments (for inspection)
+    corpus_version = db.Column(db.String(64), nullable=False)
+    result = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<ToolResultCache {self.tool_name} {self.cache_key[:12]}>"
+
+
+# Model for the token buckets of admission control, shared by all workers and replicas
+class RateLimitBucket(db.Model):
+    __tablename__ = "rate_limit_buckets"
+
+    bucket_key = db.Column(db.String(200), primary_key=True)  # e.g. 'chat:user:<uuid>:requests', 'chat:global:3:tokens'
+    level = db.Column(db.Float, nullable=False)  # Units available as of updated_at
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)  # Database time, so replica clocks do not matter
+
+    def __repr__(self):
+        return f"<RateLimitBucket {self.bucket_key} {self.level:.1f}>"
+
+
+# Model for settled requests whose credit changes are not yet applied to Users;
+# written once per request and aggregated (then deleted) by services/metering_service.py
+class CreditLedgerEntry(db.Model):
+    __tablename__ = "credit_ledger"
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    credit_delta = db.Column(db.BigInteger, nullable=False)  # Reserved minus used tokens (negative for late usage)
+    tokens_used = db.Column(db.BigInteger, nullable=False)
+    usage = db.Column(JSONB, nullable=False)  # {model: [prompt_tokens, completion_tokens]}
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CreditLedgerEntry {self.id} user={self.user_id} {self.credit_delta:+d}>"
@@ -2,6 +2,8 @@ from flask import Blueprint
 from routes.chat_routes import chat_bp
 from routes.database_routes import database_bp
 from routes.analytics_routes import analytics_bp
+from routes.metrics_routes import metrics_bp
+from routes.health_routes import health_bp
 
 # Create a blueprint for all routes
 all_routes_bp = Blueprint("all_routes", __name__)
@@ -12,5 +14,8 @@ def register_routes(app):
     app.register_blueprint(chat_bp, url_prefix="/api")
     app.register_blueprint(database_bp, url_prefix="/api")
     app.register_blueprint(analytics_bp, url_prefix="/api")
+    app.register_blueprint(metrics_bp, url_prefix="/api")
+    # Probes live at the root (/healthz, /readyz), where orchestrators expect them
+    app.register_blueprint(health_bp)
     
     return app
@@ -6,13 +6,18 @@ import csv
 from datetime import datetime
 from flask import Blueprint, request, jsonify, send_file
 from database.session import ScopedSession
-from models.sql_models import AnalyticsData, OpenAIAPILog
+from models.sql_models import AnalyticsData, OpenAIAPILog, ChatSpan
 from helpers.cors_helpers import pre_authorized_cors_preflight
-from helpers.analytics_helpers import get_analytics_summary
+from helpers.wire_format import compress_response
+from helpers.analytics_helpers import get_analytics_summary, get_stage_latency_percentiles, get_timeseries, search_openai_logs
 from services.analytics_service import store_request_analytics
+from helpers.log_helpers import get_logger
+
+logger = get_logger("routes")
 
 # Blueprint for analytics routes
 analytics_bp = Blueprint("analytics", __name__)
+analytics_bp.after_request(compress_response)
 
 # Define the analytics routes
 @pre_authorized_cors_preflight
@@ -21,7 +26,7 @@ def store_analytics():
     """Store analytics data for a request."""
     try:
         data = request.get_json(force=True)
-        print("DEBUG: Received analytics data:", data)
+        logger.debug("analytics_store_received", body=data)
 
         if not data:
             return jsonify({"error": "Missing JSON body"}), 400
@@ -45,9 +50,7 @@ def store_analytics():
             return jsonify({"error": "Failed to store analytics data"}), 500
 
     except Exception as e:
-        print("DEBUG: Exception encountered in store analytics:", e)
-        import traceback
-        traceback.print_exc()
+        logger.exception("store_analytics_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
 # Define the analytics summary route
@@ -61,9 +64,7 @@ def get_summary():
         return jsonify(summary), 200
 
     except Exception as e:
-        print("DEBUG: Exception encountered in get analytics summary:", e)
-        import traceback
-        traceback.print_exc()
+        logger.exception("get_analytics_summary_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
 # Define the analytics reset route
@@ -72,8 +73,9 @@ def get_summary():
 def reset_analytics():
     """Reset all analytics data and OpenAI API logs."""
     try:
-        # Delete all records from the analytics_data and openai_api_logs tables
+        # Delete all records from the analytics_data, chat_spans and openai_api_logs tables
         ScopedSession.query(AnalyticsData).delete()
+        ScopedSession.query(ChatSpan).delete()
         ScopedSession.query(OpenAIAPILog).delete()
         ScopedSession.commit()
         
@@ -85,9 +87,7 @@ def reset_analytics():
             "analytics": updated_analytics
         }), 200
     except Exception as e:
-        print("DEBUG: Exception encountered in reset analytics:", e)
-        import traceback
-        traceback.print_exc()
+        logger.exception("reset_analytics_failed", error=str(e))
         ScopedSession.rollback()
         return jsonify({"error": str(e)}), 500
 
@@ -112,11 +112,92 @@ def get_openai_log(log_id):
             "status": log.status,
             "error_message": log.error_message,
         }
+        # Attach the per-stage spans recorded for this request
+        spans = ScopedSession.query(ChatSpan).filter_by(log_id=log_id).order_by(ChatSpan.start_offset_ms).all()
+        log_data["spans"] = [{
+            "name": span.name,
+            "start_offset_ms": span.start_offset_ms,
+            "duration_ms": span.duration_ms,
+            "status": span.status,
+            "attributes": span.attributes,
+        } for span in spans]
         return jsonify(log_data), 200
     except Exception as e:
-        print(f"Error fetching OpenAI log: {e}")
+        logger.error("get_openai_log_failed", log_id=log_id, error=str(e))
         return jsonify({"error": "Internal server error"}), 500
     
+# Define the OpenAI log search route
+@pre_authorized_cors_preflight
+@analytics_bp.route("/analytics/logs/search", methods=["GET"])
+def search_logs():
+    """
+    Search the OpenAI API logs, newest first (?function_name=&model=&status=&finish_reason=
+    &from=&to= ISO dates, &cursor= from the previous page, &limit=).
+    """
+    try:
+        start = request.args.get("from")
+        end = request.args.get("to")
+        cursor = request.args.get("cursor")
+        result = search_openai_logs(
+            function_name=request.args.get("function_name"),
+            model=request.args.get("model"),
+            status=request.args.get("status"),
+            finish_reason=request.args.get("finish_reason"),
+            start=datetime.fromisoformat(start) if start else None,
+            end=datetime.fromisoformat(end) if end else None,
+            cursor=int(cursor) if cursor else None,
+            limit=int(request.args.get("limit", 50))
+        )
+        return jsonify(result), 200
+    except ValueError as ve:
+        return jsonify({"error": f"Invalid parameter: {ve}"}), 400
+    except Exception as e:
+        logger.exception("search_logs_failed", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+# Define the per-stage latency route
+@pre_authorized_cors_preflight
+@analytics_bp.route("/analytics/stage-latency", methods=["GET"])
+def get_stage_latency():
+    """Get per-stage latency percentiles, optionally limited to a time range (?from=&to= ISO dates)."""
+    try:
+        start = request.args.get("from")
+        end = request.args.get("to")
+        start = datetime.fromisoformat(start) if start else None
+        end = datetime.fromisoformat(end) if end else None
+
+        stages = get_stage_latency_percentiles(start=start, end=end)
+        return jsonify({"stages": stages}), 200
+    except ValueError as ve:
+        return jsonify({"error": f"Invalid date: {ve}"}), 400
+    except Exception as e:
+        logger.exception("get_stage_latency_failed", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+# Define the time-series route
+@pre_authorized_cors_preflight
+@analytics_bp.route("/analytics/timeseries", methods=["GET"])
+def get_analytics_timeseries():
+    """
+    Get per-bucket requests, tokens, cost and latency percentiles
+    (?bucket=1h&from=&to= ISO dates &model=); long ranges are downsampled.
+    """
+    try:
+        start = request.args.get("from")
+        end = request.args.get("to")
+        result = get_timeseries(
+            bucket=request.args.get("bucket", "1h"),
+            start=datetime.fromisoformat(start) if start else None,
+            end=datetime.fromisoformat(end) if end else None,
+            model=request.args.get("model")
+        )
+        return jsonify(result), 200
+    except ValueError as ve:
+        return jsonify({"error": f"Invalid parameter: {ve}"}), 400
+    except Exception as e:
+        logger.exception("get_analytics_timeseries_failed", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
 # Define the analytics download route
 @pre_authorized_cors_preflight
 @analytics_bp.route("/analytics/download", methods=["GET"])
@@ -166,9 +247,7 @@ def download_report():
         )
 
     except Exception as e:
-        print("DEBUG: Exception encountered in download report:", e)
-        import traceback
-        traceback.print_exc()
+        logger.exception("download_report_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
     
 @pre_authorized_cors_preflight
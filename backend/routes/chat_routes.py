@@ -4,18 +4,39 @@
 from flask import Blueprint, request, jsonify
 from helpers.cors_helpers import pre_authorized_cors_preflight
 from services.chat_service import process_chat
+from services.metering_service import metered_request, estimate_chat_tokens, InsufficientCredits, UnknownUser
+from helpers.deadline import Deadline
+from helpers.admission_control import admission_controlled, rate_limited_response
+from helpers.wire_format import compress_response
+from config import Config
+from helpers.log_helpers import get_logger
+
+logger = get_logger("routes")
 
 # Blueprint for chat routes
 chat_bp = Blueprint("chat", __name__)
+# Chat responses carry the whole conversation history: compress them when the client accepts it
+chat_bp.after_request(compress_response)
+
+def estimate_request_tokens(req):
+    """Estimated LLM tokens of a chat request, for admission control."""
+    data = req.get_json(force=True, silent=True) or {}
+    conversation_history = data.get("conversation_history")
+    if not isinstance(conversation_history, list):
+        conversation_history = []
+    return estimate_chat_tokens(str(data.get("message", "")), conversation_history)
 
 # Define the chat route
 @pre_authorized_cors_preflight
 @chat_bp.route("/chat", methods=["POST"])
+@admission_controlled("chat", estimate_tokens=estimate_request_tokens)
 def chat():
     """Handle chat messages from users."""
+    # Start the request's time budget before any work is done
+    deadline = Deadline(Config.CHAT_DEADLINE_SECONDS)
     try:
         data = request.get_json(force=True)
-        print("DEBUG: Received request JSON:", data)
+        logger.debug("chat_request_received", body=data)
 
         if not data:
             return jsonify({"error": "Missing JSON body"}), 400
@@ -29,21 +50,42 @@ def chat():
         if not isinstance(conversation_history, list):
             return jsonify({"error": "Conversation history must be a list"}), 400
         
-        print("DEBUG: Initial conversation history:", conversation_history)
 
         # Process the chat message
-        result, status_code = process_chat(user_message, conversation_history)
-        return jsonify(result), status_code
+        if not Config.CREDIT_METERING_ENABLED:
+            result, status_code = process_chat(user_message, conversation_history, deadline=deadline)
+            return chat_response(result, status_code)
+
+        # Reserve the request's estimated tokens from the user's credits; the actual usage is settled afterwards
+        user_uuid = request.headers.get("userUUID")
+        if not user_uuid:
+            return jsonify({"error": "Missing userUUID header"}), 401
+        try:
+            with metered_request(user_uuid, estimate_chat_tokens(user_message, conversation_history)) as meter:
+                result, status_code = process_chat(user_message, conversation_history, user_id=meter.user_id, deadline=deadline)
+        except UnknownUser:
+            return jsonify({"error": "Unknown user"}), 401
+        except InsufficientCredits as e:
+            return jsonify({
+                "error": "Insufficient credits",
+                "credits_remaining": e.credits_remaining,
+                "credits_required": e.required
+            }), 402
+        return chat_response(result, status_code)
 
     except ValueError as ve:
-        print("DEBUG: Validation error:", str(ve))
+        logger.warning("chat_validation_error", error=str(ve))
         return jsonify({"error": str(ve)}), 400
     except Exception as e:
-        print("DEBUG: Exception encountered:", e)
-        import traceback
-        traceback.print_exc()
+        logger.exception("chat_request_failed", error=str(e))
         return jsonify({"error": "An unexpected error occurred. Please try again later."}), 500
 
+def chat_response(result, status_code):
+    """Serialize a process_chat result; upstream rate limits become 429 with Retry-After."""
+    if status_code == 429:
+        return rate_limited_response(result.get("retry_after", 1))
+    return jsonify(result), status_code
+
 # Define the tool call result route
 @pre_authorized_cors_preflight
 @chat_bp.route("/tool-call-result", methods=["POST"])
@@ -51,7 +93,7 @@ def tool_call_result():
     """Handle tool call results."""
     try:
         data = request.get_json(force=True)
-        print("DEBUG: Received tool call result request JSON:", data)
+        logger.debug("tool_call_result_received", body=data)
 
         if not data:
             return jsonify({"error": "Missing JSON body"}), 400
@@ -65,9 +107,7 @@ def tool_call_result():
         return 200
     
     except Exception as e:
-        print("DEBUG: Exception encountered in tool call result:", e)
-        import traceback
-        traceback.print_exc()
+        logger.exception("tool_call_result_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
 
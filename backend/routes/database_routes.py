@@ -5,6 +5,9 @@ from helpers.cors_helpers import pre_authorized_cors_preflight
 from services.data_service import get_all_data, search_data
 from database import db
 from sqlalchemy import text
+from helpers.log_helpers import get_logger
+
+logger = get_logger("routes")
 
 database_bp = Blueprint("database", __name__)
 
@@ -17,7 +20,7 @@ def get_inventory():
         result, status_code = get_all_data()
         return jsonify(result), status_code
     except Exception as e:
-        print(f"Error in get_data endpoint: {str(e)}")
+        logger.error("get_data_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @pre_authorized_cors_preflight
@@ -34,7 +37,7 @@ def search_cars_endpoint():
         result, status_code = search_data(data)
         return jsonify(result), status_code
     except Exception as e:
-        print(f"Error in search endpoint: {str(e)}")
+        logger.error("search_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
 
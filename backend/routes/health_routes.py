@@ -0,0 +1,19 @@
+# health_routes.py
+
+# Import necessary modules
+from flask import Blueprint, jsonify
+from helpers.health import readiness
+
+# Blueprint for the liveness and readiness probes (served outside /api)
+health_bp = Blueprint("health", __name__)
+
+@health_bp.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the worker is serving requests (no database or dependency calls)."""
+    return jsonify({"status": "ok"}), 200
+
+@health_bp.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness from the cached results of the background dependency probes."""
+    ready, probes = readiness()
+    return jsonify({"status": "ready" if ready else "not_ready", "probes": probes}), 200 if ready else 503
@@ -0,0 +1,15 @@
+# metrics_routes.py
+
+# Import necessary modules
+from flask import Blueprint, Response
+from helpers.metrics import render_metrics
+
+# Blueprint for metrics routes
+metrics_bp = Blueprint("metrics", __name__)
+
+# Define the Prometheus scrape route
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Expose the metrics of all workers in the Prometheus text format."""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
@@ -0,0 +1,109 @@
+# server/scripts/bench_startup.py
+
+"""
+Startup Benchmark
+-----------------
+Measures the cold start of the Flask app: each run imports app.py in a fresh
+interpreter (`python -X importtime`), optionally followed by the warmup that
+gunicorn runs before forking (helpers/warmup.py). Reports the median and worst
+time over the runs and the modules with the largest cumulative import time.
+
+Exits with status 1 when the median exceeds the budget
+(Config.STARTUP_BUDGET_SECONDS, or --budget), so it can gate CI and deploys.
+
+Usage (from the backend directory):
+    python -m scripts.bench_startup
+    python -m scripts.bench_startup --runs 5 --warmup --budget 2.5
+"""
+
+# Import necessary libraries
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from config import Config
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORTTIME_PATTERN = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$")
+
+# Timed in the child interpreter; the result is printed as the last line of stdout
+_CHILD_SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+if {warmup}:
+    from helpers.warmup import warmup
+    warmup()
+print(f"{{imported - start}} {{time.perf_counter() - start}}")
+"""
+
+
+def run_once(warmup):
+    """Cold-start one interpreter; returns (import seconds, total seconds, {module: cumulative us})."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD_SCRIPT.format(warmup=warmup)],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing the app failed:\n{result.stderr[-2000:]}")
+
+    import_seconds, total_seconds = (float(value) for value in result.stdout.strip().splitlines()[-1].split())
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_PATTERN.match(line)
+        if match:
+            modules[match.group(4)] = int(match.group(2))
+    return import_seconds, total_seconds, modules
+
+
+def top_level_imports(modules, limit):
+    """The top-level packages with the largest cumulative import time."""
+    packages = {}
+    for name, cumulative_us in modules.items():
+        package = name.split(".")[0]
+        if package == "app":
+            continue
+        packages[package] = max(packages.get(package, 0), cumulative_us)
+    ranked = sorted(packages.items(), key=lambda item: -item[1])[:limit]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for name, us in ranked]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cold start of the Flask app against a budget.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to start")
+    parser.add_argument("--warmup", action="store_true", help="Include helpers/warmup.py in the measured time")
+    parser.add_argument("--budget", type=float, default=Config.STARTUP_BUDGET_SECONDS,
+                        help="Largest accepted median cold start in seconds")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to report")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    runs = [run_once(args.warmup) for _ in range(args.runs)]
+    totals = [total for _, total, _ in runs]
+    median = statistics.median(totals)
+
+    print(json.dumps({
+        "runs": args.runs,
+        "warmup": args.warmup,
+        "budget_seconds": args.budget,
+        "import_median_seconds": round(statistics.median(imported for imported, _, _ in runs), 3),
+        "median_seconds": round(median, 3),
+        "max_seconds": round(max(totals), 3),
+        "slowest_imports": top_level_imports(runs[-1][2], args.top),
+        "within_budget": median <= args.budget
+    }, indent=2))
+    return 0 if median <= args.budget else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
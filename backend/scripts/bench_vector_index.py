@@ -0,0 +1,145 @@
+# server/scripts/bench_vector_index.py
+
+"""
+Vector Index Benchmark
+----------------------
+Measures the quantized index modes of helpers/vector_index.py against exact
+float32 search: first-pass memory, recall@10 and query latency.
+
+Data sources:
+- synthetic (default): clustered unit vectors, shaped like text embeddings
+- local: the vectors of a local index built by scripts/ingest_corpus.py
+- tags: the 3072-dim Tag.embeddings column (needs DATABASE_URL)
+
+Queries are dataset vectors with added noise. The script exits with status 1
+when a mode loses more recall@10 than Config.VECTOR_RECALL_TOLERANCE.
+
+Usage (from the backend directory):
+    python -m scripts.bench_vector_index
+    python -m scripts.bench_vector_index --count 50000 --dim 3072 --modes int8 binary
+    python -m scripts.bench_vector_index --source local --index-name 38-cfr-index
+"""
+
+# Import necessary libraries
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+from config import Config
+from helpers.vector_index import QuantizedVectorIndex, local_index_path
+
+TOP_K = 10
+
+
+def synthetic_vectors(count, dim, clusters, seed):
+    """Unit vectors drawn around random cluster centres."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, clusters, size=count)
+    vectors = centres[assignments] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def local_index_vectors(index_name):
+    index = QuantizedVectorIndex.load(local_index_path(index_name))
+    return np.asarray(index.vectors, dtype=np.float32)
+
+
+def tag_vectors():
+    from create_app import create_app
+    from database import db
+    from models.legacy_sql_models import Tag
+
+    app = create_app()
+    with app.app_context():
+        rows = db.session.query(Tag.embeddings).filter(Tag.embeddings.isnot(None)).all()
+    return np.array([row.embeddings for row in rows], dtype=np.float32)
+
+
+def make_queries(vectors, count, noise, seed):
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(vectors), size=count)
+    queries = vectors[picks] + noise * rng.standard_normal((count, vectors.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def bench_mode(mode, ids, vectors, queries, exact_results, rescore_factor, work_dir):
+    index = QuantizedVectorIndex.build(f"{work_dir}/{mode}", ids, vectors, mode=mode)
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, exact_results):
+        start = time.perf_counter()
+        matches = index.search(query, top_k=TOP_K, rescore_factor=rescore_factor)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len({match["id"] for match in matches} & set(expected))
+
+    memory = index.memory_bytes()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "recall_at_10": round(hits / (TOP_K * len(queries)), 4),
+        "resident_bytes": memory["resident"],
+        "memory_reduction": round(memory["full_precision"] / memory["resident"], 1),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark quantized vector index modes against exact search.")
+    parser.add_argument("--source", choices=["synthetic", "local", "tags"], default="synthetic")
+    parser.add_argument("--index-name", default="38-cfr-index", help="Local index to read (--source local)")
+    parser.add_argument("--count", type=int, default=20000, help="Synthetic vectors")
+    parser.add_argument("--dim", type=int, default=1536, help="Synthetic dimensions")
+    parser.add_argument("--clusters", type=int, default=200, help="Synthetic clusters")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="Noise added to the query vectors")
+    parser.add_argument("--modes", nargs="+", choices=["int8", "binary", "float32"], default=["int8", "binary"])
+    parser.add_argument("--rescore-factor", type=int, default=Config.VECTOR_RESCORE_FACTOR,
+                        help="Candidates rescored per result (default: per-mode)")
+    parser.add_argument("--tolerance", type=float, default=Config.VECTOR_RECALL_TOLERANCE,
+                        help="Largest accepted recall@10 loss versus exact search")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.source == "local":
+        vectors = local_index_vectors(args.index_name)
+    elif args.source == "tags":
+        vectors = tag_vectors()
+    else:
+        vectors = synthetic_vectors(args.count, args.dim, args.clusters, args.seed)
+    if len(vectors) < TOP_K:
+        print(f"Need at least {TOP_K} vectors, got {len(vectors)}", file=sys.stderr)
+        return 1
+
+    ids = [str(i) for i in range(len(vectors))]
+    queries = make_queries(vectors, args.queries, args.noise, args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="vector-bench-") as work_dir:
+        exact_index = QuantizedVectorIndex.build(f"{work_dir}/exact", ids, vectors, mode="float32")
+        exact_results = [exact_index.exact_search(query, top_k=TOP_K) for query in queries]
+        results = [
+            bench_mode(mode, ids, vectors, queries, exact_results, args.rescore_factor, work_dir)
+            for mode in args.modes
+        ]
+
+    failed = [result["mode"] for result in results if 1.0 - result["recall_at_10"] > args.tolerance]
+    print(json.dumps({
+        "source": args.source,
+        "vectors": len(vectors),
+        "dim": int(vectors.shape[1]),
+        "queries": len(queries),
+        "tolerance": args.tolerance,
+        "results": results,
+        "failed": failed
+    }, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# server/scripts/bench_wire_format.py
+
+"""
+Wire Format Benchmark
+---------------------
+Measures what a chat response costs on the wire in each format of
+helpers/wire_format.py. The payload is a representative /api/chat response:
+a conversation of several turns, each with a cfr_search result holding full
+38 CFR Part 3 sections from the corpus.
+
+For the standard library encoder (Flask's default), orjson and MessagePack it
+reports the median encode time and the size, then the size and time of gzip and
+brotli at the configured levels over the JSON body. Formats whose package is
+not installed are skipped.
+
+Usage (from the backend directory):
+    python -m scripts.bench_wire_format
+    python -m scripts.bench_wire_format --turns 8 --sections 4 --runs 50
+"""
+
+# Import necessary libraries
+import sys
+import json
+import time
+import gzip
+import argparse
+import statistics
+from config import Config
+from helpers import corpus_store
+from helpers.wire_format import orjson, msgpack, brotli, encode_msgpack
+
+
+def build_payload(turns, sections_per_turn):
+    """A chat response whose history carries `turns` tool results of full CFR sections."""
+    documents = list(corpus_store.get_documents("3").values())
+    if not documents:
+        raise RuntimeError("The 38 CFR Part 3 corpus is empty; the benchmark needs its section texts.")
+
+    history = []
+    for turn in range(turns):
+        start = turn * sections_per_turn
+        sections = [documents[(start + i) % len(documents)] for i in range(sections_per_turn)]
+        history.extend([
+            {"role": "user", "content": f"What does 38 CFR {sections[0].get('section_number', '')} require?"},
+            {"role": "assistant", "content": None,
+             "function_call": {"name": "cfr_search", "arguments": json.dumps({"query": "service connection"})}},
+            {"role": "function", "name": "cfr_search", "content": json.dumps(sections)},
+            {"role": "assistant", "content": "Under that section, a disability is service connected when ..."}
+        ])
+    return {"chat_response": history[-1]["content"], "conversation_history": history}
+
+
+def median_seconds(function, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def encoders():
+    """The available encoders, as the app would send the body."""
+    found = {"json": lambda obj: json.dumps(obj, separators=(",", ":"), sort_keys=True).encode()}
+    if orjson is not None:
+        found["orjson"] = lambda obj: orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    if msgpack is not None:
+        found["msgpack"] = encode_msgpack
+    return found
+
+
+def compressors():
+    found = {"gzip": lambda data: gzip.compress(data, compresslevel=Config.COMPRESSION_GZIP_LEVEL)}
+    if brotli is not None:
+        found["br"] = lambda data: brotli.compress(data, quality=Config.COMPRESSION_BROTLI_QUALITY)
+    return found
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare encodings and compression of a chat response.")
+    parser.add_argument("--turns", type=int, default=6, help="Conversation turns with a tool result")
+    parser.add_argument("--sections", type=int, default=3, help="CFR sections per tool result")
+    parser.add_argument("--runs", type=int, default=30, help="Timed runs per measurement")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    payload = build_payload(args.turns, args.sections)
+
+    encodings = {}
+    bodies = {}
+    for name, encode in encoders().items():
+        bodies[name] = encode(payload)
+        encodings[name] = {
+            "bytes": len(bodies[name]),
+            "encode_ms": round(median_seconds(lambda: encode(payload), args.runs) * 1000, 3)
+        }
+
+    compression = {}
+    for name, compress in compressors().items():
+        compressed = compress(bodies["json"])
+        compression[name] = {
+            "bytes": len(compressed),
+            "ratio": round(len(compressed) / len(bodies["json"]), 3),
+            "compress_ms": round(median_seconds(lambda: compress(bodies["json"]), args.runs) * 1000, 3)
+        }
+
+    print(json.dumps({
+        "turns": args.turns,
+        "sections_per_turn": args.sections,
+        "runs": args.runs,
+        "encodings": encodings,
+        "compression": compression
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,431 @@
+# server/scripts/ingest_corpus.py
+
+"""
+Corpus Ingestion
+----------------
+Builds the `38-cfr-index` and `m21-index` vectors from the corpus files in
+Config.CORPUS_DIR (see helpers/corpus_store.py).
+
+- Every document is split into chunks and each chunk is hashed together with
+  the embedding model. Only chunks whose hash is not in the manifest are embedded.
+- Embeddings are requested in batches (hundreds of inputs per call) from a few
+  concurrent workers, paced by a tokens-per-minute budget; 429/5xx responses are
+  retried with backoff by the shared OpenAI client (helpers/clients.py).
+- Vectors are upserted in bulk. Vectors of chunks that no longer exist are deleted.
+- The manifest (Config.INGEST_MANIFEST_PATH) records {vector id: hash} per index
+  and is saved as batches complete, so an interrupted run resumes where it stopped.
+- With `--backend local` the vectors are written to a quantized in-process index
+  (helpers/vector_index.py) instead of Pinecone. The index keeps each vector's
+  hash, so unchanged chunks reuse their stored vectors and only changes are embedded.
+
+Vector metadata carries the same section/article fields the search tools already
+use, so results resolve to their text through the corpus store.
+
+Usage (from the backend directory):
+    python -m scripts.ingest_corpus                 # incremental run for all indexes
+    python -m scripts.ingest_corpus --dry-run       # show what would be embedded
+    python -m scripts.ingest_corpus --index m21-index --concurrency 2
+    python -m scripts.ingest_corpus --rebuild       # clear the indexes and re-embed everything
+    python -m scripts.ingest_corpus --backend local --mode binary
+"""
+
+# Import necessary libraries
+import os
+import re
+import sys
+import shutil
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import Config
+from helpers import corpus_store
+from helpers.clients import create_embedding, get_pinecone_index, call_with_retries
+from helpers.rate_limiter import RateLimiter
+from helpers.log_helpers import get_logger
+
+logger = get_logger("ingest")
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# USD per 1M input tokens, used for the cost estimate only
+EMBEDDING_PRICE_PER_MILLION = 0.02
+
+# ~1,500 tokens per chunk keeps chunks well under the embedding model's input limit
+CHUNK_CHARS = 6000
+CHUNK_OVERLAP_CHARS = 400
+# OpenAI accepts up to 2,048 inputs and 300k tokens per embeddings request
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 250_000
+# Pinecone recommends upserts of about 100 vectors and deletes of at most 1,000 ids
+UPSERT_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+
+MANIFEST_VERSION = 1
+
+###############################################################################
+# 1. CHUNKING
+###############################################################################
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) used for batching and pacing."""
+    return max(1, len(text) // 4)
+
+
+def _split_long_paragraph(paragraph: str, max_chars: int) -> list:
+    """Split a paragraph longer than max_chars on sentence boundaries (or hard, as a last resort)."""
+    pieces = []
+    current = ""
+    for sentence in re.split(r"(?<=[.;:])\s+", paragraph):
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_CHARS, overlap_chars: int = CHUNK_OVERLAP_CHARS) -> list:
+    """
+    Split text into chunks of at most max_chars, packing whole paragraphs where possible.
+    Each chunk after the first starts with the tail of the previous one for context.
+    """
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > max_chars - overlap_chars:
+            pieces.extend(_split_long_paragraph(paragraph, max_chars - overlap_chars))
+        else:
+            pieces.append(paragraph)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = current[-overlap_chars:] + "\n\n" + piece if overlap_chars else piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _vector_metadata(document: dict, entry: dict, chunk_index: int) -> dict:
+    """Pinecone metadata: the document's scalar metadata fields plus the chunk position."""
+    metadata = {
+        key: value
+        for key, value in document.get("metadata", {}).items()
+        if isinstance(value, (str, int, float, bool)) and value != ""
+    }
+    if document.get("title"):
+        metadata.setdefault("title", document["title"])
+    metadata["source"] = entry["source"]
+    metadata["chunk_index"] = chunk_index
+    return metadata
+
+
+def build_chunks(index_names=None) -> tuple:
+    """
+    Chunk every corpus file feeding the selected indexes.
+    Returns ({index name: [chunk, ...]}, set of sources whose file was loaded).
+    """
+    chunks_by_index = {}
+    loaded_sources = set()
+    for entry in corpus_store.CORPUS_FILES:
+        if index_names and entry["index_name"] not in index_names:
+            continue
+        documents = corpus_store.load_corpus_file(entry["file_name"])
+        if not documents:
+            continue
+        loaded_sources.add(entry["source"])
+        index_chunks = chunks_by_index.setdefault(entry["index_name"], [])
+
+        for document in documents:
+            doc_id = document.get("metadata", {}).get(entry["id_field"])
+            if not doc_id:
+                continue
+            heading = document.get("title") or document.get("metadata", {}).get("section_title") or ""
+            for chunk_index, text in enumerate(chunk_text(document.get("text", ""))):
+                embedding_input = f"{doc_id} {heading}\n\n{text}".strip()
+                content_hash = hashlib.sha256(
+                    f"{EMBEDDING_MODEL}\n{embedding_input}".encode("utf-8")
+                ).hexdigest()
+                index_chunks.append({
+                    "id": f"{entry['source']}:{doc_id}:{chunk_index}",
+                    "input": embedding_input,
+                    "hash": content_hash,
+                    "metadata": _vector_metadata(document, entry, chunk_index)
+                })
+    return chunks_by_index, loaded_sources
+
+###############################################################################
+# 2. MANIFEST
+###############################################################################
+
+def load_manifest(path: str) -> dict:
+    """Load the manifest; a missing manifest or one for another model starts empty."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = None
+    if not manifest or manifest.get("version") != MANIFEST_VERSION or manifest.get("embedding_model") != EMBEDDING_MODEL:
+        manifest = {"version": MANIFEST_VERSION, "embedding_model": EMBEDDING_MODEL, "indexes": {}}
+    return manifest
+
+
+def save_manifest(path: str, manifest: dict):
+    """Write the manifest atomically."""
+    manifest["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+###############################################################################
+# 3. EMBEDDING & UPSERT
+###############################################################################
+
+def make_batches(chunks: list, max_inputs: int, max_tokens: int = MAX_BATCH_TOKENS) -> list:
+    """Group chunks into embedding requests bounded by input count and estimated tokens."""
+    batches = []
+    current, current_tokens = [], 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk["input"])
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(chunk)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def embed_batch(batch: list, rate_limiter: RateLimiter) -> tuple:
+    """Embed one batch; returns (vectors in batch order, tokens used)."""
+    rate_limiter.acquire(sum(estimate_tokens(chunk["input"]) for chunk in batch))
+    response = create_embedding(model=EMBEDDING_MODEL, input=[chunk["input"] for chunk in batch])
+    vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    return vectors, response.usage.total_tokens
+
+
+def upsert_vectors(index_name: str, vectors: list):
+    """Upsert (id, values, metadata) dicts in bulk."""
+    index = get_pinecone_index(index_name)
+    for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+        call_with_retries("pinecone", index.upsert, vectors=vectors[start:start + UPSERT_BATCH_SIZE])
+
+
+def delete_vectors(index_name: str, vector_ids: list):
+    index = get_pinecone_index(index_name)
+    for start in range(0, len(vector_ids), DELETE_BATCH_SIZE):
+        call_with_retries("pinecone", index.delete, ids=vector_ids[start:start + DELETE_BATCH_SIZE])
+
+###############################################################################
+# 4. INGESTION
+###############################################################################
+
+def ingest_index(index_name, chunks, loaded_sources, manifest, manifest_path, args, rate_limiter) -> dict:
+    """Bring one index up to date with its chunks; returns run statistics."""
+    indexed = manifest["indexes"].setdefault(index_name, {})
+    current_ids = {chunk["id"] for chunk in chunks}
+    changed = [chunk for chunk in chunks if indexed.get(chunk["id"]) != chunk["hash"]]
+    # Only prune vectors of sources that were loaded, so a missing file never empties the index
+    stale_ids = sorted(
+        vector_id for vector_id in indexed
+        if vector_id not in current_ids and vector_id.split(":", 1)[0] in loaded_sources
+    )
+    estimated_tokens = sum(estimate_tokens(chunk["input"]) for chunk in changed)
+    stats = {
+        "index": index_name,
+        "chunks": len(chunks),
+        "unchanged": len(chunks) - len(changed),
+        "to_embed": len(changed),
+        "to_delete": len(stale_ids),
+        "estimated_tokens": estimated_tokens,
+        "estimated_cost_usd": round(estimated_tokens * EMBEDDING_PRICE_PER_MILLION / 1_000_000, 4),
+        "embedded": 0,
+        "tokens_used": 0
+    }
+    if args.dry_run:
+        return stats
+
+    manifest_lock = threading.Lock()
+
+    def process(batch):
+        vectors, tokens_used = embed_batch(batch, rate_limiter)
+        upsert_vectors(index_name, [
+            {"id": chunk["id"], "values": values, "metadata": chunk["metadata"]}
+            for chunk, values in zip(batch, vectors)
+        ])
+        with manifest_lock:
+            for chunk in batch:
+                indexed[chunk["id"]] = chunk["hash"]
+            stats["embedded"] += len(batch)
+            stats["tokens_used"] += tokens_used
+            save_manifest(manifest_path, manifest)
+        logger.info("ingest_batch_completed", index=index_name, inputs=len(batch), tokens=tokens_used,
+                    progress=f"{stats['embedded']}/{len(changed)}")
+
+    batches = make_batches(changed, args.batch_size)
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="ingest") as executor:
+        futures = [executor.submit(process, batch) for batch in batches]
+        for future in as_completed(futures):
+            future.result()
+
+    if stale_ids:
+        delete_vectors(index_name, stale_ids)
+        for vector_id in stale_ids:
+            indexed.pop(vector_id, None)
+        save_manifest(manifest_path, manifest)
+    return stats
+
+
+def ingest_local_index(index_name, chunks, loaded_sources, args, rate_limiter) -> dict:
+    """Rebuild a local quantized index, embedding only chunks whose hash changed."""
+    import numpy as np
+    from helpers.vector_index import QuantizedVectorIndex, local_index_path
+
+    path = local_index_path(index_name)
+    existing = None
+    if not args.rebuild and os.path.exists(os.path.join(path, "index.json")):
+        existing = QuantizedVectorIndex.load(path)
+
+    current_ids = {chunk["id"] for chunk in chunks}
+    changed = [
+        chunk for chunk in chunks
+        if existing is None or existing.get_hash(chunk["id"]) != chunk["hash"]
+    ]
+    # Vectors of sources whose file was not loaded are carried over untouched
+    kept_positions = []
+    stale_count = 0
+    if existing is not None:
+        for position, vector_id in enumerate(existing.ids):
+            if vector_id in current_ids:
+                continue
+            if vector_id.split(":", 1)[0] in loaded_sources:
+                stale_count += 1
+            else:
+                kept_positions.append(position)
+
+    estimated_tokens = sum(estimate_tokens(chunk["input"]) for chunk in changed)
+    stats = {
+        "index": index_name,
+        "backend": "local",
+        "mode": args.mode,
+        "chunks": len(chunks),
+        "unchanged": len(chunks) - len(changed),
+        "to_embed": len(changed),
+        "to_delete": stale_count,
+        "estimated_tokens": estimated_tokens,
+        "estimated_cost_usd": round(estimated_tokens * EMBEDDING_PRICE_PER_MILLION / 1_000_000, 4),
+        "embedded": 0,
+        "tokens_used": 0
+    }
+    if args.dry_run:
+        return stats
+
+    embedded = {}
+    batches = make_batches(changed, args.batch_size)
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="ingest") as executor:
+        futures = {executor.submit(embed_batch, batch, rate_limiter): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            vectors, tokens_used = future.result()
+            for chunk, values in zip(batch, vectors):
+                embedded[chunk["id"]] = values
+            stats["embedded"] += len(batch)
+            stats["tokens_used"] += tokens_used
+            logger.info("ingest_batch_completed", index=index_name, inputs=len(batch), tokens=tokens_used,
+                        progress=f"{stats['embedded']}/{len(changed)}")
+
+    ids = [chunk["id"] for chunk in chunks] + [existing.ids[p] for p in kept_positions]
+    metadata = [chunk["metadata"] for chunk in chunks] + [existing.metadata[p] for p in kept_positions]
+    hashes = [chunk["hash"] for chunk in chunks] + [existing.hashes[p] for p in kept_positions]
+    vectors = np.array(
+        [embedded[chunk["id"]] if chunk["id"] in embedded else existing.get_vector(chunk["id"]) for chunk in chunks]
+        + [existing.vectors[p] for p in kept_positions],
+        dtype=np.float32
+    )
+
+    # Build next to the live index and swap it in; workers reload it when they see the new index.json
+    building_path = f"{path}.building"
+    shutil.rmtree(building_path, ignore_errors=True)
+    QuantizedVectorIndex.build(building_path, ids, vectors, metadata=metadata, hashes=hashes, mode=args.mode)
+    if os.path.exists(path):
+        old_path = f"{path}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(path, old_path)
+        os.replace(building_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    else:
+        os.replace(building_path, path)
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Embed the corpus into the vector indexes (incrementally).")
+    parser.add_argument("--index", action="append", choices=[corpus_store.INDEX_NAME_CFR, corpus_store.INDEX_NAME_M21],
+                        help="Index to build (repeatable; default: all)")
+    parser.add_argument("--backend", choices=["pinecone", "local"], default=Config.VECTOR_BACKEND,
+                        help="Vector backend to write to (default: Config.VECTOR_BACKEND)")
+    parser.add_argument("--mode", choices=["int8", "binary", "float32"], default=Config.VECTOR_INDEX_MODE,
+                        help="Quantization of local indexes")
+    parser.add_argument("--manifest", default=Config.INGEST_MANIFEST_PATH, help="Path of the ingestion manifest (Pinecone)")
+    parser.add_argument("--batch-size", type=int, default=512, help="Inputs per embeddings request")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent embeddings requests")
+    parser.add_argument("--tokens-per-minute", type=int, default=1_000_000, help="Embedding token budget per minute")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be embedded and deleted")
+    parser.add_argument("--rebuild", action="store_true", help="Delete all vectors in the selected indexes and re-embed")
+    args = parser.parse_args(argv)
+    args.batch_size = max(1, min(args.batch_size, MAX_BATCH_INPUTS))
+    args.concurrency = max(1, args.concurrency)
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    start = time.perf_counter()
+    chunks_by_index, loaded_sources = build_chunks(args.index)
+    if not chunks_by_index:
+        logger.error("ingest_no_corpus", corpus_dir=Config.CORPUS_DIR)
+        return 1
+
+    manifest = load_manifest(args.manifest)
+    rate_limiter = RateLimiter(args.tokens_per_minute)
+
+    results = []
+    for index_name, chunks in chunks_by_index.items():
+        if args.backend == "local":
+            results.append(ingest_local_index(index_name, chunks, loaded_sources, args, rate_limiter))
+            continue
+        if args.rebuild and not args.dry_run:
+            call_with_retries("pinecone", get_pinecone_index(index_name).delete, delete_all=True)
+            manifest["indexes"][index_name] = {}
+            save_manifest(args.manifest, manifest)
+        results.append(ingest_index(index_name, chunks, loaded_sources, manifest, args.manifest, args, rate_limiter))
+
+    print(json.dumps({
+        "dry_run": args.dry_run,
+        "elapsed_seconds": round(time.perf_counter() - start, 2),
+        "indexes": results
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
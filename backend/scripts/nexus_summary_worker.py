@@ -0,0 +1,42 @@
+# server/scripts/nexus_summary_worker.py
+
+"""
+Nexus Summary Worker
+--------------------
+Background process that recomputes stale NexusSummary rows
+(services/nexus_summary_service.py). Run as many copies as needed; rows are
+leased with SKIP LOCKED, so workers never process the same row at once.
+
+Usage (from the backend directory):
+    python -m scripts.nexus_summary_worker            # run until SIGTERM/SIGINT
+    python -m scripts.nexus_summary_worker --once     # drain the queue and exit
+"""
+
+# Import necessary libraries
+import sys
+import signal
+import argparse
+from config import Config
+from services.nexus_summary_service import run_worker, stop_worker
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute stale nexus summaries.")
+    parser.add_argument("--batch-size", type=int, default=Config.NEXUS_WORKER_BATCH_SIZE, help="Rows claimed per batch")
+    parser.add_argument("--poll-interval", type=float, default=Config.NEXUS_WORKER_POLL_SECONDS,
+                        help="Seconds to wait when the queue is empty")
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # Finish the current batch on shutdown instead of abandoning its LLM calls
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_worker())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_worker())
+    run_worker(batch_size=args.batch_size, poll_interval=args.poll_interval, once=args.once)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
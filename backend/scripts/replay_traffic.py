@@ -0,0 +1,497 @@
+# server/scripts/replay_traffic.py
+
+"""
+Traffic Replay
+--------------
+Re-drives process_chat with recorded production conversations, against a
+local stub of the OpenAI API, to benchmark a code change offline on real
+traffic shapes (conversation lengths, tool calls, model latencies).
+
+- record: turns successful OpenAIAPILog rows into a cassette (a JSON file).
+  Each entry holds the conversation the request was made with, the tool call
+  and its result (if any), and one recorded completion per OpenAI call of the
+  turn: the function call that asked for the tool and the final answer. The
+  latency of each call comes from the request's chat spans.
+  Logs only keep the final completion. The function-call completion is
+  therefore rebuilt from the logged tool call, and its usage is estimated.
+  Older logs do not record the tool arguments. Search tools then get the user
+  message as their query.
+- run: serves the cassette from a stub OpenAI server on localhost, waiting the
+  recorded latency of each call (times --latency-scale). It points the backend
+  at the stub through Config.OPENAI_BASE_URL and replays every conversation
+  through process_chat, optionally several at a time. Every OpenAI call of a
+  replayed turn carries the conversation's log id in a header. Within the
+  conversation, completions are matched by the turn's last user message and the
+  number of tool results after it. That makes matching independent of the
+  system prompt, the time context and the model the router picks, and keeps
+  conversations with the same message ("hi") apart. `record` reports how many
+  message keys are shared by several conversations; only requests without the
+  header (none from process_chat) depend on them. As in production, identical
+  completion requests that are in flight together are coalesced
+  (completion_flight), so they share one recorded answer.
+  Recorded search results are put in the in-process tool cache, so cfr_search
+  and m21_search never reach OpenAI embeddings or Pinecone. A search without a
+  recorded result returns a placeholder and is counted as a tool miss. The
+  other tools run for real when their arguments were recorded.
+
+The report gives the replay latency percentiles next to the recorded ones,
+and counts statuses, stub misses and tool misses. With --baseline (the saved
+report of an earlier run), the run fails when p50 or p95 latency regressed by
+more than --max-regression.
+
+process_chat stores its logs and analytics as usual, so run the replay with
+DATABASE_URL pointing at a scratch database, not at production.
+
+Usage (from the backend directory):
+    python -m scripts.replay_traffic record --out replay/cassette.json --limit 500 --since 2026-10-01
+    python -m scripts.replay_traffic run replay/cassette.json --concurrency 4 --save replay/before.json
+    python -m scripts.replay_traffic run replay/cassette.json --concurrency 4 --baseline replay/before.json
+"""
+
+# Import necessary libraries
+import sys
+import copy
+import json
+import time
+import argparse
+import threading
+import contextvars
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+from helpers.singleflight import make_key
+
+CASSETTE_VERSION = 1
+
+# Tools that call OpenAI embeddings and Pinecone; never run during a replay
+SEARCH_TOOLS = ("cfr_search", "m21_search")
+
+# Request header naming the conversation (log id) an OpenAI call is replayed for
+REPLAY_HEADER = "X-Replay-Log-Id"
+
+###############################################################################
+# 1. CASSETTES
+###############################################################################
+
+def _last_user_index(messages):
+    return max((i for i, message in enumerate(messages) if message.get("role") == "user"), default=None)
+
+
+def interaction_key(messages):
+    """
+    Identify a completion call of a turn by the last user message and the number
+    of tool results after it (not by the system prompt, time context or model).
+    """
+    last_user = _last_user_index(messages)
+    if last_user is None:
+        return None
+    tool_results = sum(1 for message in messages[last_user + 1:] if message.get("role") == "function")
+    return make_key(messages[last_user].get("content"), tool_results)
+
+
+def _call_latencies(spans, total_ms, calls):
+    """Recorded milliseconds of the first and second completion calls."""
+    durations = {}
+    for span in spans:
+        durations[span.name] = durations.get(span.name, 0) + span.duration_ms
+    fallback = total_ms / calls
+    return durations.get("llm_call_1", fallback), durations.get("llm_call_2", fallback)
+
+
+def _function_call_completion(final, name, arguments, result):
+    """The completion that asked for the tool (not logged), rebuilt from the final one."""
+    usage = final.get("usage") or {}
+    # The final prompt also contains the tool result (about 4 characters per token)
+    prompt_tokens = max(1, (usage.get("prompt_tokens") or 0) - len(result or "") // 4)
+    completion_tokens = len(json.dumps(arguments)) // 4 + 5
+    return {
+        "id": f"{final.get('id', 'replay')}-function-call",
+        "object": "chat.completion",
+        "created": final.get("created", 0),
+        "model": final.get("model"),
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": None,
+                "function_call": {"name": name, "arguments": json.dumps(arguments)}
+            },
+            "finish_reason": "function_call",
+            "logprobs": None
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+def cassette_entry(log, spans):
+    """One replayable conversation from a successful log row, or None."""
+    payload = log.request_payload or {}
+    messages = payload.get("messages") or []
+    final = log.response_json
+    last_user = _last_user_index(messages)
+    if not isinstance(final, dict) or not final.get("choices") or last_user is None:
+        return None
+
+    history = messages[:last_user + 1]
+    user_message = log.request_prompt or history[-1].get("content")
+    total_ms = (log.response_received_at - log.request_sent_at).total_seconds() * 1000
+    function_message = next((m for m in messages[last_user + 1:] if m.get("role") == "function"), None)
+
+    if function_message is None:
+        first_ms, _ = _call_latencies(spans, total_ms, 1)
+        tool_call = None
+        interactions = [{"key": interaction_key(history), "latency_ms": first_ms, "response": final}]
+    else:
+        first_ms, second_ms = _call_latencies(spans, total_ms, 2)
+        name = function_message.get("name")
+        recorded = payload.get("function_call") or {}
+        arguments = recorded.get("arguments") if recorded.get("name") == name else None
+        tool_call = {
+            "name": name,
+            "arguments_recorded": arguments is not None,
+            "arguments": arguments if arguments is not None else (
+                {"query": user_message} if name in SEARCH_TOOLS else {"replay_log_id": log.id}
+            ),
+            "result": function_message.get("content")
+        }
+        interactions = [
+            {
+                "key": interaction_key(history),
+                "latency_ms": first_ms,
+                "response": _function_call_completion(final, name, tool_call["arguments"], tool_call["result"])
+            },
+            {"key": interaction_key(history + [function_message]), "latency_ms": second_ms, "response": final}
+        ]
+
+    return {
+        "log_id": log.id,
+        "recorded_at": log.request_sent_at.isoformat(),
+        "user_message": user_message,
+        "history": history,
+        "tool_call": tool_call,
+        "interactions": interactions,
+        "recorded_latency_ms": total_ms
+    }
+
+
+def record_cassette(limit, since=None, until=None):
+    """Build a cassette from the most recent successful logs (oldest first)."""
+    from database.session import ScopedSession
+    from models.sql_models import OpenAIAPILog, ChatSpan
+
+    query = ScopedSession.query(OpenAIAPILog).filter(OpenAIAPILog.status == "success")
+    if since:
+        query = query.filter(OpenAIAPILog.request_sent_at >= since)
+    if until:
+        query = query.filter(OpenAIAPILog.request_sent_at < until)
+    logs = list(reversed(query.order_by(OpenAIAPILog.id.desc()).limit(limit).all()))
+
+    spans = {}
+    if logs:
+        for span in ScopedSession.query(ChatSpan).filter(ChatSpan.log_id.in_([log.id for log in logs])):
+            spans.setdefault(span.log_id, []).append(span)
+
+    conversations = [entry for entry in (cassette_entry(log, spans.get(log.id, [])) for log in logs) if entry]
+    return {
+        "version": CASSETTE_VERSION,
+        "recorded_at": datetime.utcnow().isoformat(),
+        "skipped_logs": len(logs) - len(conversations),
+        "key_collisions": key_collisions(conversations),
+        "conversations": conversations
+    }
+
+
+def key_collisions(conversations):
+    """Message keys used by more than one conversation, with the log ids that share them."""
+    log_ids = {}
+    for conversation in conversations:
+        for interaction in conversation["interactions"]:
+            log_ids.setdefault(interaction["key"], set()).add(conversation["log_id"])
+    return {key: sorted(ids) for key, ids in log_ids.items() if len(ids) > 1}
+
+###############################################################################
+# 2. STUB OPENAI SERVER
+###############################################################################
+
+class StubOpenAIServer:
+    """Serves recorded chat completions on localhost with their recorded latency."""
+
+    def __init__(self, cassette, latency_scale=1.0, host="127.0.0.1", port=0):
+        # By (log id, message key); untagged requests fall back to the message key alone
+        self.interactions = {}
+        self.by_key = {}
+        for conversation in cassette["conversations"]:
+            for interaction in conversation["interactions"]:
+                self.interactions[(str(conversation["log_id"]), interaction["key"])] = interaction
+                self.by_key.setdefault(interaction["key"], []).append(interaction)
+        self.latency_scale = latency_scale
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def find(self, log_id, messages):
+        key = interaction_key(messages)
+        if log_id is not None:
+            return self.interactions.get((log_id, key))
+        candidates = self.by_key.get(key) or []
+        if len(candidates) > 1:
+            self.count("untagged_ambiguous")
+        return candidates[0] if candidates else None
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real API, so the client's pool is exercised
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                interaction = None
+                if self.path.rstrip("/").endswith("/chat/completions"):
+                    interaction = stub.find(self.headers.get(REPLAY_HEADER), body.get("messages") or [])
+                if interaction is None:
+                    stub.count("misses")
+                    self._send(404, {"error": {"message": "No recorded completion for this request",
+                                               "type": "replay_miss", "code": None}})
+                    return
+                stub.count("hits")
+                time.sleep(interaction["latency_ms"] / 1000 * stub.latency_scale)
+                # Answer as the model that was asked for (routing may differ from the recording)
+                self._send(200, {**interaction["response"], "model": body.get("model") or interaction["response"].get("model")})
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+###############################################################################
+# 3. REPLAY
+###############################################################################
+
+_tool_misses = Counter()
+_tool_misses_lock = threading.Lock()
+
+# Log id of the conversation being replayed; copied into hedge and speculation threads with the context
+_replay_log_id = contextvars.ContextVar("replay_log_id", default=None)
+
+
+def configure_replay(stub, cassette):
+    """Point the backend at the stub, tag its calls by conversation and keep the search tools off the network."""
+    from helpers import clients
+    from helpers.clients import reset_clients
+    from services import chat_service
+
+    Config.OPENAI_BASE_URL = stub.base_url
+    Config.OPENAI_API_KEY = Config.OPENAI_API_KEY or "replay"
+    # Recorded tool results are served from the in-process tier only
+    Config.TOOL_CACHE_ENABLED = True
+    Config.TOOL_CACHE_DB_ENABLED = False
+    prefilled = {conversation["tool_call"]["name"] for conversation in cassette["conversations"]
+                 if conversation["tool_call"]}
+    Config.TOOL_CACHE_TOOLS = sorted(set(Config.TOOL_CACHE_TOOLS) | set(SEARCH_TOOLS) | prefilled)
+    reset_clients()
+
+    get_openai_client = clients.get_openai_client
+
+    def tagged_openai_client():
+        client = get_openai_client()
+        log_id = _replay_log_id.get()
+        if log_id is None:
+            return client
+        return client.with_options(default_headers={REPLAY_HEADER: str(log_id)})
+
+    clients.get_openai_client = tagged_openai_client
+
+    run_tool = chat_service.run_tool
+
+    def replay_run_tool(function_name, function_args, deadline=None):
+        if function_name in SEARCH_TOOLS:
+            with _tool_misses_lock:
+                _tool_misses[function_name] += 1
+            return f"[replay] No recorded result for this {function_name} call."
+        return run_tool(function_name, function_args, deadline=deadline)
+
+    chat_service.run_tool = replay_run_tool
+
+
+def prefill_tool_cache(conversation):
+    """Put the recorded tool result where the tool call (and a speculative search) will look for it."""
+    from helpers.tool_cache import memory_tier, make_cache_key
+
+    tool_call = conversation["tool_call"]
+    if tool_call is None or not isinstance(tool_call["result"], str):
+        return
+    if tool_call["name"] in SEARCH_TOOLS:
+        for arguments in (tool_call["arguments"], {"query": conversation["user_message"]}):
+            memory_tier.set(make_cache_key(tool_call["name"], arguments), tool_call["result"])
+    elif not tool_call["arguments_recorded"]:
+        memory_tier.set(make_cache_key(tool_call["name"], tool_call["arguments"]), tool_call["result"])
+
+
+def replay_conversation(conversation):
+    """Run one recorded turn through process_chat; returns its outcome."""
+    from services.chat_service import process_chat
+    from database.session import ScopedSession
+
+    prefill_tool_cache(conversation)
+    token = _replay_log_id.set(conversation["log_id"])
+    start = time.perf_counter()
+    try:
+        _, status_code = process_chat(conversation["user_message"], copy.deepcopy(conversation["history"]))
+        status = str(status_code)
+    except Exception as e:
+        status = type(e).__name__
+    finally:
+        _replay_log_id.reset(token)
+        ScopedSession.remove()
+    return {
+        "log_id": conversation["log_id"],
+        "status": status,
+        "latency_ms": (time.perf_counter() - start) * 1000,
+        "recorded_latency_ms": conversation["recorded_latency_ms"]
+    }
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda q: round(values[min(len(values) - 1, int(round(q * (len(values) - 1))))], 1)
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1], 1)}
+
+
+def run_replay(cassette, concurrency=1, latency_scale=1.0):
+    """Replay every conversation of the cassette; returns the report."""
+    stub = StubOpenAIServer(cassette, latency_scale=latency_scale).start()
+    try:
+        configure_replay(stub, cassette)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as executor:
+            results = list(executor.map(replay_conversation, cassette["conversations"]))
+        wall_seconds = time.perf_counter() - start
+    finally:
+        stub.stop()
+
+    return {
+        "conversations": len(results),
+        "concurrency": concurrency,
+        "latency_scale": latency_scale,
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_per_second": round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        "statuses": dict(Counter(result["status"] for result in results)),
+        "latency_ms": percentiles([result["latency_ms"] for result in results]),
+        "recorded_latency_ms": percentiles([result["recorded_latency_ms"] * latency_scale for result in results]),
+        "stub": dict(stub.stats),
+        "tool_misses": dict(_tool_misses),
+        "results": results
+    }
+
+
+def regressions(report, baseline, max_regression):
+    """Latency percentiles that got worse than the baseline by more than max_regression."""
+    found = []
+    for key in ("p50", "p95"):
+        before, after = baseline["latency_ms"].get(key), report["latency_ms"].get(key)
+        if before and after and after > before * (1 + max_regression):
+            found.append({"percentile": key, "baseline_ms": before, "replay_ms": after,
+                          "change": round(after / before - 1, 3)})
+    return found
+
+###############################################################################
+# 4. CLI
+###############################################################################
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Record and replay logged OpenAI traffic through process_chat.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="Build a cassette from the OpenAI API logs")
+    record.add_argument("--out", required=True, help="Cassette file to write")
+    record.add_argument("--limit", type=int, default=200, help="Most recent successful logs to record")
+    record.add_argument("--since", type=datetime.fromisoformat, help="Only logs from this time (ISO)")
+    record.add_argument("--until", type=datetime.fromisoformat, help="Only logs before this time (ISO)")
+
+    run = commands.add_parser("run", help="Replay a cassette against the stub OpenAI server")
+    run.add_argument("cassette", help="Cassette file written by `record`")
+    run.add_argument("--concurrency", type=int, default=1, help="Conversations replayed at a time")
+    run.add_argument("--latency-scale", type=float, default=1.0,
+                     help="Multiplier for the recorded OpenAI latencies (0 for no waiting)")
+    run.add_argument("--limit", type=int, help="Replay only the first N conversations")
+    run.add_argument("--save", help="Write the report (for use as a later --baseline)")
+    run.add_argument("--baseline", help="Report of an earlier run to compare against")
+    run.add_argument("--max-regression", type=float, default=0.10,
+                     help="Accepted relative increase of p50/p95 latency over the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    if args.command == "record":
+        cassette = record_cassette(args.limit, since=args.since, until=args.until)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(cassette, f)
+        print(json.dumps({"out": args.out, "conversations": len(cassette["conversations"]),
+                          "skipped_logs": cassette["skipped_logs"],
+                          "key_collisions": len(cassette["key_collisions"])}, indent=2))
+        if cassette["key_collisions"]:
+            print(f"{len(cassette['key_collisions'])} message keys are shared by several conversations; "
+                  f"replayed calls are matched by log id (header {REPLAY_HEADER}).", file=sys.stderr)
+        return 0
+
+    with open(args.cassette, "r", encoding="utf-8") as f:
+        cassette = json.load(f)
+    if args.limit:
+        cassette["conversations"] = cassette["conversations"][:args.limit]
+
+    report = run_replay(cassette, concurrency=args.concurrency, latency_scale=args.latency_scale)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    found = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            found = regressions(report, json.load(f), args.max_regression)
+        report["regressions"] = found
+    print(json.dumps({key: value for key, value in report.items() if key != "results"}, indent=2))
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,13 @@
 # server/services/analytics_service.py
 
 from datetime import datetime
-from models.sql_models import AnalyticsData, OpenAIAPILog
+from models.sql_models import AnalyticsData, OpenAIAPILog, ChatSpan
 from database.session import ScopedSession
 from helpers.analytics_helpers import get_analytics_summary as get_summary_helper
+from helpers.metrics import DB_WRITE_LATENCY
+from helpers.log_helpers import get_logger
+
+logger = get_logger("analytics")
 
 def store_request_analytics(token_usage, cost_info, model="o3-mini-2025-01-31", latency_ms=0, log_id=None):
     """Store analytics data for a request."""
@@ -32,15 +36,16 @@ def store_request_analytics(token_usage, cost_info, model="o3-mini-2025-01-31",
             latency_ms=latency_ms,
             log_id=log_id  # <-- Add log_id to AnalyticsData
         )
-        ScopedSession.add(analytics)
-        ScopedSession.commit()
+        with DB_WRITE_LATENCY.labels(operation="analytics").time():
+            ScopedSession.add(analytics)
+            ScopedSession.commit()
         
         # Get the updated analytics summary
         updated_analytics = get_summary_helper()
         
         return True, updated_analytics
     except Exception as e:
-        print(f"Error storing analytics data: {e}")
+        logger.error("store_analytics_failed", error=str(e))
         ScopedSession.rollback()
         return False, None
 
@@ -81,8 +86,32 @@ def store_openai_api_log(
     except Exception as e:
         # Roll back the failed transaction
         session.rollback()
-        print(f"[DB ERROR] Failed to store OpenAI API log: {e}")
+        logger.error("store_openai_api_log_failed", error=str(e))
         return False, None
     finally:
         # Close out this session (important with scoped_session)
-        session.close()
\ No newline at end of file
+        session.close()
+
+def store_chat_spans(log_id, spans):
+    """Store the per-stage spans of a chat request, linked to its OpenAI API log."""
+    if not log_id or not spans:
+        return False
+    try:
+        with DB_WRITE_LATENCY.labels(operation="chat_spans").time():
+            ScopedSession.add_all([
+                ChatSpan(
+                    log_id=log_id,
+                    name=span["name"],
+                    start_offset_ms=span["start_offset_ms"],
+                    duration_ms=span["duration_ms"],
+                    status=span["status"],
+                    attributes=span["attributes"]
+                )
+                for span in spans
+            ])
+            ScopedSession.commit()
+        return True
+    except Exception as e:
+        logger.error("store_chat_spans_failed", log_id=log_id, error=str(e))
+        ScopedSession.rollback()
+        return False
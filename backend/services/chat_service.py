@@ -14,31 +14,59 @@ This module provides the core logic for handling chat interactions with the Open
 Functions:
     get_system_message(): Returns the default system prompt for the assistant.
     get_time_context_message(): Returns a system message with the current EST time.
-    process_chat(user_message, conversation_history, user_id=None):
-        Handles a user chat message, manages conversation state, calls the LLM, logs analytics, and returns the response.
+    process_chat(user_message, conversation_history, user_id=None, deadline=None):
+        Handles a user chat message, manages conversation state, calls the LLM, logs analytics and
+        per-stage spans, and returns the response.
 """
 
 # Standard library imports
-import os  # For environment variable access
 import json  # For JSON serialization
 from datetime import datetime  # For timestamping
 import pytz  # For timezone handling
 
-# Third-party imports
-from openai import OpenAI  # OpenAI API client
-
 # Internal module imports
-from helpers.token_utils import calculate_token_cost  # Token cost calculation utility
-from services.analytics_service import store_request_analytics, store_openai_api_log  
+from helpers.token_utils import calculate_usage_cost  # Token cost calculation utility
+from services.analytics_service import store_request_analytics, store_openai_api_log, store_chat_spans
 from models.sql_models import OpenAIAPILog  # Database model for API logs
 from database.session import ScopedSession  # Database session management
 from helpers.rag_helpers import search_cfr_documents, search_m21_documents, calculator_tool
-
-# Initialize the OpenAI client with the API key from environment variables
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# The model used for chat completions
-model = "gpt-4.1-mini-2025-04-14"
+from helpers.rating_schedule import rating_lookup  # Structured Part 4 rating schedule
+from helpers.cfr_graph import cfr_related  # CFR citation graph
+from helpers.trace_helpers import start_trace, span  # Per-stage span tracing
+from helpers.metrics import CHAT_LATENCY, STAGE_LATENCY, TOOL_LATENCY, OPENAI_ERRORS, TOKENS, DB_WRITE_LATENCY
+from helpers.log_helpers import get_logger  # Structured, sampled logging
+from helpers.clients import create_chat_completion  # Shared, pooled OpenAI client
+from helpers.singleflight import Group, make_key  # Coalescing of identical in-flight calls
+from helpers.tool_cache import get_or_compute  # Tool-result cache
+from helpers.deadline import Deadline, DeadlineExceeded  # Per-request time budget
+from helpers.model_router import route_chat, low_confidence_reason, SIMPLE  # Per-request model choice
+from helpers.speculative_retrieval import start_speculative_retrieval  # Retrieval overlapped with the first call
+from helpers.usage_meter import capture_usage  # Usage of every completion of the turn
+from config import Config
+
+# Structured logger for the chat pipeline
+logger = get_logger("chat")
+
+# The chat model is chosen per request by helpers/model_router.py (Config.CHAT_MODEL / CHAT_SIMPLE_MODEL)
+
+
+def _completion_from_dict(data):
+    """Rebuild a ChatCompletion published by another worker."""
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate(data)
+
+
+# Identical concurrent completion requests (same model, messages and parameters) share one call
+completion_flight = Group("chat_completion", dumps=lambda completion: completion.to_dict(), loads=_completion_from_dict)
+
+
+def create_completion(deadline=None, **params):
+    """Create a chat completion, coalescing identical requests that are already in flight."""
+    return completion_flight.do(
+        make_key(params),
+        lambda: create_chat_completion(deadline=deadline, **params),
+        deadline=deadline
+    )
 
 # Define the tools available to the assistant
 tools = [
@@ -82,6 +110,53 @@ tools = [
             "additionalProperties": False
         }
     },
+    {
+        "type": "function",
+        "name": "rating_lookup",
+        "description": (
+            "Look up the 38 CFR Part 4 rating schedule directly. Returns the rating percentages and "
+            "criteria for a diagnostic code, or for conditions matching a name. Prefer this over "
+            "cfr_search for questions about the rating of a specific condition or diagnostic code."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "diagnostic_code": {
+                    "type": "string",
+                    "description": "A four-digit diagnostic code, e.g. '6260'."
+                },
+                "condition": {
+                    "type": "string",
+                    "description": "The condition name when the diagnostic code is not known, e.g. 'sleep apnea'."
+                },
+                "percent": {
+                    "type": "integer",
+                    "description": "Optional rating percentage to show only that level, e.g. 50."
+                }
+            },
+            "required": [],
+            "additionalProperties": False
+        }
+    },
+    {
+        "type": "function",
+        "name": "cfr_related",
+        "description": (
+            "List the 38 CFR sections that a given section cites and that cite it, with short excerpts. "
+            "Use this to follow a section reference (e.g. from 3.310 to 3.303) instead of a new cfr_search."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "section_number": {
+                    "type": "string",
+                    "description": "A 38 CFR section number, e.g. '3.310' or '4.130'."
+                }
+            },
+            "required": ["section_number"],
+            "additionalProperties": False
+        }
+    },
     {
         "type": "function",
         "name": "calculator",
@@ -104,6 +179,39 @@ tools = [
 ]
 
 
+def _retry_after_seconds(error, default=5):
+    """Seconds from the Retry-After header of an OpenAI error response, if any."""
+    response = getattr(error, "response", None)
+    try:
+        return max(1, int(float(response.headers.get("retry-after"))))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+def dispatch_tool(function_name, function_args, deadline=None):
+    """Run a tool through the tool-result cache; returns (result, cache source)."""
+    return get_or_compute(
+        function_name,
+        function_args,
+        lambda: run_tool(function_name, function_args, deadline=deadline)
+    )
+
+
+def run_tool(function_name, function_args, deadline=None):
+    """Execute the tool requested by the model and return its result (None for unknown tools)."""
+    if function_name == "cfr_search":
+        return search_cfr_documents(**function_args, deadline=deadline)
+    elif function_name == "m21_search":
+        return search_m21_documents(**function_args, deadline=deadline)
+    elif function_name == "rating_lookup":
+        return rating_lookup(**function_args)
+    elif function_name == "cfr_related":
+        return cfr_related(**function_args)
+    elif function_name == "calculator":
+        return calculator_tool(**function_args)
+    return None
+
+
 def get_system_message():
     """
     Return the system message for the chat assistant.
@@ -158,54 +266,75 @@ def get_time_context_message():
     }
 
 
-def process_chat(user_message, conversation_history, user_id=None):
+def process_chat(user_message, conversation_history, user_id=None, deadline=None):
     """
     Process a chat message and return the assistant's response.
     Handles conversation history, system/time context, OpenAI API call, logging, and analytics.
+    Each stage of the request is recorded as a span and stored alongside the API log.
     Args:
         user_message (str): The user's message to the assistant.
         conversation_history (list): The list of previous messages in the conversation.
         user_id (optional): The ID of the user (for logging/analytics).
+        deadline (Deadline, optional): The request's time budget; every upstream call gets
+            the remaining budget as its timeout. Defaults to Config.CHAT_DEADLINE_SECONDS.
     Returns:
         tuple: (response dict, HTTP status code)
     """
-    print("[DEBUG] Starting process_chat function")
+    if deadline is None:
+        deadline = Deadline(Config.CHAT_DEADLINE_SECONDS)
+
+    with start_trace() as trace, capture_usage() as usage:
+        result, status_code = _process_chat(user_message, conversation_history, user_id, trace, deadline, usage)
+
+    # Record request and per-stage latency metrics
+    CHAT_LATENCY.labels(status=str(status_code)).observe(trace.elapsed_ms() / 1000)
+    for recorded_span in trace.spans:
+        STAGE_LATENCY.labels(stage=recorded_span["name"]).observe(recorded_span["duration_ms"] / 1000)
+    return result, status_code
+
+
+def _process_chat(user_message, conversation_history, user_id, trace, deadline, usage):
+    """Body of process_chat, run with `trace` as the current trace and `usage` collecting its completions."""
+    logger.debug("process_chat_started")
     if not user_message:
-        print("[DEBUG] No user message provided")
+        logger.debug("empty_user_message")
         return {"error": "No 'message' provided"}, 400
 
-    # Ensure conversation_history is a list
-    if not isinstance(conversation_history, list):
-        print("[DEBUG] conversation_history is not a list, initializing as an empty list")
-        conversation_history = []
+    with span("history_prep"):
+        # Ensure conversation_history is a list
+        if not isinstance(conversation_history, list):
+            logger.debug("conversation_history_reset", reason="not a list")
+            conversation_history = []
 
-    # Check if the conversation history already has a system message
-    has_system_message = any(
-        msg.get("role") == "system" and "You are a helpful assistant" in msg.get("content", "")
-        for msg in conversation_history
-    )
-    print(f"[DEBUG] System message present: {has_system_message}")
+        # Check if the conversation history already has a system message
+        has_system_message = any(
+            msg.get("role") == "system" and "You are a helpful assistant" in msg.get("content", "")
+            for msg in conversation_history
+        )
 
-    # If no conversation history or no system message, add the system message
-    if not conversation_history or not has_system_message:
-        print("[DEBUG] Adding system message to conversation history")
-        conversation_history.insert(0, get_system_message())
+        # If no conversation history or no system message, add the system message
+        if not conversation_history or not has_system_message:
+            logger.debug("system_message_added")
+            conversation_history.insert(0, get_system_message())
 
-    # Check if there's a time context message in the conversation history
-    has_time_context = any(
-        msg.get("role") == "system" and "Current time:" in msg.get("content", "")
-        for msg in conversation_history
-    )
-    print(f"[DEBUG] Time context message present: {has_time_context}")
+        # Check if there's a time context message in the conversation history
+        has_time_context = any(
+            msg.get("role") == "system" and "Current time:" in msg.get("content", "")
+            for msg in conversation_history
+        )
 
-    # If no time context message, add one
-    if not has_time_context:
-        print("[DEBUG] Adding time context message to conversation history")
-        conversation_history.append(get_time_context_message())
+        # If no time context message, add one
+        if not has_time_context:
+            logger.debug("time_context_added")
+            conversation_history.append(get_time_context_message())
+
+    # Route the request to a model by its difficulty; escalations below may switch to the standard model
+    route = route_chat(user_message, conversation_history)
+    model = route.model
 
     # Record start time for latency tracking
     start_time = datetime.utcnow()
-    print("[DEBUG] Start time recorded")
+    start_offset_ms = trace.elapsed_ms()
 
     # Add tools to the request payload
     request_payload = {
@@ -214,50 +343,68 @@ def process_chat(user_message, conversation_history, user_id=None):
         "max_completion_tokens": 750,
         "functions": tools
     }
-    print(f"[DEBUG] Request payload prepared: {request_payload}")
+    logger.debug("request_payload_prepared", payload=request_payload, message_count=len(conversation_history))
 
+    speculation = None
     try:
-        # Call the OpenAI ChatCompletion API to get the assistant's response
-        print("[DEBUG] Calling OpenAI ChatCompletion API")
-        completion = client.chat.completions.create(
-            model=model,
-            messages=conversation_history,
-            max_completion_tokens=750,
-            functions=tools,
-            temperature=0.0
+        # When retrieval is likely, start it now so it overlaps the first completion
+        speculation = start_speculative_retrieval(
+            user_message,
+            lambda tool_name, arguments: dispatch_tool(tool_name, arguments, deadline=deadline),
+            deadline=deadline
         )
-        print("[DEBUG] OpenAI API call successful")
 
-        # Calculate latency in milliseconds
-        end_time = datetime.utcnow()
-        latency_ms = int((end_time - start_time).total_seconds() * 1000)
-        print(f"[DEBUG] Latency calculated: {latency_ms} ms")
+        # Call the OpenAI ChatCompletion API to get the assistant's response
+        with span("llm_call_1", model=model, tier=route.tier):
+            completion = create_completion(
+                deadline=deadline,
+                model=model,
+                messages=conversation_history,
+                max_completion_tokens=750,
+                functions=tools,
+                temperature=0.0
+            )
 
+        # A low-confidence direct answer from the simple model is retried on the standard model
         message = completion.choices[0].message
+        if route.tier == SIMPLE and message.function_call is None:
+            escalation_reason = low_confidence_reason(completion)
+            if escalation_reason:
+                model = route.escalate(escalation_reason)
+                logger.info("chat_model_escalated", reason=escalation_reason, model=model)
+                with span("llm_call_1_escalated", model=model, reason=escalation_reason):
+                    completion = create_completion(
+                        deadline=deadline,
+                        model=model,
+                        messages=conversation_history,
+                        max_completion_tokens=750,
+                        functions=tools,
+                        temperature=0.0
+                    )
+                message = completion.choices[0].message
         assistant_response = message.content or ""
-        print(f"[DEBUG] Assistant response: {assistant_response}")
+        logger.debug("llm_call_1_completed", response=assistant_response)
 
         # Check if the response contains a tool call
         if hasattr(message, "function_call") and message.function_call is not None:
-            print("[DEBUG] Function call detected in response")
             function_call = message.function_call
             function_name = function_call.name
             function_args = json.loads(function_call.arguments)
-            print(f"[DEBUG] Function call details: name={function_name}, arguments={function_args}")
-
-            # Execute the appropriate tool function
-            tool_result = None
-            if function_name == "cfr_search":
-                print("[DEBUG] Executing cfr_search tool")
-                tool_result = search_cfr_documents(**function_args)
-            elif function_name == "m21_search":
-                print("[DEBUG] Executing m21_search tool")
-                tool_result = search_m21_documents(**function_args)
-            elif function_name == "calculator":
-                print("[DEBUG] Executing calculator tool")
-                tool_result = calculator_tool(**function_args)
-
-            print(f"[DEBUG] Tool result: {tool_result}")
+            logger.debug("function_call_requested", function_name=function_name, arguments=function_args)
+            # Logged with the request so the call can be replayed exactly (scripts/replay_traffic.py)
+            request_payload["function_call"] = {"name": function_name, "arguments": function_args}
+
+            # Execute the appropriate tool function (or reuse a prefetched or cached result for the same call)
+            with span("tool_dispatch", tool=function_name) as dispatch_span, TOOL_LATENCY.labels(tool=function_name).time():
+                prefetched = speculation.take(function_name, function_args, deadline=deadline) if speculation else None
+                if prefetched is not None:
+                    tool_result, cache_source = prefetched[0], "speculative"
+                else:
+                    tool_result, cache_source = dispatch_tool(function_name, function_args, deadline=deadline)
+                if dispatch_span is not None:
+                    dispatch_span["attributes"]["cache"] = cache_source
+
+            logger.debug("tool_completed", function_name=function_name, cache=cache_source, result=tool_result)
 
             # Append the tool result to the conversation history
             conversation_history.append({
@@ -266,16 +413,28 @@ def process_chat(user_message, conversation_history, user_id=None):
                 "content": tool_result
             })
 
+            # Answers written over tool results are tool-heavy turns: use the standard model
+            model = route.escalate("tool_call")
+
             # Re-call the API with the updated conversation history
-            print("[DEBUG] Re-calling OpenAI API with updated conversation history")
-            completion = client.chat.completions.create(
-                model=model,
-                messages=conversation_history,
-                max_completion_tokens=750,
-                temperature=0.0
-            )
+            with span("llm_call_2", model=model):
+                completion = create_completion(
+                    deadline=deadline,
+                    model=model,
+                    messages=conversation_history,
+                    max_completion_tokens=750,
+                    temperature=0.0
+                )
             assistant_response = completion.choices[0].message.content or ""
 
+        # The model answered without the predicted search
+        if speculation is not None:
+            speculation.discard("no_tool_call")
+
+        # Calculate latency in milliseconds, including any tool call and second completion
+        end_time = datetime.utcnow()
+        latency_ms = int(trace.elapsed_ms() - start_offset_ms)
+
         # Append the assistant's response to the conversation history
         assistant_message = {
             "role": "assistant",
@@ -283,50 +442,74 @@ def process_chat(user_message, conversation_history, user_id=None):
         }
         conversation_history.append(assistant_message)
 
-        # Calculate token usage and cost
-        token_usage = completion.usage
-        cost_info = calculate_token_cost(
-            prompt_tokens=token_usage.prompt_tokens,
-            model=model,
-            completion_tokens=token_usage.completion_tokens
-        )
-        print(f"[DEBUG] Token usage: {token_usage}, Cost info: {cost_info}")
-
-        # Store OpenAI API log (success) and get log_id
-        log = OpenAIAPILog(
-            user_id=user_id,
-            request_prompt=user_message,
-            request_payload=request_payload,
-            request_sent_at=start_time,
-            response_json=completion.to_dict() if hasattr(completion, 'to_dict') else str(completion),
-            response_received_at=end_time,
-            status="success",
-            error_message=None
+        # Token usage and cost of every completion of the turn (a discarded simple-model answer,
+        # the function call, query rewrites and the answer), each priced at its own model's rates.
+        # Usage replayed from calls coalesced onto another request is charged as credits but not counted here.
+        turn_usage = usage.snapshot(replayed=False)
+        cost_info = calculate_usage_cost(turn_usage)
+        token_usage = {key: cost_info[key] for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+        for used_model, (prompt_tokens, completion_tokens) in turn_usage.items():
+            TOKENS.labels(model=used_model, kind="prompt").inc(prompt_tokens)
+            TOKENS.labels(model=used_model, kind="completion").inc(completion_tokens)
+
+        # Record the routing decision with the request; AnalyticsData.model holds the model that answered
+        request_payload["routing"] = route.as_dict()
+        replayed_usage = usage.replayed_snapshot()
+        if replayed_usage:
+            request_payload["replayed_usage"] = replayed_usage
+
+        with span("db_write"):
+            # Store OpenAI API log (success) and get log_id
+            log = OpenAIAPILog(
+                user_id=user_id,
+                request_prompt=user_message,
+                request_payload=request_payload,
+                request_sent_at=start_time,
+                response_json=completion.to_dict() if hasattr(completion, 'to_dict') else str(completion),
+                response_received_at=end_time,
+                status="success",
+                error_message=None
+            )
+            with DB_WRITE_LATENCY.labels(operation="openai_log").time():
+                ScopedSession.add(log)
+                ScopedSession.commit()
+            log_id = log.id
+
+            # Store analytics data with latency and log_id
+            store_request_analytics(token_usage, cost_info, latency_ms=latency_ms, model=model, log_id=log_id)
+
+        # Store the per-stage spans linked to the log
+        store_chat_spans(log_id, trace.spans)
+        logger.info(
+            "process_chat_completed",
+            log_id=log_id,
+            latency_ms=latency_ms,
+            total_tokens=token_usage["total_tokens"],
+            total_cost=cost_info["total_cost"]
         )
-        ScopedSession.add(log)
-        ScopedSession.commit()
-        log_id = log.id
-        print(f"[DEBUG] OpenAI API log stored with log_id: {log_id}")
-
-        # Store analytics data with latency and log_id
-        store_request_analytics(token_usage, cost_info, latency_ms=latency_ms, model=model, log_id=log_id)
 
         return {
             "chat_response": assistant_response,
             "conversation_history": conversation_history,
-            "token_usage": {
-                "prompt_tokens": token_usage.prompt_tokens,
-                "completion_tokens": token_usage.completion_tokens,
-                "total_tokens": token_usage.total_tokens
-            },
+            "token_usage": token_usage,
             "cost": cost_info,
             "latency_ms": latency_ms
         }, 200
 
     except Exception as e:
-        print(f"[ERROR] Exception occurred: {e}")
+        # The SDK is imported lazily (it is already loaded once a completion has been attempted)
+        from openai import OpenAIError, RateLimitError
+        logger.exception("process_chat_failed", error=str(e))
+        if isinstance(e, OpenAIError):
+            OPENAI_ERRORS.labels(error_type=type(e).__name__).inc()
+        if speculation is not None:
+            speculation.discard("error")
+        # Roll back anything left pending by the failed stage before logging the error
+        ScopedSession.rollback()
         # Store OpenAI API log (error)
         end_time = datetime.utcnow()
+        latency_ms = int(trace.elapsed_ms() - start_offset_ms)
+        request_payload["routing"] = route.as_dict()
         log = OpenAIAPILog(
             user_id=user_id,
             request_prompt=user_message,
@@ -340,15 +523,26 @@ def process_chat(user_message, conversation_history, user_id=None):
         ScopedSession.add(log)
         ScopedSession.commit()
         log_id = log.id
-        print(f"[DEBUG] Error log stored with log_id: {log_id}")
+        logger.debug("error_log_stored", log_id=log_id)
 
-        # Store analytics data with error and log_id
+        # Store analytics data with error and log_id, including the completions made before the failure
+        try:
+            cost_info = calculate_usage_cost(usage.snapshot(replayed=False))
+        except ValueError:
+            cost_info = calculate_usage_cost({})
         store_request_analytics(
-            token_usage if 'token_usage' in locals() else {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
-            cost_info if 'cost_info' in locals() else {'prompt_cost': 0, 'completion_cost': 0, 'total_cost': 0},
-            latency_ms=(int((end_time - start_time).total_seconds() * 1000)),
+            cost_info,
+            cost_info,
+            latency_ms=latency_ms,
             model=model,
             log_id=log_id
         )
-
-        return {"error": str(e)}, 500
\ No newline at end of file
+        store_chat_spans(log_id, trace.spans)
+
+        # A request that ran out of its time budget is a gateway timeout, not a server error
+        if isinstance(e, DeadlineExceeded) or deadline.expired():
+            return {"error": "The request took too long to complete. Please try again."}, 504
+        # OpenAI rate limits (after retries) are passed on as 429 rather than a server error
+        if isinstance(e, RateLimitError):
+            return {"error": "The service is busy. Please retry shortly.", "retry_after": _retry_after_seconds(e)}, 429
+        return {"error": str(e)}, 500
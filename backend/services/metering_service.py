@@ -0,0 +1,328 @@
+# server/services/metering_service.py
+
+"""
+Metering Service
+----------------
+Token-credit metering against Users.credits_remaining (1 credit = 1 token).
+
+- Reserve: before the first LLM call, the estimated tokens of the request are
+  taken from the user's balance with one atomic conditional UPDATE
+  (... WHERE credits_remaining >= :tokens). Concurrent requests from any worker
+  or replica can therefore never spend credits the user does not have.
+- Record: every chat completion made while handling the request adds its usage
+  to the request's meter (helpers/usage_meter.py), including hedges and calls
+  shared with coalesced requests.
+- Settle: when the request finishes, the difference between reserved and used
+  tokens and the usage per model are written as one `credit_ledger` row, so a
+  settlement survives the process being killed. Usage recorded after that (a
+  hedge or speculative call still running) is settled as a row of its own. If
+  the ledger cannot be written, the settlement is kept in memory and retried.
+- Flush: a background thread in each process claims ledger rows (any process's,
+  FOR UPDATE SKIP LOCKED), aggregates them per user and, in the same
+  transaction, deletes them, applies one UPDATE for all users (relative
+  increments, so flushes from many processes commute and the final balance is
+  exact) and bulk-inserts the OpenAIUsageLog rows.
+
+Only the users row is touched per request (the reservation); settlements are
+appends to the ledger, and the refund, the total_tokens_used counter and the
+usage log are batched, which removes the per-request hot-row write on settlement.
+"""
+
+# Import necessary libraries
+import os
+import atexit
+import threading
+from decimal import Decimal
+from datetime import datetime
+from contextlib import contextmanager
+from sqlalchemy import text, insert
+from config import Config
+from database.session import ScopedSession, engine
+from models.sql_models import CreditLedgerEntry
+from models.legacy_sql_models import OpenAIUsageLog
+from helpers.token_utils import calculate_token_cost
+from helpers.usage_meter import UsageMeter, use_meter
+from helpers.metrics import DB_WRITE_LATENCY
+from helpers.log_helpers import get_logger
+
+logger = get_logger("metering")
+
+_RESERVE_SQL = text("""
+    UPDATE users
+    SET credits_remaining = credits_remaining - :tokens
+    WHERE user_uuid = :user_uuid AND credits_remaining >= :tokens
+    RETURNING user_id, credits_remaining
+""")
+
+_BALANCE_SQL = text("SELECT user_id, credits_remaining FROM users WHERE user_uuid = :user_uuid")
+
+# Take a batch of settlements out of the ledger; concurrent flushers skip each other's rows
+_CLAIM_LEDGER_SQL = text("""
+    DELETE FROM credit_ledger
+    WHERE id IN (
+        SELECT id FROM credit_ledger
+        ORDER BY id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING user_id, credit_delta, tokens_used, usage
+""")
+
+# Rows are locked in user_id order so concurrent flushes cannot deadlock
+_FLUSH_SQL = text("""
+    WITH deltas AS (
+        SELECT * FROM unnest(
+            CAST(:user_ids AS integer[]),
+            CAST(:credit_deltas AS bigint[]),
+            CAST(:tokens_used AS bigint[])
+        ) AS d(user_id, credit_delta, tokens_used)
+    ),
+    locked AS (
+        SELECT u.user_id FROM users AS u
+        WHERE u.user_id IN (SELECT user_id FROM deltas)
+        ORDER BY u.user_id
+        FOR UPDATE
+    )
+    UPDATE users AS u
+    SET credits_remaining = u.credits_remaining + d.credit_delta,
+        total_tokens_used = u.total_tokens_used + d.tokens_used,
+        updated_at = now()
+    FROM deltas AS d
+    WHERE u.user_id = d.user_id AND u.user_id IN (SELECT user_id FROM locked)
+""")
+
+
+class UnknownUser(Exception):
+    """The request's user does not exist."""
+
+
+class InsufficientCredits(Exception):
+    """The user's balance does not cover the request's estimated tokens."""
+
+    def __init__(self, credits_remaining, required):
+        super().__init__(f"Insufficient credits: {credits_remaining} remaining, {required} required")
+        self.credits_remaining = credits_remaining
+        self.required = required
+
+###############################################################################
+# 1. REQUEST METER
+###############################################################################
+
+class CreditMeter(UsageMeter):
+    """Reservation and recorded usage of one request."""
+
+    def __init__(self, user_id, reserved_tokens, credits_remaining):
+        super().__init__()
+        self.user_id = user_id
+        self.reserved_tokens = reserved_tokens
+        self.credits_remaining = credits_remaining
+
+    def record_late(self, model, prompt_tokens, completion_tokens):
+        """Usage of a call that finished after the request was settled is charged on its own."""
+        tokens = prompt_tokens + completion_tokens
+        _write_settlement(self.user_id, -tokens, tokens, {model: (prompt_tokens, completion_tokens)})
+
+
+def estimate_chat_tokens(user_message, conversation_history):
+    """
+    Upper estimate of a chat request's tokens: the prompt (about four characters
+    per token) sent up to twice (tool call and answer) plus the completion allowance.
+    """
+    history_chars = sum(len(str(message.get("content") or "")) for message in conversation_history
+                        if isinstance(message, dict))
+    prompt_tokens = (len(user_message) + history_chars) // 4 + Config.CREDIT_PROMPT_OVERHEAD_TOKENS
+    return 2 * prompt_tokens + Config.CREDIT_RESERVE_COMPLETION_TOKENS
+
+###############################################################################
+# 2. RESERVE & SETTLE
+###############################################################################
+
+def reserve(user_uuid, tokens):
+    """Atomically take `tokens` credits from the user; returns a CreditMeter."""
+    try:
+        row = ScopedSession.execute(_RESERVE_SQL, {"user_uuid": user_uuid, "tokens": tokens}).first()
+        if row is None:
+            balance = ScopedSession.execute(_BALANCE_SQL, {"user_uuid": user_uuid}).first()
+            ScopedSession.rollback()
+            if balance is None:
+                raise UnknownUser(user_uuid)
+            raise InsufficientCredits(balance.credits_remaining, tokens)
+        ScopedSession.commit()
+    except (UnknownUser, InsufficientCredits):
+        raise
+    except Exception:
+        ScopedSession.rollback()
+        raise
+    return CreditMeter(row.user_id, tokens, row.credits_remaining)
+
+
+@contextmanager
+def metered_request(user_uuid, estimated_tokens):
+    """Reserve credits for a request, make its meter current, and settle it on exit."""
+    meter = reserve(user_uuid, estimated_tokens)
+    try:
+        with use_meter(meter):
+            yield meter
+    finally:
+        settle(meter)
+
+
+# Settlements the ledger could not take, retried by the next flush
+_pending_lock = threading.Lock()
+_pending = {}
+_settled_since_flush = 0
+_flush_wakeup = threading.Event()
+_flusher = None
+
+
+def _merge_settlement(target, user_id, credit_delta, tokens_used, usage):
+    """Add one settlement to per-user aggregates ({user_id: {credit_delta, tokens_used, usage}})."""
+    entry = target.setdefault(user_id, {"credit_delta": 0, "tokens_used": 0, "usage": {}})
+    entry["credit_delta"] += credit_delta
+    entry["tokens_used"] += tokens_used
+    for model, (prompt_tokens, completion_tokens) in usage.items():
+        totals = entry["usage"].setdefault(model, [0, 0])
+        totals[0] += prompt_tokens
+        totals[1] += completion_tokens
+
+
+def _write_settlement(user_id, credit_delta, tokens_used, usage):
+    """Append a settlement to the ledger (kept in memory for the next flush if that fails)."""
+    global _settled_since_flush
+    try:
+        with DB_WRITE_LATENCY.labels(operation="credit_ledger").time():
+            with engine.begin() as connection:
+                connection.execute(insert(CreditLedgerEntry), {
+                    "user_id": user_id,
+                    "credit_delta": credit_delta,
+                    "tokens_used": tokens_used,
+                    "usage": {model: list(totals) for model, totals in usage.items()},
+                    "created_at": datetime.utcnow()
+                })
+    except Exception as e:
+        logger.error("credit_ledger_write_failed", user_id=user_id, error=str(e))
+        with _pending_lock:
+            _merge_settlement(_pending, user_id, credit_delta, tokens_used, usage)
+
+    with _pending_lock:
+        _settled_since_flush += 1
+        settled = _settled_since_flush
+    _ensure_flusher()
+    if settled >= Config.CREDIT_FLUSH_MAX_PENDING:
+        _flush_wakeup.set()
+
+
+def settle(meter):
+    """Record the refund (or extra charge) and usage of a finished request."""
+    usage = meter.close()
+    used = sum(prompt + completion for prompt, completion in usage.values())
+    _write_settlement(meter.user_id, meter.reserved_tokens - used, used, usage)
+
+###############################################################################
+# 3. FLUSH
+###############################################################################
+
+def _usage_cost(model, prompt_tokens, completion_tokens):
+    try:
+        cost = calculate_token_cost(prompt_tokens, completion_tokens, model=model)["total_cost"]
+    except ValueError:
+        cost = 0
+    return Decimal(str(round(cost, 2)))
+
+
+def flush():
+    """
+    Apply a batch of ledger rows and the settlements held in memory in one
+    transaction; returns the number of ledger rows applied.
+    """
+    global _pending, _settled_since_flush
+    with _pending_lock:
+        held, _pending = _pending, {}
+        _settled_since_flush = 0
+
+    try:
+        claimed = ScopedSession.execute(_CLAIM_LEDGER_SQL, {"batch_size": Config.CREDIT_FLUSH_BATCH_SIZE}).fetchall()
+        batch = {}
+        for user_id, entry in held.items():
+            _merge_settlement(batch, user_id, entry["credit_delta"], entry["tokens_used"], entry["usage"])
+        for row in claimed:
+            _merge_settlement(batch, row.user_id, row.credit_delta, row.tokens_used, row.usage)
+        if not batch:
+            ScopedSession.rollback()
+            return 0
+        _apply(batch)
+    except Exception as e:
+        ScopedSession.rollback()
+        logger.error("credit_flush_failed", users=len(held), error=str(e))
+        # Claimed ledger rows are restored by the rollback; put back the settlements held in memory
+        with _pending_lock:
+            for user_id, entry in held.items():
+                _merge_settlement(_pending, user_id, entry["credit_delta"], entry["tokens_used"], entry["usage"])
+        return 0
+    finally:
+        ScopedSession.remove()
+
+    logger.debug("credits_flushed", users=len(batch), ledger_rows=len(claimed))
+    return len(claimed)
+
+
+def _apply(batch):
+    """Apply per-user aggregates to Users and the usage log, and commit."""
+    user_ids = sorted(batch)
+    now = datetime.utcnow()
+    usage_rows = [
+        {
+            "user_id": user_id,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost": _usage_cost(model, prompt_tokens, completion_tokens),
+            "created_at": now
+        }
+        for user_id in user_ids
+        for model, (prompt_tokens, completion_tokens) in batch[user_id]["usage"].items()
+    ]
+    with DB_WRITE_LATENCY.labels(operation="credit_settlements").time():
+        ScopedSession.execute(_FLUSH_SQL, {
+            "user_ids": user_ids,
+            "credit_deltas": [batch[user_id]["credit_delta"] for user_id in user_ids],
+            "tokens_used": [batch[user_id]["tokens_used"] for user_id in user_ids]
+        })
+        if usage_rows:
+            ScopedSession.execute(insert(OpenAIUsageLog), usage_rows)
+        ScopedSession.commit()
+
+
+def _flush_loop():
+    while True:
+        _flush_wakeup.wait(Config.CREDIT_FLUSH_INTERVAL_SECONDS)
+        _flush_wakeup.clear()
+        # A full batch means more rows are waiting
+        while flush() >= Config.CREDIT_FLUSH_BATCH_SIZE:
+            pass
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        with _pending_lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name="credit-flusher", daemon=True)
+                _flusher.start()
+
+
+def _reinit_in_child():
+    """A forked worker starts with no pending settlements and no flusher thread."""
+    global _pending_lock, _pending, _settled_since_flush, _flusher, _flush_wakeup
+    _pending_lock = threading.Lock()
+    _pending = {}
+    _settled_since_flush = 0
+    _flusher = None
+    _flush_wakeup = threading.Event()
+
+
+# Settlements at shutdown are applied before the process exits (the ledger keeps them otherwise)
+atexit.register(flush)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_in_child)
@@ -0,0 +1,267 @@
+# server/services/nexus_summary_service.py
+
+"""
+Nexus Summary Service
+---------------------
+Recomputes stale NexusSummary rows (needs_update = true) in the background.
+
+- Claiming: each batch is leased in a short transaction (FOR UPDATE SKIP LOCKED,
+  then claimed_at/claimed_by are set and committed), so any number of worker
+  processes can drain the queue without coordinating and no row lock is held
+  while the LLM calls run. A lease older than Config.NEXUS_WORKER_LEASE_SECONDS
+  (a dead or stuck worker) is taken over by another worker.
+- Incremental: a summary is only rebuilt when the set of conditions behind its
+  nexus tag differs from the stored condition_ids. Otherwise the flag is cleared
+  without calling the LLM.
+- The LLM calls of a batch run concurrently, paced by a requests-per-minute limit.
+- Results are written back with one bulk UPDATE per batch, only to rows still
+  leased by this batch. A writer that re-flags a claimed row should clear
+  claimed_by so the in-flight result is discarded and the row is claimed again.
+- Retries: every claim counts an attempt. Rows whose LLM call failed stay flagged
+  and wait an exponential back-off; after Config.NEXUS_WORKER_MAX_ATTEMPTS they
+  are no longer claimed (reset attempts to 0 to retry them).
+
+Run with `python -m scripts.nexus_summary_worker` (see Procfile / docker-compose).
+"""
+
+# Import necessary libraries
+import os
+import uuid
+import random
+import socket
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import bindparam, func, text
+from config import Config
+from database.session import ScopedSession
+from models.legacy_sql_models import NexusSummary
+from helpers.clients import create_chat_completion
+from helpers.rate_limiter import RateLimiter
+from helpers.metrics import DB_WRITE_LATENCY
+from helpers.log_helpers import get_logger
+
+logger = get_logger("nexus_worker")
+
+# Lease a batch: committed right away, so the rows are not locked during the LLM calls
+_CLAIM_SQL = text("""
+    UPDATE nexus_summaries AS ns
+    SET claimed_at = now(), claimed_by = :claimed_by, attempts = ns.attempts + 1
+    FROM (
+        SELECT s.nexus_summary_id
+        FROM nexus_summaries AS s
+        JOIN nexus_tags AS nt ON nt.nexus_tags_id = s.nexus_tags_id
+        WHERE s.needs_update
+          AND nt.revoked_at IS NULL
+          AND s.attempts < :max_attempts
+          AND (s.claimed_at IS NULL OR s.claimed_at < now() - make_interval(secs => :lease_seconds))
+          AND (s.next_attempt_at IS NULL OR s.next_attempt_at <= now())
+        ORDER BY s.updated_at NULLS FIRST, s.nexus_summary_id
+        LIMIT :batch_size
+        FOR UPDATE OF s SKIP LOCKED
+    ) AS claim
+    WHERE ns.nexus_summary_id = claim.nexus_summary_id
+    RETURNING ns.nexus_summary_id, ns.nexus_tags_id, ns.condition_ids, ns.attempts
+""")
+
+_summaries = NexusSummary.__table__
+
+# Write-back of one outcome, guarded by the lease so a taken-over row is left alone
+_RELEASE_SQL = (
+    _summaries.update()
+    .where(_summaries.c.nexus_summary_id == bindparam("_nexus_summary_id"),
+           _summaries.c.claimed_by == bindparam("_claimed_by"))
+    .values(claimed_at=None, claimed_by=None)
+)
+_FAILED_SQL = _RELEASE_SQL.values(
+    next_attempt_at=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, bindparam("_retry_seconds"))
+)
+
+# Current conditions behind each claimed nexus tag, in one query for the batch
+_CONDITIONS_SQL = text("""
+    SELECT nt.nexus_tags_id, t.disability_name,
+           c.condition_id, c.condition_name, c.date_of_visit, c.in_service,
+           c.findings, c.treatments, c.comments
+    FROM nexus_tags AS nt
+    JOIN tags AS t ON t.tag_id = nt.tag_id
+    JOIN condition_tags AS ct ON ct.tag_id = nt.tag_id
+    JOIN conditions AS c ON c.condition_id = ct.condition_id AND c.user_id = nt.user_id
+    WHERE nt.nexus_tags_id = ANY(:nexus_tags_ids)
+    ORDER BY nt.nexus_tags_id, c.date_of_visit NULLS LAST, c.condition_id
+""")
+
+SYSTEM_PROMPT = (
+    "You summarize medical evidence for a veteran's disability claim. Given the records linked to "
+    "one claimed disability, write a concise summary (at most 200 words) of the evidence for a "
+    "nexus between the condition and military service: in-service events or treatment, current "
+    "diagnosis and continuity of symptoms. Cite visit dates. Do not speculate beyond the records."
+)
+
+_llm_rate_limiter = RateLimiter(Config.NEXUS_WORKER_REQUESTS_PER_MINUTE)
+_stop = threading.Event()
+
+###############################################################################
+# 1. SUMMARIES
+###############################################################################
+
+def _format_condition(condition):
+    parts = [f"- {condition['condition_name']}"]
+    if condition["date_of_visit"]:
+        parts.append(f"(visit {condition['date_of_visit'].isoformat()})")
+    if condition["in_service"]:
+        parts.append("[in service]")
+    line = " ".join(parts)
+    for label in ("findings", "treatments", "comments"):
+        if condition[label]:
+            line += f"\n  {label.capitalize()}: {condition[label]}"
+    return line
+
+
+def build_summary(disability_name, conditions):
+    """Ask the LLM for a nexus summary of the given conditions."""
+    records = "\n".join(_format_condition(condition) for condition in conditions)
+    _llm_rate_limiter.acquire()
+    response = create_chat_completion(
+        call_type="nexus_summary",
+        model=Config.NEXUS_SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Claimed disability: {disability_name}\n\nRecords:\n{records}"}
+        ]
+    )
+    return response.choices[0].message.content.strip()
+
+###############################################################################
+# 2. BATCHES
+###############################################################################
+
+def _load_conditions(nexus_tags_ids):
+    """Return {nexus_tags_id: (disability name, [condition dicts])}."""
+    grouped = {}
+    rows = ScopedSession.execute(_CONDITIONS_SQL, {"nexus_tags_ids": list(nexus_tags_ids)}).mappings()
+    for row in rows:
+        entry = grouped.setdefault(row["nexus_tags_id"], (row["disability_name"], []))
+        entry[1].append(dict(row))
+    return grouped
+
+
+def _claim_token():
+    """Identifies one batch's lease (host and pid, for operators, plus a unique suffix)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def retry_delay(attempts):
+    """Seconds before a row that failed `attempts` times is claimed again."""
+    return min(Config.NEXUS_WORKER_RETRY_MAX_SECONDS, Config.NEXUS_WORKER_RETRY_BASE_SECONDS * (2 ** (attempts - 1)))
+
+
+def claim_batch(batch_size, claimed_by):
+    """Lease up to `batch_size` stale rows to `claimed_by` and commit."""
+    try:
+        claimed = ScopedSession.execute(_CLAIM_SQL, {
+            "batch_size": batch_size,
+            "claimed_by": claimed_by,
+            "max_attempts": Config.NEXUS_WORKER_MAX_ATTEMPTS,
+            "lease_seconds": Config.NEXUS_WORKER_LEASE_SECONDS
+        }).mappings().all()
+        ScopedSession.commit()
+        return claimed
+    except Exception:
+        ScopedSession.rollback()
+        raise
+
+
+def process_batch(executor, batch_size=None):
+    """
+    Claim and recompute one batch of stale summaries.
+    Returns the number of rows completed (0 when the queue is empty or every row failed).
+    """
+    batch_size = batch_size or Config.NEXUS_WORKER_BATCH_SIZE
+    claimed_by = _claim_token()
+    claimed = claim_batch(batch_size, claimed_by)
+    if not claimed:
+        return 0
+
+    try:
+        conditions_by_tag = _load_conditions({row["nexus_tags_id"] for row in claimed})
+        now = datetime.utcnow()
+        completed = {"needs_update": False, "attempts": 0, "next_attempt_at": None, "updated_at": now}
+        unchanged, to_rebuild = [], []
+        for row in claimed:
+            disability_name, conditions = conditions_by_tag.get(row["nexus_tags_id"], (None, []))
+            condition_ids = sorted(condition["condition_id"] for condition in conditions)
+            if condition_ids == sorted(row["condition_ids"] or []):
+                unchanged.append({"_nexus_summary_id": row["nexus_summary_id"], **completed})
+            elif not conditions:
+                unchanged.append({"_nexus_summary_id": row["nexus_summary_id"], "summary_text": None,
+                                  "condition_ids": [], **completed})
+            else:
+                to_rebuild.append((row["nexus_summary_id"], row["attempts"], disability_name, conditions, condition_ids))
+        # Close the read transaction so no connection sits idle in a transaction during the LLM calls
+        ScopedSession.commit()
+
+        futures = {
+            executor.submit(build_summary, disability_name, conditions): (summary_id, attempts, condition_ids)
+            for summary_id, attempts, disability_name, conditions, condition_ids in to_rebuild
+        }
+        rebuilt, failed = [], []
+        for future, (summary_id, attempts, condition_ids) in futures.items():
+            try:
+                rebuilt.append({"_nexus_summary_id": summary_id, "summary_text": future.result(),
+                                "condition_ids": condition_ids, **completed})
+            except Exception as e:
+                if attempts >= Config.NEXUS_WORKER_MAX_ATTEMPTS:
+                    logger.error("nexus_summary_abandoned", nexus_summary_id=summary_id, attempts=attempts, error=str(e))
+                else:
+                    logger.warning("nexus_summary_failed", nexus_summary_id=summary_id, attempts=attempts, error=str(e))
+                failed.append({"_nexus_summary_id": summary_id, "_retry_seconds": retry_delay(attempts),
+                               "updated_at": now})
+
+        # Bulk UPDATE of the rows still leased to this batch, one executemany per set of updated columns
+        groups = {}
+        for values in unchanged + rebuilt:
+            groups.setdefault(tuple(sorted(values)), []).append({**values, "_claimed_by": claimed_by})
+        with DB_WRITE_LATENCY.labels(operation="nexus_summaries").time():
+            for group in groups.values():
+                ScopedSession.execute(_RELEASE_SQL, group)
+            if failed:
+                ScopedSession.execute(_FAILED_SQL, [{**values, "_claimed_by": claimed_by} for values in failed])
+            ScopedSession.commit()
+
+        logger.info("nexus_batch_completed", claimed=len(claimed), unchanged=len(unchanged),
+                    rebuilt=len(rebuilt), failed=len(failed))
+        return len(unchanged) + len(rebuilt)
+    except Exception:
+        ScopedSession.rollback()
+        raise
+
+###############################################################################
+# 3. WORKER LOOP
+###############################################################################
+
+def stop_worker():
+    """Ask run_worker() to exit after the current batch."""
+    _stop.set()
+
+
+def run_worker(batch_size=None, poll_interval=None, once=False):
+    """Drain the queue, then poll for newly flagged rows until stopped."""
+    poll_interval = Config.NEXUS_WORKER_POLL_SECONDS if poll_interval is None else poll_interval
+    logger.info("nexus_worker_started", batch_size=batch_size or Config.NEXUS_WORKER_BATCH_SIZE,
+                concurrency=Config.NEXUS_WORKER_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=Config.NEXUS_WORKER_CONCURRENCY, thread_name_prefix="nexus") as executor:
+        while not _stop.is_set():
+            try:
+                completed = process_batch(executor, batch_size)
+            except Exception as e:
+                logger.exception("nexus_batch_failed", error=str(e))
+                completed = 0
+            finally:
+                ScopedSession.remove()
+            if completed:
+                continue
+            if once:
+                break
+            # Jitter keeps idle workers from polling in lockstep
+            _stop.wait(poll_interval * random.uniform(0.8, 1.2))
+    logger.info("nexus_worker_stopped")
@@ -0,0 +1,124 @@
+# server/services/tagging_service.py
+
+"""
+Tagging Service
+---------------
+Matches conditions to their nearest disability Tags by embedding similarity.
+
+A whole batch of conditions is matched in one SQL round trip: a LATERAL
+top-k query per condition, each served by the halfvec HNSW index on
+tags.embeddings (migrations/001_halfvec_hnsw_indexes.sql). The ORDER BY
+expression must stay identical to the indexed expression for the index to be
+used. `hnsw.ef_search` trades recall for speed and is set for the current
+transaction only (set_config(..., is_local => true)), in its own execute:
+psycopg 3 does not run several statements with bound parameters at once.
+"""
+
+# Import necessary libraries
+import time
+from sqlalchemy import text
+from config import Config
+from database.session import ScopedSession
+from helpers.metrics import DB_WRITE_LATENCY
+from helpers.log_helpers import get_logger
+
+logger = get_logger("tagging")
+
+_EF_SEARCH_SQL = text("SELECT set_config('hnsw.ef_search', :ef_search, true)")
+
+# Nearest tags per condition, in one statement for the whole batch
+_MATCH_SQL = """
+    SELECT ce.condition_id, m.tag_id, m.code, m.disability_name, m.distance
+    FROM condition_embeddings AS ce
+    CROSS JOIN LATERAL (
+        SELECT t.tag_id, t.code, t.disability_name,
+               t.embeddings::halfvec(3072) <=> ce.embedding::halfvec(3072) AS distance
+        FROM tags AS t
+        WHERE t.embeddings IS NOT NULL
+        ORDER BY t.embeddings::halfvec(3072) <=> ce.embedding::halfvec(3072)
+        LIMIT :top_k
+    ) AS m
+    WHERE ce.condition_id = ANY(:condition_ids)
+      AND ce.embedding IS NOT NULL
+      AND (CAST(:max_distance AS double precision) IS NULL OR m.distance <= :max_distance)
+"""
+
+
+def _set_ef_search(ef_search):
+    """Set hnsw.ef_search for the session's current transaction; it ends with the transaction."""
+    ef_search = int(ef_search or Config.TAG_MATCH_EF_SEARCH)
+    ScopedSession.execute(_EF_SEARCH_SQL, {"ef_search": str(ef_search)})
+
+
+def _batches(condition_ids, batch_size):
+    condition_ids = list(dict.fromkeys(condition_ids))
+    for start in range(0, len(condition_ids), batch_size):
+        yield condition_ids[start:start + batch_size]
+
+
+def match_conditions_to_tags(condition_ids, top_k=None, ef_search=None, max_distance=None):
+    """
+    Return {condition_id: [{"tag_id", "code", "disability_name", "distance"}, ...]}
+    with each condition's nearest tags by cosine distance, closest first.
+    Conditions without an embedding are left out.
+    """
+    top_k = top_k or Config.TAG_MATCH_TOP_K
+    max_distance = Config.TAG_MATCH_MAX_DISTANCE if max_distance is None else max_distance
+    statement = text(_MATCH_SQL + " ORDER BY ce.condition_id, m.distance")
+
+    matches = {}
+    start = time.perf_counter()
+    _set_ef_search(ef_search)
+    for batch in _batches(condition_ids, Config.TAG_MATCH_BATCH_SIZE):
+        rows = ScopedSession.execute(statement, {
+            "condition_ids": batch,
+            "top_k": top_k,
+            "max_distance": max_distance
+        }).fetchall()
+        for row in rows:
+            matches.setdefault(row.condition_id, []).append({
+                "tag_id": row.tag_id,
+                "code": row.code,
+                "disability_name": row.disability_name,
+                "distance": float(row.distance)
+            })
+
+    logger.info("conditions_matched", conditions=len(condition_ids), matched=len(matches),
+                duration_ms=round((time.perf_counter() - start) * 1000, 1))
+    return matches
+
+
+def assign_nearest_tags(condition_ids, top_k=1, ef_search=None, max_distance=None):
+    """
+    Link each condition to its nearest tag(s) in condition_tags, matching and
+    inserting in one statement per batch. Existing links are kept.
+    Returns the number of links created.
+    """
+    max_distance = Config.TAG_MATCH_MAX_DISTANCE if max_distance is None else max_distance
+    statement = text(f"""
+        WITH matches AS ({_MATCH_SQL})
+        INSERT INTO condition_tags (condition_id, tag_id)
+        SELECT condition_id, tag_id FROM matches
+        ON CONFLICT DO NOTHING
+        RETURNING condition_id
+    """)
+
+    created = 0
+    try:
+        with DB_WRITE_LATENCY.labels(operation="condition_tags").time():
+            _set_ef_search(ef_search)
+            for batch in _batches(condition_ids, Config.TAG_MATCH_BATCH_SIZE):
+                result = ScopedSession.execute(statement, {
+                    "condition_ids": batch,
+                    "top_k": top_k,
+                    "max_distance": max_distance
+                })
+                created += len(result.fetchall())
+            ScopedSession.commit()
+    except Exception as e:
+        ScopedSession.rollback()
+        logger.exception("assign_nearest_tags_failed", conditions=len(condition_ids), error=str(e))
+        raise
+
+    logger.info("condition_tags_assigned", conditions=len(condition_ids), created=created)
+    return created